@@ -0,0 +1,89 @@
+"""webhook inbox: processing state on webhook_events
+
+Revision ID: 0002_webhook_inbox
+Revises: 0001_create_core
+Create Date: 2026-10-17 09:00:00
+
+refunds, webhook_events and refund_requests were only ever created by
+init_db()'s create_all, so create them here when missing before adding the
+inbox columns.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_webhook_inbox'
+down_revision = '0001_create_core'
+
+def _tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+def upgrade() -> None:
+    tables = _tables()
+
+    if 'refunds' not in tables:
+        op.create_table('refunds',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('tx_id', sa.Integer(), sa.ForeignKey('transactions.id'), nullable=False),
+            sa.Column('amount_cents', sa.Integer(), nullable=False),
+            sa.Column('currency', sa.String(length=3), nullable=False, server_default='USD'),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='requested'),
+            sa.Column('psp_reference', sa.String(length=64)),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+        )
+        op.create_index('ix_refunds_id', 'refunds', ['id'], unique=False)
+        op.create_index('ix_refunds_tx_id', 'refunds', ['tx_id'], unique=False)
+
+    if 'refund_requests' not in tables:
+        op.create_table('refund_requests',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('transaction_id', sa.Integer(), sa.ForeignKey('transactions.id'), nullable=False),
+            sa.Column('amount_cents', sa.Integer(), nullable=False),
+            sa.Column('currency', sa.String(length=10), nullable=False, server_default='USD'),
+            sa.Column('requested_by', sa.String(length=64), nullable=False, server_default='admin'),
+            sa.Column('status', sa.String(length=32), nullable=False, server_default='refund_requested'),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+        )
+        op.create_index('ix_refund_requests_id', 'refund_requests', ['id'], unique=False)
+        op.create_index('ix_refund_requests_transaction_id', 'refund_requests', ['transaction_id'], unique=False)
+
+    if 'webhook_events' not in tables:
+        op.create_table('webhook_events',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('provider', sa.String(length=50), nullable=False),
+            sa.Column('event_key', sa.String(length=256), nullable=False, unique=True),
+            sa.Column('signature', sa.String(length=128)),
+            sa.Column('raw_json', sa.Text(), nullable=False),
+            sa.Column('headers', sa.Text()),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+        )
+        op.create_index('ix_webhook_events_id', 'webhook_events', ['id'], unique=False)
+
+    # Existing rows were already applied inline by the old endpoint -> "processed"
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='processed'))
+        batch.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+        batch.add_column(sa.Column('last_error', sa.Text()))
+        batch.add_column(sa.Column('claim_token', sa.String(length=32)))
+        batch.add_column(sa.Column('claimed_at', sa.DateTime(timezone=True)))
+        batch.add_column(sa.Column('processed_at', sa.DateTime(timezone=True)))
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.alter_column('status', server_default='pending')
+
+    op.create_index('ix_webhook_events_status_id', 'webhook_events', ['status', 'id'], unique=False)
+    op.create_index('ix_webhook_events_claim_token', 'webhook_events', ['claim_token'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_events_claim_token', table_name='webhook_events')
+    op.drop_index('ix_webhook_events_status_id', table_name='webhook_events')
+    with op.batch_alter_table('webhook_events') as batch:
+        for name in ('processed_at', 'claimed_at', 'claim_token', 'last_error', 'attempts', 'status'):
+            batch.drop_column(name)
+
+    # The tables may well predate this revision (create_all) and hold data, so
+    # they only go when empty; that also lets 0001's downgrade drop
+    # transactions, which refunds and refund_requests reference. Drop
+    # non-empty ones by hand before going below 0001.
+    bind = op.get_bind()
+    for name in ('webhook_events', 'refund_requests', 'refunds'):
+        if bind.execute(sa.text(f'SELECT 1 FROM {name} LIMIT 1')).first() is None:
+            op.drop_table(name)
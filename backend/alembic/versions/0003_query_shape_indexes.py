@@ -0,0 +1,37 @@
+"""composite indexes for admin filters, export and webhook refund lookup
+
+Revision ID: 0003_query_shape_indexes
+Revises: 0002_webhook_inbox
+Create Date: 2026-10-17 10:00:00
+
+The (merchant_id, id) and (tx_id, id) composites replace the old single
+column indexes, which are their prefixes.
+"""
+from alembic import op
+
+revision = '0003_query_shape_indexes'
+down_revision = '0002_webhook_inbox'
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_merchant_id_id', 'transactions', ['merchant_id', 'id'], unique=False)
+    op.create_index('ix_transactions_status_id', 'transactions', ['status', 'id'], unique=False)
+    op.create_index('ix_transactions_merchant_id_status_id', 'transactions', ['merchant_id', 'status', 'id'], unique=False)
+    op.create_index('ix_transactions_status_created_at', 'transactions', ['status', 'created_at'], unique=False)
+    op.create_index('ix_transactions_created_at', 'transactions', ['created_at'], unique=False)
+    op.create_index('ix_transactions_psp_reference', 'transactions', ['psp_reference'], unique=False)
+    op.drop_index('ix_transactions_merchant_id', table_name='transactions')
+
+    op.create_index('ix_refunds_tx_id_id', 'refunds', ['tx_id', 'id'], unique=False)
+    op.drop_index('ix_refunds_tx_id', table_name='refunds')
+
+def downgrade() -> None:
+    op.create_index('ix_refunds_tx_id', 'refunds', ['tx_id'], unique=False)
+    op.drop_index('ix_refunds_tx_id_id', table_name='refunds')
+
+    op.create_index('ix_transactions_merchant_id', 'transactions', ['merchant_id'], unique=False)
+    op.drop_index('ix_transactions_psp_reference', table_name='transactions')
+    op.drop_index('ix_transactions_created_at', table_name='transactions')
+    op.drop_index('ix_transactions_status_created_at', table_name='transactions')
+    op.drop_index('ix_transactions_merchant_id_status_id', table_name='transactions')
+    op.drop_index('ix_transactions_status_id', table_name='transactions')
+    op.drop_index('ix_transactions_merchant_id_id', table_name='transactions')
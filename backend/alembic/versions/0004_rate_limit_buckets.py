@@ -0,0 +1,23 @@
+"""rate_limit_buckets table for the shared (db) rate limiter backend
+
+Revision ID: 0004_rate_limit_buckets
+Revises: 0003_query_shape_indexes
+Create Date: 2026-10-17 11:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_rate_limit_buckets'
+down_revision = '0003_query_shape_indexes'
+
+def upgrade() -> None:
+    op.create_table('rate_limit_buckets',
+        sa.Column('key', sa.String(length=200), primary_key=True),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False)
+    )
+    op.create_index('ix_rate_limit_buckets_updated_at', 'rate_limit_buckets', ['updated_at'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_buckets_updated_at', table_name='rate_limit_buckets')
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,34 @@
+"""merchant_daily_stats rollup, backfilled from transactions
+
+Revision ID: 0005_merchant_daily_stats
+Revises: 0004_rate_limit_buckets
+Create Date: 2026-10-17 13:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_merchant_daily_stats'
+down_revision = '0004_rate_limit_buckets'
+
+def upgrade() -> None:
+    op.create_table('merchant_daily_stats',
+        sa.Column('merchant_id', sa.Integer(), sa.ForeignKey('merchants.id'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('currency', sa.String(length=3), primary_key=True),
+        sa.Column('status', sa.String(length=30), primary_key=True),
+        sa.Column('tx_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('amount_cents', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_merchant_daily_stats_day', 'merchant_daily_stats', ['day'], unique=False)
+    # same grouping as app.services.daily_stats.rebuild()
+    op.execute(
+        "INSERT INTO merchant_daily_stats (merchant_id, day, currency, status, tx_count, amount_cents) "
+        "SELECT merchant_id, date(created_at), coalesce(currency, 'USD'), coalesce(status, 'created'), "
+        "count(*), coalesce(sum(amount_cents), 0) "
+        "FROM transactions "
+        "GROUP BY merchant_id, date(created_at), coalesce(currency, 'USD'), coalesce(status, 'created')"
+    )
+
+def downgrade() -> None:
+    op.drop_index('ix_merchant_daily_stats_day', table_name='merchant_daily_stats')
+    op.drop_table('merchant_daily_stats')
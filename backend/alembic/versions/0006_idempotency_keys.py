@@ -0,0 +1,29 @@
+"""idempotency_keys table for Idempotency-Key response replay
+
+Revision ID: 0006_idempotency_keys
+Revises: 0005_merchant_daily_stats
+Create Date: 2026-10-18 09:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_idempotency_keys'
+down_revision = '0005_merchant_daily_stats'
+
+def upgrade() -> None:
+    op.create_table('idempotency_keys',
+        sa.Column('scope', sa.String(length=100), primary_key=True),
+        sa.Column('key', sa.String(length=255), primary_key=True),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.Text(), nullable=True),
+        sa.Column('locked_at', sa.Float(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,44 @@
+"""webhook_events: compressed raw_body + raw_encoding, raw_json becomes legacy/nullable
+
+Revision ID: 0007_webhook_body_compression
+Revises: 0006_idempotency_keys
+Create Date: 2026-10-18 11:00:00
+
+Existing rows keep their text in raw_json; `python scripts/purge_webhook_events.py
+--compress-legacy` moves them into raw_body in small batches.
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_webhook_body_compression'
+down_revision = '0006_idempotency_keys'
+
+def upgrade() -> None:
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.add_column(sa.Column('raw_body', sa.LargeBinary()))
+        batch.add_column(sa.Column('raw_encoding', sa.String(length=10)))
+        batch.alter_column('raw_json', existing_type=sa.Text(), nullable=True)
+
+def downgrade() -> None:
+    # put compressed bodies back into raw_json before it becomes NOT NULL again
+    conn = op.get_bind()
+    events = sa.table('webhook_events', sa.column('id', sa.Integer), sa.column('raw_json', sa.Text),
+                      sa.column('raw_body', sa.LargeBinary), sa.column('raw_encoding', sa.String))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(events.c.id, events.c.raw_body, events.c.raw_encoding)
+            .where(events.c.raw_body.is_not(None), events.c.id > last_id).order_by(events.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        for id_, body, encoding in rows:
+            raw = zlib.decompress(body) if encoding == 'zlib' else bytes(body)
+            conn.execute(events.update().where(events.c.id == id_).values(raw_json=raw.decode('utf-8', 'ignore')))
+        last_id = rows[-1][0]
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.alter_column('raw_json', existing_type=sa.Text(), nullable=False)
+        batch.drop_column('raw_encoding')
+        batch.drop_column('raw_body')
@@ -0,0 +1,20 @@
+"""transactions.version for conditional status transitions
+
+Revision ID: 0008_transaction_version
+Revises: 0007_webhook_body_compression
+Create Date: 2026-10-18 14:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_transaction_version'
+down_revision = '0007_webhook_body_compression'
+
+def upgrade() -> None:
+    # constant server default: no table rewrite on Postgres 11+
+    with op.batch_alter_table('transactions') as batch:
+        batch.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+def downgrade() -> None:
+    with op.batch_alter_table('transactions') as batch:
+        batch.drop_column('version')
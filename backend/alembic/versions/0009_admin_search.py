@@ -0,0 +1,91 @@
+"""search indexes on psp_reference, merchant name and email
+
+Revision ID: 0009_admin_search
+Revises: 0008_transaction_version
+Create Date: 2026-10-18 16:00:00
+
+SQLite: external-content FTS5 trigram tables + sync triggers, backfilled.
+Postgres: lower(col) text_pattern_ops btrees for prefixes, and GIN trigram
+indexes when pg_trgm can be installed (trusted extension since PG 13, so the
+database owner can create it). Built CONCURRENTLY: transactions is big.
+Same objects as app.services.search.install().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009_admin_search'
+down_revision = '0008_transaction_version'
+
+SQLITE = [
+    "CREATE VIRTUAL TABLE transactions_search USING fts5("
+    "psp_reference, content='transactions', content_rowid='id', tokenize='trigram', columnsize=0)",
+    "CREATE TRIGGER transactions_search_ai AFTER INSERT ON transactions "
+    "WHEN new.psp_reference IS NOT NULL BEGIN "
+    "INSERT INTO transactions_search(rowid, psp_reference) VALUES (new.id, new.psp_reference); END",
+    "CREATE TRIGGER transactions_search_ad AFTER DELETE ON transactions "
+    "WHEN old.psp_reference IS NOT NULL BEGIN "
+    "INSERT INTO transactions_search(transactions_search, rowid, psp_reference) VALUES ('delete', old.id, old.psp_reference); END",
+    "CREATE TRIGGER transactions_search_au AFTER UPDATE OF psp_reference ON transactions "
+    "WHEN old.psp_reference IS NOT new.psp_reference BEGIN "
+    "INSERT INTO transactions_search(transactions_search, rowid, psp_reference) "
+    "SELECT 'delete', old.id, old.psp_reference WHERE old.psp_reference IS NOT NULL; "
+    "INSERT INTO transactions_search(rowid, psp_reference) "
+    "SELECT new.id, new.psp_reference WHERE new.psp_reference IS NOT NULL; END",
+    "INSERT INTO transactions_search(rowid, psp_reference) "
+    "SELECT id, psp_reference FROM transactions WHERE psp_reference IS NOT NULL",
+    "CREATE VIRTUAL TABLE merchants_search USING fts5("
+    "name, email, content='merchants', content_rowid='id', tokenize='trigram', columnsize=0)",
+    "CREATE TRIGGER merchants_search_ai AFTER INSERT ON merchants BEGIN "
+    "INSERT INTO merchants_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER merchants_search_ad AFTER DELETE ON merchants BEGIN "
+    "INSERT INTO merchants_search(merchants_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER merchants_search_au AFTER UPDATE OF name, email ON merchants BEGIN "
+    "INSERT INTO merchants_search(merchants_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO merchants_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "INSERT INTO merchants_search(rowid, name, email) SELECT id, name, email FROM merchants",
+]
+
+# (name, table, expression)
+PREFIX = [
+    ('ix_transactions_psp_reference_prefix', 'transactions', 'lower(psp_reference) text_pattern_ops'),
+    ('ix_merchants_name_prefix', 'merchants', 'lower(name) text_pattern_ops'),
+    ('ix_merchants_email_prefix', 'merchants', 'lower(email) text_pattern_ops'),
+]
+TRGM = [
+    ('ix_transactions_psp_reference_trgm', 'transactions', 'lower(psp_reference) gin_trgm_ops'),
+    ('ix_merchants_name_trgm', 'merchants', 'lower(name) gin_trgm_ops'),
+    ('ix_merchants_email_trgm', 'merchants', 'lower(email) gin_trgm_ops'),
+]
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for stmt in SQLITE:
+            op.execute(stmt)
+        return
+    if bind.dialect.name != 'postgresql':
+        return
+
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if available:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for name, table, expr in PREFIX + (TRGM if available else []):
+            using = ' USING gin' if expr.endswith('gin_trgm_ops') else ''
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}{using} ({expr})")
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('transactions_search_ai', 'transactions_search_ad', 'transactions_search_au',
+                        'merchants_search_ai', 'merchants_search_ad', 'merchants_search_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS transactions_search")
+        op.execute("DROP TABLE IF EXISTS merchants_search")
+        return
+    if bind.dialect.name != 'postgresql':
+        return
+    # pg_trgm stays installed, other things may use it
+    with op.get_context().autocommit_block():
+        for name, _, _ in PREFIX + TRGM:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
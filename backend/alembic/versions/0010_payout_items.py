@@ -0,0 +1,46 @@
+"""payout_items and payout run ids for the payout job
+
+Revision ID: 0010_payout_items
+Revises: 0009_admin_search
+Create Date: 2026-10-18 18:00:00
+
+Also brings payouts in line with the model: 0001 named the column
+scheduled_for (models.Payout has always said scheduled_at), and
+amount_cents goes to BIGINT since one payout sums many transactions.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0010_payout_items'
+down_revision = '0009_admin_search'
+
+def _columns(table):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+def upgrade() -> None:
+    rename = 'scheduled_for' in _columns('payouts')
+    with op.batch_alter_table('payouts') as batch:
+        if rename:
+            batch.alter_column('scheduled_for', new_column_name='scheduled_at')
+        batch.alter_column('amount_cents', type_=sa.BigInteger(), existing_nullable=False)
+        batch.add_column(sa.Column('run_id', sa.String(length=32), nullable=True))
+    op.create_index('ix_payouts_run_id_merchant_id_currency', 'payouts',
+                    ['run_id', 'merchant_id', 'currency'], unique=True)
+
+    op.create_table('payout_items',
+        # no FK to transactions, see models.PayoutItem
+        sa.Column('transaction_id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(length=10), primary_key=True),
+        sa.Column('payout_id', sa.Integer(), sa.ForeignKey('payouts.id'), nullable=False),
+        sa.Column('amount_cents', sa.BigInteger(), nullable=False),
+    )
+    op.create_index('ix_payout_items_payout_id', 'payout_items', ['payout_id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_payout_items_payout_id', table_name='payout_items')
+    op.drop_table('payout_items')
+    op.drop_index('ix_payouts_run_id_merchant_id_currency', table_name='payouts')
+    with op.batch_alter_table('payouts') as batch:
+        batch.drop_column('run_id')
+        batch.alter_column('amount_cents', type_=sa.Integer(), existing_nullable=False)
+        batch.alter_column('scheduled_at', new_column_name='scheduled_for')
@@ -0,0 +1,23 @@
+"""webhook_events.tx_id so workers apply a transaction's events in order
+
+Revision ID: 0011_webhook_event_tx_id
+Revises: 0010_payout_items
+Create Date: 2026-10-18 19:00:00
+
+Rows stored before this revision keep tx_id NULL and are claimed as before.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0011_webhook_event_tx_id'
+down_revision = '0010_payout_items'
+
+def upgrade() -> None:
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.add_column(sa.Column('tx_id', sa.Integer(), nullable=True))
+    op.create_index('ix_webhook_events_tx_id_id', 'webhook_events', ['tx_id', 'id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_events_tx_id_id', table_name='webhook_events')
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.drop_column('tx_id')
@@ -0,0 +1,19 @@
+"""webhook_events.next_attempt_at: exponential backoff between retries
+
+Revision ID: 0012_webhook_retry_backoff
+Revises: 0011_webhook_event_tx_id
+Create Date: 2026-10-18 19:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0012_webhook_retry_backoff'
+down_revision = '0011_webhook_event_tx_id'
+
+def upgrade() -> None:
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.add_column(sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+
+def downgrade() -> None:
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.drop_column('next_attempt_at')
@@ -0,0 +1,36 @@
+"""webhook_event_txs: order every transaction a notification names, not just the first
+
+Revision ID: 0013_webhook_event_txs
+Revises: 0012_webhook_retry_backoff
+Create Date: 2026-10-18 20:00:00
+
+Replaces webhook_events.tx_id (0011), which only held the first item's
+transaction. Existing rows are carried over with that one transaction.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0013_webhook_event_txs'
+down_revision = '0012_webhook_retry_backoff'
+
+def upgrade() -> None:
+    op.create_table('webhook_event_txs',
+        sa.Column('tx_id', sa.Integer(), primary_key=True),
+        sa.Column('event_id', sa.Integer(), sa.ForeignKey('webhook_events.id'), primary_key=True),
+    )
+    op.create_index('ix_webhook_event_txs_event_id', 'webhook_event_txs', ['event_id'], unique=False)
+    op.execute("INSERT INTO webhook_event_txs (tx_id, event_id) SELECT tx_id, id FROM webhook_events WHERE tx_id IS NOT NULL")
+    op.drop_index('ix_webhook_events_tx_id_id', table_name='webhook_events')
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.drop_column('tx_id')
+
+def downgrade() -> None:
+    with op.batch_alter_table('webhook_events') as batch:
+        batch.add_column(sa.Column('tx_id', sa.Integer(), nullable=True))
+    op.create_index('ix_webhook_events_tx_id_id', 'webhook_events', ['tx_id', 'id'], unique=False)
+    op.execute(
+        "UPDATE webhook_events SET tx_id = "
+        "(SELECT min(tx_id) FROM webhook_event_txs WHERE event_id = webhook_events.id)"
+    )
+    op.drop_index('ix_webhook_event_txs_event_id', table_name='webhook_event_txs')
+    op.drop_table('webhook_event_txs')
@@ -0,0 +1,27 @@
+"""payouts.carried_into: negative balances carried to the next payout
+
+Revision ID: 0014_payout_carried_into
+Revises: 0013_webhook_event_txs
+Create Date: 2026-10-18 21:00:00
+
+A run where a merchant's refunds outweigh its captures now records a
+"carried" payout (amount <= 0) instead of leaving the lines unpaid; the
+next payout for that merchant and currency points it here.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0014_payout_carried_into'
+down_revision = '0013_webhook_event_txs'
+
+def upgrade() -> None:
+    with op.batch_alter_table('payouts') as batch:
+        batch.add_column(sa.Column('carried_into', sa.Integer(), nullable=True))
+        batch.create_foreign_key('fk_payouts_carried_into', 'payouts', ['carried_into'], ['id'])
+    op.create_index('ix_payouts_carried_into', 'payouts', ['carried_into'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_payouts_carried_into', table_name='payouts')
+    with op.batch_alter_table('payouts') as batch:
+        batch.drop_constraint('fk_payouts_carried_into', type_='foreignkey')
+        batch.drop_column('carried_into')
@@ -2,22 +2,29 @@ from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from pathlib import Path
-from fastapi.templating import Jinja2Templates
+from .templating import templates
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime, timedelta
 import csv
 import io
+import zlib
+from urllib.parse import urlencode
 from fastapi import Form
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 
 from .security import require_admin, rate_limit_admin, check_admin_ip
-from .db import SessionLocal
+from .config import settings
+from .db import SessionLocal, get_db
+from .db_replica import get_read_db, read_sessionmaker, replica_router
+from .db_pool import pool_stats
+from .services import daily_stats, search as admin_search, transitions
+from .services.count_cache import transaction_counts
+from .services.merchant_cache import merchant_cache
+from .pagination import decode_cursor, encode_cursor, finish_page, keyset_query
 from . import models
 
-TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "templates"  # -> backend/templates
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 router = APIRouter(
     prefix="/admin",
@@ -28,19 +35,42 @@ router = APIRouter(
 
 
 
-def get_db():
-    db = SessionLocal()
+# Parse dates safely (YYYY-MM-DD). If invalid, ignore.
+def parse_day(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
     try:
-        yield db
-    finally:
-        db.close()
+        return datetime.strptime(s, "%Y-%m-%d")
+    except Exception:
+        return None
+
+def filter_transactions(q, status=None, merchant_id=None, start=None, end=None):
+    """WHERE clause shared by the dashboard table and the CSV export.
+
+    Works on a Query or a select(). `end` is a day and is inclusive.
+    The composite indexes on transactions (see models.Transaction) are
+    built for exactly these filters + ORDER BY id DESC.
+    """
+    T = models.Transaction
+    if status:
+        q = q.where(T.status == status)
+    if merchant_id:
+        q = q.where(T.merchant_id == merchant_id)
+    if start:
+        q = q.where(T.created_at >= start)
+    if end:
+        # make end date inclusive by adding 1 day and using "<"
+        q = q.where(T.created_at < (end + timedelta(days=1)))
+    return q
+
+STATS_WINDOW_DAYS = 30
 
 @router.get("/", response_class=HTMLResponse, dependencies=[Depends(require_admin)])
-def admin_home(request: Request, db: Session = Depends(get_db)):
+def admin_home(request: Request, db: Session = Depends(get_read_db)):
     # merchants list (unchanged)
     merchants = db.query(models.Merchant).order_by(models.Merchant.id.desc()).all()
 
-    # ---- NEW: pagination + filters ----
+    # ---- pagination (keyset cursors) + filters ----
     per_page = 10
 
     # read query params
@@ -52,60 +82,78 @@ def admin_home(request: Request, db: Session = Depends(get_db)):
     except Exception:
         page = 1
 
+    # ?after=<cursor> -> older page, ?before=<cursor> -> newer page
+    try:
+        after = decode_cursor(qp.get("after"))
+        before = decode_cursor(qp.get("before"))
+    except ValueError:
+        after = before = None
+    if after is None and before is None:
+        page = 1
+
     status = qp.get("status") or None
     merchant_id = qp.get("merchant_id") or None
     from_str = qp.get("from") or None
     to_str = qp.get("to") or None
 
-    q = db.query(models.Transaction)
-
-    if status:
-        q = q.filter(models.Transaction.status == status)
-
-    if merchant_id:
-        try:
-            mid = int(merchant_id)
-            q = q.filter(models.Transaction.merchant_id == mid)
-        except Exception:
-            pass
+    try:
+        mid = int(merchant_id) if merchant_id else None
+    except Exception:
+        mid = None
 
     # date range filtering by created_at
     # from = inclusive midnight; to = inclusive to end-of-day
-    if from_str:
-        try:
-            start = datetime.strptime(from_str, "%Y-%m-%d")
-            q = q.filter(models.Transaction.created_at >= start)
-        except Exception:
-            pass
-    if to_str:
-        try:
-            end = datetime.strptime(to_str, "%Y-%m-%d") + timedelta(days=1)
-            q = q.filter(models.Transaction.created_at < end)
-        except Exception:
-            pass
-
-    total = q.count()
-    pages = max(1, (total + per_page - 1) // per_page)
-    if page > pages:
+    where = dict(status=status, merchant_id=mid, start=parse_day(from_str), end=parse_day(to_str))
+    q = filter_transactions(db.query(models.Transaction), **where)
+
+    # cached / estimated (services/count_cache.py); pages is None past
+    # ADMIN_EXACT_COUNT_MAX, then only has_next says whether there's more
+    count = transaction_counts.get(db, where, lambda s: filter_transactions(s, **where))
+    pages = count.pages(per_page)
+    if pages is not None and page > pages:
         page = pages
 
-    txs = (
-        q.order_by(models.Transaction.id.desc())
-         .offset((page - 1) * per_page)
-         .limit(per_page)
-         .all()
+    txs, has_prev, has_next = finish_page(
+        keyset_query(q, models.Transaction.id, per_page, after=after, before=before).all(),
+        per_page, after=after, before=before,
     )
+    if not has_prev:
+        page = 1
+
+    # Prev/Next links keep the filters and carry the boundary ids as cursors
+    filters = {k: v for k, v in (("status", status), ("merchant_id", merchant_id), ("from", from_str), ("to", to_str)) if v}
+    prev_url = next_url = None
+    if has_prev and txs:
+        prev_url = "/admin/?" + urlencode({**filters, "page": page - 1, "before": encode_cursor(txs[0].id)})
+    if has_next and txs:
+        next_url = "/admin/?" + urlencode({**filters, "page": page + 1, "after": encode_cursor(txs[-1].id)})
+
+    # last-30-days widget: reads merchant_daily_stats only, never transactions
+    stats_end = datetime.utcnow().date()
+    stats_start = stats_end - timedelta(days=STATS_WINDOW_DAYS - 1)
+    stats = daily_stats.summarize(db.execute(daily_stats.stats_query(None, stats_start, stats_end)).all())
+    names = {m.id: m.name for m in merchants}
+    top_merchants = [
+        {"id": mid, "name": names.get(mid, f"#{mid}"), "currency": cur, "volume_cents": int(vol or 0), "approved": int(n or 0)}
+        for mid, cur, vol, n in db.execute(daily_stats.top_merchants_query(stats_start, stats_end)).all()
+    ]
 
     return templates.TemplateResponse(
         "admin/index.html",
         {
             "request": request,
             "merchants": merchants,
+            "stats_days": STATS_WINDOW_DAYS,
+            "stats_totals": stats["totals"],
+            "top_merchants": top_merchants,
             "txs": txs,
             "page": page,
             "pages": pages,
-            "has_prev": page > 1,
-            "has_next": page < pages,
+            "count": count,
+            "has_prev": bool(prev_url),
+            "has_next": bool(next_url),
+            "prev_url": prev_url,
+            "next_url": next_url,
             # pass filters back to the template so inputs stay filled
             "status": status,
             "merchant_id": merchant_id,
@@ -115,80 +163,137 @@ def admin_home(request: Request, db: Session = Depends(get_db)):
     )
 
 @router.post("/merchants/new", response_class=HTMLResponse)
-async def create_merchant(request: Request, db: Session = Depends(get_db)):
-    form = await request.form()
-    name = form.get("name", "").strip()
-    email = form.get("email", "").strip()
+def create_merchant(name: str = Form(""), email: str = Form(""), db: Session = Depends(get_db)):
+    # plain def: sync DB work runs in the threadpool, not on the event loop
+    name = name.strip()
+    email = email.strip()
     if name and email:
         m = models.Merchant(name=name, email=email)
         db.add(m)
         db.commit()
+        merchant_cache.invalidate(m.id)
     return RedirectResponse(url="/admin/", status_code=303)
 
 @router.post("/transactions/{tx_id}/refund", response_class=RedirectResponse)
-async def refund_tx(
+def refund_tx(
     tx_id: int,
     db: Session = Depends(get_db)
 ):
-    tx = db.get(models.Transaction, tx_id)
-    if tx and tx.status != "refunded":
-        tx.status = "refunded"
+    # no-op if it's already refunded or in a state that can't be refunded
+    if transitions.transition(db, tx_id, "refunded").applied:
         db.commit()
     return RedirectResponse(url="/admin/", status_code=303)
 
+CSV_COLUMNS = ["id", "merchant_id", "amount_usd", "currency", "status", "psp_reference", "created_at"]
+CSV_YIELD_PER = 1000      # rows fetched per round trip from the server-side cursor
+CSV_FLUSH_ROWS = 500      # rows buffered before a chunk is sent to the client
+
+def _csv_chunks(stmt, compress: bool, session_factory=SessionLocal):
+    """Stream the export: fetch rows in batches, yield CSV text in chunks (gzip optional).
+
+    Opens its own session because the response body is produced after the
+    request's dependencies (and their session) have already been closed.
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return gz.compress(data) if gz else data
+
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(CSV_COLUMNS)
+
+    db = session_factory()
+    try:
+        rows = db.execute(stmt.execution_options(yield_per=CSV_YIELD_PER))
+        n = 0
+        for tx_id, mid, cents, currency, st, psp, created in rows:
+            w.writerow([tx_id, mid, f"{(cents or 0) / 100:.2f}", currency, st, psp or "", created])
+            n += 1
+            if n % CSV_FLUSH_ROWS == 0:
+                chunk = emit(buf.getvalue())
+                buf.seek(0)
+                buf.truncate()
+                if chunk:
+                    yield chunk
+        tail = emit(buf.getvalue())
+        if gz:
+            tail += gz.flush()
+        if tail:
+            yield tail
+    finally:
+        db.close()
+
 @router.get("/transactions.csv", dependencies=[Depends(require_admin)])
 def export_transactions_csv(
+    request: Request,
     start: Optional[str] = None,         # format: YYYY-MM-DD
     end: Optional[str] = None,           # format: YYYY-MM-DD (inclusive)
     status: Optional[str] = None,        # e.g. created / authorised / refunded
     merchant_id: Optional[int] = None,   # optional: filter by a single merchant
-    db: Session = Depends(get_db),
+    gzip: bool = False,                  # ?gzip=1 -> transactions.csv.gz
 ):
-    # Build base query
-    q = db.query(models.Transaction)
-
-    # Parse dates safely (YYYY-MM-DD). If invalid, ignore.
-    def parse_date(s: Optional[str]) -> Optional[datetime]:
-        if not s:
-            return None
-        try:
-            return datetime.strptime(s, "%Y-%m-%d")
-        except Exception:
-            return None
-
-    start_dt = parse_date(start)
-    end_dt = parse_date(end)
-
-    if start_dt:
-        q = q.filter(models.Transaction.created_at >= start_dt)
-    if end_dt:
-        # make end date inclusive by adding 1 day and using "<"
-        q = q.filter(models.Transaction.created_at < (end_dt + timedelta(days=1)))
-
-    if status:
-        q = q.filter(models.Transaction.status == status)
+    # Only the exported columns, no ORM objects
+    T = models.Transaction
+    q = select(T.id, T.merchant_id, T.amount_cents, T.currency, T.status, T.psp_reference, T.created_at)
+
+    q = filter_transactions(q, status=status, merchant_id=merchant_id, start=parse_day(start), end=parse_day(end))
+
+    # Latest first, no row cap: rows are streamed, memory stays flat
+    q = q.order_by(T.id.desc())
+
+    filename = "transactions.csv.gz" if gzip else "transactions.csv"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = "application/gzip" if gzip else "text/csv; charset=utf-8"
+    # replica when healthy (db_replica.py); chosen now, the generator runs later
+    return StreamingResponse(_csv_chunks(q, gzip, read_sessionmaker(request)), media_type=media_type, headers=headers)
+
+@router.get("/diagnostics/db")
+def db_diagnostics():
+    """Connection pool config + live counters for the sync and async engines (JSON)."""
+    return {
+        "config": {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": settings.DB_POOL_RECYCLE,
+            "pool_pre_ping": settings.DB_POOL_PRE_PING,
+            "statement_timeout_ms": settings.DB_STATEMENT_TIMEOUT_MS,
+        },
+        "pools": {name: stats.snapshot() for name, stats in pool_stats.items()},
+        "replica": replica_router.status() if replica_router else None,
+    }
 
-    if merchant_id:
-        q = q.filter(models.Transaction.merchant_id == merchant_id)
+@router.get("/slow-queries", response_class=HTMLResponse)
+def slow_queries(request: Request):
+    """Recent statements over SLOW_QUERY_MS with their captured plans (newest first)."""
+    from . import db_slowlog
 
-    # Latest first, cap to 500 rows for easy download
-    txs = (
-        q.order_by(models.Transaction.id.desc())
-         .limit(500)
-         .all()
+    log = db_slowlog.slow_query_log
+    return templates.TemplateResponse(
+        "admin/slow_queries.html",
+        {
+            "request": request,
+            "title": "Slow queries",
+            "enabled": log is not None,
+            "threshold_ms": settings.SLOW_QUERY_MS,
+            "records": log.snapshot() if log else [],
+        },
     )
 
-    # Build CSV in memory
-    buf = io.StringIO()
-    w = csv.writer(buf, lineterminator="\n")
-    w.writerow(["id", "merchant_id", "amount_usd", "currency", "status", "psp_reference", "created_at"])
-    for t in txs:
-        amount_usd = f"{(t.amount_cents or 0) / 100:.2f}"
-        w.writerow([t.id, t.merchant_id, amount_usd, t.currency, t.status, t.psp_reference or "", t.created_at])
+@router.get("/search", response_class=HTMLResponse)
+def search(request: Request, q: str = "", db: Session = Depends(get_read_db)):
+    """PSP reference / merchant name / email search, ranked (services/search.py)."""
+    return templates.TemplateResponse(
+        "admin/search.html",
+        {"request": request, "title": "Search", "results": admin_search.search(db, q)},
+    )
 
-    csv_bytes = buf.getvalue()
-    headers = {"Content-Disposition": 'attachment; filename="transactions.csv"'}
-    return Response(content=csv_bytes, media_type="text/csv; charset=utf-8", headers=headers)
+@router.get("/diagnostics/cache")
+def cache_diagnostics():
+    """Merchant cache and admin count cache counters for this process (JSON)."""
+    return {"merchant": merchant_cache.stats(), "transaction_counts": transaction_counts.stats()}
 
 # --- at the very end of backend/app/admin.py ---
 admin_ui = router
@@ -223,6 +328,13 @@ def request_refund(tx_id: int, request: Request, db: Session = Depends(get_db)):
             status_code=404,
         )
 
+    # Flip the transaction to "refund_requested" (only from authorised/captured)
+    outcome = transitions.transition(db, tx.id, "refund_requested")
+    if outcome.reason == "unchanged":
+        return RedirectResponse(url=f"/admin/tx/{tx_id}?ok=1", status_code=303)
+    if not outcome.applied:
+        raise HTTPException(409, f"Can't request a refund for a {outcome.status} transaction")
+
     # Write an audit record
     rr = models.RefundRequest(
         transaction_id=tx.id,
@@ -233,10 +345,6 @@ def request_refund(tx_id: int, request: Request, db: Session = Depends(get_db)):
     )
     db.add(rr)
 
-    # Flip the transaction to "refund_requested"
-    tx.status = "refund_requested"
-    db.add(tx)
-
     db.commit()
     # back to the tx page with a little query string to show a message
     return RedirectResponse(url=f"/admin/tx/{tx_id}?ok=1", status_code=303)
@@ -254,6 +362,13 @@ def request_refund(
     # default to full amount if form didn’t specify
     amt = amount_cents if (amount_cents is not None and amount_cents > 0) else tx.amount_cents
 
+    # reflect requested state on the transaction
+    outcome = transitions.transition(db, tx.id, "refund_requested")
+    if outcome.reason == "unchanged":
+        return RedirectResponse(url=f"/admin/tx/{tx.id}", status_code=303)
+    if not outcome.applied:
+        raise HTTPException(409, f"Can't request a refund for a {outcome.status} transaction")
+
     # write a "refund requested" record
     r = models.Refund(
         tx_id=tx.id,
@@ -262,11 +377,7 @@ def request_refund(
         status="requested",
     )
 
-    # reflect requested state on the transaction
-    tx.status = "refund_requested"
-
     db.add(r)
-    db.add(tx)
     db.commit()
     db.refresh(r)
 
@@ -1,29 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ...db import SessionLocal, init_db
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...db import get_async_db
 from ... import models, schemas
-from ...services import adyen
+from ...services import adyen, daily_stats
+from ...services.merchant_cache import merchant_cache
 
 router = APIRouter(prefix="/api/v1/merchants", tags=["merchants"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.MerchantOut)
-def create_merchant(payload: schemas.MerchantCreate, db: Session = Depends(get_db)):
+async def create_merchant(payload: schemas.MerchantCreate, db: AsyncSession = Depends(get_async_db)):
     m = models.Merchant(name=payload.name, email=payload.email)
     db.add(m)
-    db.commit()
-    db.refresh(m)
+    await db.commit()
+    await db.refresh(m)
+    merchant_cache.invalidate(m.id)  # drop a cached "not found" for this id
     return m
 
 @router.get("/{merchant_id}", response_model=schemas.MerchantOut)
-def get_merchant(merchant_id: int, db: Session = Depends(get_db)):
-    m = db.get(models.Merchant, merchant_id)
+async def get_merchant(merchant_id: int, db: AsyncSession = Depends(get_async_db)):
+    m = await db.get(models.Merchant, merchant_id)
     if not m:
         raise HTTPException(404, "Merchant not found")
     return m
+
+@router.get("/{merchant_id}/stats")
+async def merchant_stats(
+    merchant_id: int,
+    start: Optional[date] = None,   # YYYY-MM-DD, default: `days` ago
+    end: Optional[date] = None,     # YYYY-MM-DD, inclusive, default: today
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Volume, approval and refund rates per day, from merchant_daily_stats only."""
+    if not await merchant_cache.get_async(db, merchant_id):
+        raise HTTPException(404, "Merchant not found")
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=days - 1)
+    rows = (await db.execute(daily_stats.stats_query(merchant_id, start, end))).all()
+    return {"merchant_id": merchant_id, "start": start, "end": end, **daily_stats.summarize(rows)}
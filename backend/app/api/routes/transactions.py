@@ -1,46 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ...db import SessionLocal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from ...db import get_async_db
+from ...db_replica import get_async_read_db
+from ...config import settings
+from ...pagination import decode_cursor, encode_cursor, finish_page, keyset_query
 from ... import models, schemas
+from ...services import daily_stats, idempotency, transitions
+from ...services.merchant_cache import merchant_cache
 
 router = APIRouter(prefix="/api/v1/transactions", tags=["transactions"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.TransactionOut)
-def create_transaction(payload: schemas.TransactionCreate, db: Session = Depends(get_db)):
-    merchant = db.get(models.Merchant, payload.merchant_id)
-    if not merchant:
-        raise HTTPException(404, "Merchant not found")
-    t = models.Transaction(merchant_id=payload.merchant_id, amount_cents=payload.amount_cents, currency=payload.currency)
-    db.add(t)
-    db.commit()
-    db.refresh(t)
-    return t
+async def create_transaction(
+    payload: schemas.TransactionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """Create a transaction. Retries with the same Idempotency-Key get the first response back."""
+    async def work():
+        merchant = await merchant_cache.get_async(db, payload.merchant_id)
+        if not merchant:
+            raise HTTPException(404, "Merchant not found")
+        t = models.Transaction(merchant_id=payload.merchant_id, amount_cents=payload.amount_cents, currency=payload.currency)
+        db.add(t)
+        await db.flush()
+        await db.refresh(t)
+        return 200, schemas.TransactionOut.model_validate(t).model_dump(mode="json")
+
+    return await idempotency.respond(db, idempotency_key, "POST /api/v1/transactions/", payload.model_dump_json(), work)
+
+@router.post("/batch", response_model=schemas.TransactionBatchOut)
+async def create_transactions_batch(payload: schemas.TransactionBatchCreate, db: AsyncSession = Depends(get_async_db)):
+    """Create many transactions at once (offline-queued sales from the app).
+
+    One IN query validates every merchant, one multi-row INSERT .. RETURNING
+    creates the valid items, one commit. Invalid items get a per-item error.
+    """
+    if len(payload.items) > settings.TRANSACTION_BATCH_MAX:
+        raise HTTPException(413, f"At most {settings.TRANSACTION_BATCH_MAX} items per batch")
+
+    results: list[Optional[dict]] = [None] * len(payload.items)
+    valid: list[tuple[int, schemas.TransactionCreate]] = []
+    for i, raw in enumerate(payload.items):
+        try:
+            valid.append((i, schemas.TransactionCreate.model_validate(raw)))
+        except ValidationError as e:
+            err = e.errors()[0]
+            results[i] = {"index": i, "ok": False, "error": f"{'.'.join(map(str, err['loc']))}: {err['msg']}"}
+
+    merchant_ids = {item.merchant_id for _, item in valid}
+    known = set(
+        (await db.scalars(select(models.Merchant.id).where(models.Merchant.id.in_(merchant_ids)))).all()
+    ) if merchant_ids else set()
+
+    to_insert = []
+    for i, item in valid:
+        if item.merchant_id not in known:
+            results[i] = {"index": i, "ok": False, "error": "Merchant not found"}
+        else:
+            to_insert.append((i, item))
+
+    if to_insert:
+        rows = [
+            {"merchant_id": item.merchant_id, "amount_cents": item.amount_cents, "currency": item.currency, "status": "created"}
+            for _, item in to_insert
+        ]
+        # one bulk INSERT .. RETURNING (insertmanyvalues); sort_by_parameter_order
+        # has SQLAlchemy hand the rows back in to_insert's order
+        created = (await db.scalars(
+            insert(models.Transaction).returning(models.Transaction, sort_by_parameter_order=True), rows
+        )).all()
+        # Core INSERT skips the ORM flush hook; roll the new rows up ourselves
+        await db.execute(daily_stats.record_inserted(db.get_bind(), [t.id for t in created]))
+        await db.commit()
+        for (i, _), tx in zip(to_insert, created):
+            results[i] = {"index": i, "ok": True, "transaction": tx}
+
+    return {"created": len(to_insert), "failed": len(results) - len(to_insert), "results": results}
+
+# Body stays the bare list it always was; the next page's cursor is a header
+# (absent on the last page), pass it back as ?cursor=
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 @router.get("/", response_model=list[schemas.TransactionOut])
-def list_transactions(db: Session = Depends(get_db)):
-    return db.query(models.Transaction).order_by(models.Transaction.id.desc()).all()
+async def list_transactions(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    db: AsyncSession = Depends(get_async_read_db),  # replica when healthy
+):
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    q = keyset_query(select(models.Transaction), models.Transaction.id, limit, after=after)
+    rows, _, has_next = finish_page((await db.scalars(q)).all(), limit, after=after)
+    if has_next and rows:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return rows
 
 @router.post("/{tx_id}/confirm", response_model=schemas.TransactionOut)
-def confirm_transaction(tx_id: int, psp_reference: str, status: str = "authorised", db: Session = Depends(get_db)):
-    t = db.get(models.Transaction, tx_id)
-    if not t:
+async def confirm_transaction(tx_id: int, psp_reference: str, status: str = "authorised", db: AsyncSession = Depends(get_async_db)):
+    """Move a transaction to `status` (default authorised) if the state machine allows it; 409 if not."""
+    if status not in transitions.ALLOWED_FROM:
+        raise HTTPException(400, f"Unknown status {status!r}")
+    outcome = await transitions.transition_async(db, tx_id, status, psp_reference=psp_reference)
+    if outcome.reason == "not_found":
         raise HTTPException(404, "Transaction not found")
-    t.status = status
-    t.psp_reference = psp_reference
-    db.commit()
-    db.refresh(t)
-    return t
+    if not outcome.applied and outcome.reason != "unchanged":  # already there: a retried confirm
+        raise HTTPException(409, f"Transaction is {outcome.status}, can't move to {status}")
+    await db.commit()
+    return await db.get(models.Transaction, tx_id)
 
 @router.get("/{tx_id}", response_model=schemas.TransactionOut)
-def get_transaction(tx_id: int, db: Session = Depends(get_db)):
-    tx = db.get(models.Transaction, tx_id)
+async def get_transaction(tx_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    tx = await db.get(models.Transaction, tx_id)
     if not tx:
         raise HTTPException(404, "Transaction not found")
-    return tx
\ No newline at end of file
+    return tx
@@ -1,31 +1,60 @@
 # backend/app/api/routes/webhooks.py
 from fastapi import APIRouter, Request, Depends, HTTPException
-from sqlalchemy.orm import Session
-import hmac, hashlib, json, re
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import hmac, hashlib
 
-from ...db import SessionLocal
+from ...db import dialect_insert, get_async_db
 from ...config import settings
 from ...security import require_webhook_auth, webhook_rate_limit
-from ... import models
+from ... import metrics, models
+from ...services.webhook_processing import parse_payload, payload_tx_ids
+from ...services.webhook_storage import encode_body, filter_headers, recent_event_keys
+from ...services.webhook_worker import webhook_workers
 
 router = APIRouter(prefix="/api/v1/webhooks", tags=["webhooks"])
 
-# DB session per request
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def _store_event(db: AsyncSession, event_key: str, signature: str, raw_body: bytes, headers_json: str) -> dict:
+    """Append the raw event to the inbox as "pending", unless its event_key is already there."""
+    # Adyen retries the same notification until it gets an ack; most re-sends
+    # hit a key this process stored (or saw) moments ago
+    if recent_event_keys.seen(event_key):
+        metrics.webhook_duplicates.inc("adyen")
+        metrics.webhook_dedupe_memory_hits.inc()
+        return {"ok": True, "duplicate": True}
+
+    # One statement decides: concurrent deliveries of the same event can't
+    # both insert, and the loser just gets no row back (no IntegrityError)
+    body, encoding = encode_body(raw_body)
+    ev = models.WebhookEvent
+    stmt = (
+        dialect_insert(db.get_bind())(ev)
+        .values(provider="adyen", event_key=event_key, signature=signature,
+                raw_body=body, raw_encoding=encoding, headers=headers_json, status="pending")
+        .on_conflict_do_nothing(index_elements=[ev.event_key])
+        .returning(ev.id)
+    )
+    event_id = (await db.execute(stmt)).scalar_one_or_none()
+    # webhook_event_txs only orders the inbox: workers take each transaction's
+    # events oldest first. Same commit, so no worker sees the event without them
+    tx_ids = payload_tx_ids(parse_payload(raw_body)) if event_id is not None else []
+    if tx_ids:
+        await db.execute(insert(models.WebhookEventTx), [{"tx_id": t, "event_id": event_id} for t in tx_ids])
+    await db.commit()
+    recent_event_keys.add(event_key)
+    if event_id is None:
+        metrics.webhook_duplicates.inc("adyen")
+        return {"ok": True, "duplicate": True}
+    metrics.webhook_received.inc("adyen")
+    return {"ok": True, "saved": True, "event_id": event_id}
 
 @router.post(
     "/adyen",
     dependencies=[Depends(require_webhook_auth), Depends(webhook_rate_limit)],
 )
-async def adyen_webhook(request: Request, db: Session = Depends(get_db)):
+async def adyen_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     # 1) Read raw body exactly as sent
     raw_bytes: bytes = await request.body()
-    raw_text: str = raw_bytes.decode("utf-8", "ignore")
 
     # 2) Signature check (optional, only if a secret is configured)
     secret = settings.WEBHOOK_SIGNING_SECRET or ""
@@ -40,124 +69,10 @@ async def adyen_webhook(request: Request, db: Session = Depends(get_db)):
     if not event_key:
         event_key = hashlib.sha256(raw_bytes).hexdigest()
 
-    # Short-circuit if we already saved this exact event
-    exists = (
-        db.query(models.WebhookEvent)
-        .filter(models.WebhookEvent.event_key == event_key)
-        .first()
-    )
-    if exists:
-        return {"ok": True, "duplicate": True}
-
-    # 4) Persist the raw event for auditing/replays
-    headers_dict = dict(request.headers)
-    evt = models.WebhookEvent(
-        provider="adyen",
-        event_key=event_key,
-        signature=sent_sig,
-        raw_json=raw_text,
-        headers=json.dumps(headers_dict),
-    )
-    db.add(evt)
-    db.commit()
-    db.refresh(evt)
-
-    # 5) BUSINESS: update Transaction on AUTHORISATION / CAPTURE / REFUND
-    handled = 0
-
-    # Parse body to dict
-    try:
-        payload = json.loads(raw_text) if raw_text else {}
-    except json.JSONDecodeError:
-        payload = {}
-
-    # Helper: yield each NotificationRequestItem, no matter the shape
-    def notification_items(p):
-        if isinstance(p, dict):
-            if "notificationItems" in p and isinstance(p["notificationItems"], list):
-                for wrapper in p["notificationItems"]:
-                    if isinstance(wrapper, dict) and "NotificationRequestItem" in wrapper:
-                        yield wrapper["NotificationRequestItem"]
-                    else:
-                        yield wrapper
-            elif "NotificationRequestItem" in p:
-                yield p["NotificationRequestItem"]
-            else:
-                yield p
-        elif isinstance(p, list):
-            for item in p:
-                yield item
-
-    for nri in notification_items(payload):
-        nri = nri or {}
-        event_code = str(nri.get("eventCode", "")).upper()
-        success = str(nri.get("success", "")).lower() == "true"
-        psp_ref = nri.get("pspReference") or nri.get("psp_reference")
-        merchant_ref = str(nri.get("merchantReference", ""))
-
-        # Extract tx_id from merchantReference like "tx_123"
-        m = re.search(r"tx_(\d+)", merchant_ref)
-        if not m:
-            continue
-        try:
-            tx_id = int(m.group(1))
-        except ValueError:
-            continue
-
-        tx = db.get(models.Transaction, tx_id)
-        if not tx:
-            continue
-
-        # --- AUTHORISATION ---
-        if event_code == "AUTHORISATION":
-            tx.status = "authorised" if success else "failed"
-            if psp_ref:
-                tx.psp_reference = psp_ref
-            # Sync amount/currency if provided
-            amt = nri.get("amount") or {}
-            if isinstance(amt, dict):
-                if isinstance(amt.get("value"), int):
-                    tx.amount_cents = int(amt["value"])
-                if isinstance(amt.get("currency"), str):
-                    tx.currency = amt["currency"]
-            db.add(tx)
-            handled += 1
-            continue
-
-        # --- CAPTURE ---
-        if event_code == "CAPTURE":
-            tx.status = "captured" if success else "failed"
-            if psp_ref:
-                tx.psp_reference = psp_ref
-            db.add(tx)
-            handled += 1
-            continue
-
-        # --- REFUND ---
-        if event_code == "REFUND":
-            tx.status = "refunded" if success else "failed"
-            if psp_ref:
-                tx.psp_reference = psp_ref
-
-            # Mark the newest refund row for this tx
-            rf = (
-                db.query(models.Refund)
-                .filter(models.Refund.tx_id == tx.id)
-                .order_by(models.Refund.id.desc())
-                .first()
-            )
-            if rf:
-                rf.status = "refunded" if success else "failed"
-                if psp_ref:
-                    rf.psp_reference = psp_ref
-                db.add(rf)
-
-            db.add(tx)
-            handled += 1
-            continue
-
-    # Save DB changes only if we actually touched something
-    if handled:
-        db.commit()
-
-    return {"ok": True, "saved": True, "handled": handled}
+    # 4) Persist the raw event as "pending" and ack.
+    #    Business updates happen in the inbox workers (services/webhook_worker.py),
+    #    so ack latency doesn't depend on how many items the notification carries.
+    result = await _store_event(db, event_key, sent_sig, raw_bytes, filter_headers(request.headers))
+    if result.get("saved"):
+        webhook_workers.notify()
+    return result
@@ -4,6 +4,17 @@ from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
+    # ---- Environment ----
+    APP_ENV: str = "dev"                     # dev | prod ("production" also works)
+    # create_all at startup: default on in dev, off in prod (Alembic owns the schema there)
+    DB_AUTO_CREATE: Optional[bool] = None
+    READY_DB_TIMEOUT_SECONDS: float = 2.0    # /ready gives up on the DB after this
+
+    # ---- Templates (see app/templating.py) ----
+    # compiled templates are cached here; `python scripts/precompile_templates.py` fills it at build time
+    TEMPLATE_CACHE_DIR: Optional[str] = None  # default: backend/.jinja_cache ("" disables)
+    TEMPLATE_AUTO_RELOAD: Optional[bool] = None  # re-check template mtimes: default on in dev, off in prod
+
     # ---- Admin auth (already used elsewhere) ----
     ADMIN_USER: str = "admin"
     ADMIN_PASSWORD: str = "password"
@@ -18,11 +29,97 @@ class Settings(BaseSettings):
 
     # (optional hardening toggles)
     ADMIN_IP_ALLOWLIST: Optional[str] = None
-    ADMIN_RATE_LIMIT: Optional[str] = None
+    ADMIN_RATE_LIMIT: Optional[str] = None   # e.g. "20/m", "100/5m", "30/s" (default 20/m)
+
+    # ---- Rate limiting (token buckets, see app/ratelimit.py) ----
+    WEBHOOK_RATE_LIMIT: str = "300/m"        # per client IP; Adyen bursts batches
+    RATE_LIMIT_BACKEND: str = "memory"       # memory = per process | db = shared via DATABASE_URL
+    RATE_LIMIT_MAX_KEYS: int = 10000         # memory backend: LRU cap on tracked clients
+    RATE_LIMIT_IDLE_SECONDS: int = 900       # forget clients idle longer than this
+
+    # ---- /metrics (Prometheus text format) ----
+    # Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; admin basic auth also works.
+    METRICS_TOKEN: Optional[str] = None
 
     # DB (leave as-is if you already had these in env)
     DATABASE_URL: Optional[str] = None
 
+    # ---- Connection pool (sync and async engines each get one) ----
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0        # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800          # seconds; drop connections older than this
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: Optional[int] = None  # Postgres only (SET statement_timeout)
+
+    # ---- Read replica (optional; see app/db_replica.py) ----
+    # read-only routes (admin dashboard/search, CSV export, GET /api/v1/transactions) use it when healthy
+    DATABASE_REPLICA_URL: Optional[str] = None
+    REPLICA_MAX_LAG_SECONDS: float = 10.0         # replication lag beyond this -> read from the primary
+    REPLICA_CHECK_SECONDS: float = 5.0            # how often reachability + lag are re-checked
+    REPLICA_CONNECT_TIMEOUT_SECONDS: int = 2      # Postgres connect_timeout, so a dead replica fails fast
+    REPLICA_READ_YOUR_WRITES_SECONDS: float = 15.0  # a client's reads go to the primary this long after it writes
+
+    # ---- Slow-query log (off unless SLOW_QUERY_MS is set; see app/db_slowlog.py) ----
+    SLOW_QUERY_MS: Optional[float] = None   # log statements at least this slow
+    SLOW_QUERY_LOG_SIZE: int = 200          # records kept for /admin/slow-queries
+    SLOW_QUERY_EXPLAIN: bool = True         # capture EXPLAIN plans in a background thread
+
+    # ---- Pagination ----
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+
+    # ---- Admin table counts (see app/services/count_cache.py) ----
+    ADMIN_EXACT_COUNT_MAX: int = 100000      # filtered sets bigger than this page on has-next, no "of Y"
+    ADMIN_COUNT_TTL_SECONDS: float = 30.0    # cached counts; this process's own writes invalidate sooner
+    ADMIN_COUNT_CACHE_SIZE: int = 512        # distinct filter combinations kept per process
+
+    # ---- Bulk endpoints ----
+    TRANSACTION_BATCH_MAX: int = 500   # items per POST /api/v1/transactions/batch
+
+    # ---- Idempotency-Key replay (POST /api/v1/transactions/, /checkout.json; see app/services/idempotency.py) ----
+    IDEMPOTENCY_TTL_SECONDS: int = 86400          # stored responses are replayed for this long
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0        # a duplicate waits this long for the original, then 409
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS: float = 60.0  # an in-progress claim older than this was abandoned
+    IDEMPOTENCY_CACHE_SIZE: int = 10000           # finished responses kept in memory per process
+
+    # ---- Merchant cache (checkout + transaction creation, see app/services/merchant_cache.py) ----
+    MERCHANT_CACHE_SIZE: int = 1024               # merchants kept per process (LRU)
+    MERCHANT_CACHE_TTL_SECONDS: float = 300.0     # bounds staleness across uvicorn workers
+    MERCHANT_CACHE_NEGATIVE_TTL_SECONDS: float = 5.0  # unknown ids, so new merchants show up fast
+
+    # ---- Webhook inbox workers ----
+    # The endpoint only stores events as "pending"; these threads apply them.
+    WEBHOOK_WORKERS: int = 2
+    WEBHOOK_BATCH_SIZE: int = 50
+    WEBHOOK_POLL_SECONDS: float = 1.0
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+    # a failed event waits BASE * 2^(attempts-1) seconds (capped at MAX) before it's claimed again
+    WEBHOOK_RETRY_BASE_SECONDS: float = 5.0
+    WEBHOOK_RETRY_MAX_SECONDS: float = 600.0
+    # a "processing" claim older than this is considered abandoned (crashed worker)
+    WEBHOOK_CLAIM_TIMEOUT_SECONDS: int = 300
+
+    # ---- Webhook storage + retention (see app/services/webhook_storage.py) ----
+    # request headers kept with each event (comma-separated, case-insensitive); everything else is dropped
+    WEBHOOK_HEADER_ALLOWLIST: str = "content-type,content-length,user-agent,x-signature,idempotency-key,x-forwarded-for,x-request-id"
+    WEBHOOK_RECENT_KEYS: int = 10000          # event keys remembered per process to ack retries without a query
+    WEBHOOK_RETENTION_DAYS: int = 30          # processed events older than this are purged
+    WEBHOOK_RETENTION_BATCH_SIZE: int = 500   # rows per delete transaction
+    WEBHOOK_ARCHIVE_DIR: Optional[str] = None  # set to write purged events to gzip JSONL first
+
+    @property
+    def is_production(self) -> bool:
+        return self.APP_ENV.lower() in ("prod", "production")
+
+    @property
+    def db_auto_create(self) -> bool:
+        return self.DB_AUTO_CREATE if self.DB_AUTO_CREATE is not None else not self.is_production
+
+    @property
+    def template_auto_reload(self) -> bool:
+        return self.TEMPLATE_AUTO_RELOAD if self.TEMPLATE_AUTO_RELOAD is not None else not self.is_production
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,15 +1,119 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .config import settings
+from .db_pool import TimedAsyncQueuePool, TimedQueuePool, instrument as instrument_pool
+from .metrics import instrument_engine as instrument_metrics
 
-DB_URL = settings.DATABASE_URL or "sqlite:///./tapsnap.db"
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, echo=False, future=True, connect_args=connect_args)
+def _sync_url(url: str) -> str:
+    # psycopg (v3) is the only Postgres driver in requirements.txt
+    if url.startswith(("postgres://", "postgresql://", "postgresql+psycopg2://")):
+        return "postgresql+psycopg://" + url.split("://", 1)[1]
+    return url
+
+def _async_url(url: str) -> str:
+    # same database, async drivers: psycopg3 async for Postgres, aiosqlite for SQLite
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url  # postgresql+psycopg works with create_async_engine as-is
+
+DB_URL = _sync_url(settings.DATABASE_URL or "sqlite:///./tapsnap.db")
+ASYNC_DB_URL = _async_url(DB_URL)
+
+def _engine_kwargs(url: str, is_async: bool) -> dict:
+    """Pool settings from Settings; in-memory SQLite keeps SQLAlchemy's default pool."""
+    kwargs: dict = {"connect_args": {}}
+    if url.startswith("sqlite"):
+        if not is_async:
+            kwargs["connect_args"]["check_same_thread"] = False
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            return kwargs
+    elif settings.DB_STATEMENT_TIMEOUT_MS:
+        kwargs["connect_args"]["options"] = f"-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+    kwargs.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return kwargs
+
+# Sync engine: admin UI, webhook workers, scripts. Alembic builds its own.
+engine = create_engine(DB_URL, echo=False, future=True, **_engine_kwargs(DB_URL, is_async=False))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# Async engine: the API routers and public checkout run on the event loop,
+# so they aren't capped by the threadpool size.
+async_engine = create_async_engine(ASYNC_DB_URL, echo=False, **_engine_kwargs(ASYNC_DB_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+instrument_pool(engine, "sync")
+instrument_pool(async_engine, "async")
+instrument_metrics(engine, "sync")
+instrument_metrics(async_engine, "async")
+
+# Optional read replica: read-only routes pick it or the primary per request
+# (db_replica.py). None when DATABASE_REPLICA_URL isn't set.
+REPLICA_DB_URL = _sync_url(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
+replica_engine = async_replica_engine = None
+ReplicaSessionLocal = AsyncReplicaSessionLocal = None
+if REPLICA_DB_URL:
+    def _replica_kwargs(url: str, is_async: bool) -> dict:
+        kwargs = _engine_kwargs(url, is_async)
+        if not url.startswith("sqlite"):
+            kwargs["connect_args"]["connect_timeout"] = settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+        return kwargs
+
+    replica_engine = create_engine(REPLICA_DB_URL, echo=False, future=True, **_replica_kwargs(REPLICA_DB_URL, is_async=False))
+    ReplicaSessionLocal = sessionmaker(bind=replica_engine, autoflush=False, autocommit=False, future=True)
+    _async_replica_url = _async_url(REPLICA_DB_URL)
+    async_replica_engine = create_async_engine(_async_replica_url, echo=False, **_replica_kwargs(_async_replica_url, is_async=True))
+    AsyncReplicaSessionLocal = async_sessionmaker(bind=async_replica_engine, autoflush=False, expire_on_commit=False)
+
+    instrument_pool(replica_engine, "replica_sync")
+    instrument_pool(async_replica_engine, "replica_async")
+    instrument_metrics(replica_engine, "replica_sync")
+    instrument_metrics(async_replica_engine, "replica_async")
+
+# opt-in slow-query log (+ EXPLAIN capture), viewable at /admin/slow-queries
+if settings.SLOW_QUERY_MS is not None:
+    from . import db_slowlog
+    _slowlog_engines = {"sync": engine, "async": async_engine}
+    _explain_engines = {"async": engine}
+    if REPLICA_DB_URL:
+        # replica queries are explained on the replica: its stats/plans can differ
+        _slowlog_engines.update(replica_sync=replica_engine, replica_async=async_replica_engine)
+        _explain_engines["replica_async"] = replica_engine
+    db_slowlog.install(
+        _slowlog_engines,
+        settings.SLOW_QUERY_MS, settings.SLOW_QUERY_LOG_SIZE, settings.SLOW_QUERY_EXPLAIN,
+        explain_engines=_explain_engines,
+    )
+
 class Base(DeclarativeBase):
     pass
 
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def dialect_insert(bind):
+    """INSERT construct with ON CONFLICT support for the bind's dialect (Postgres or SQLite)."""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
 def init_db():
     from . import models  # noqa: F401
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,137 @@
+# backend/app/db_pool.py
+# Connection pool instrumentation: how many connections are checked out,
+# how long requests wait for one, and how often we dip into overflow.
+# Numbers are shown at /admin/diagnostics/db.
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# checkout wait histogram buckets, in milliseconds (last one is +Inf)
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class PoolStats:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.overflow_checkouts = 0
+        self.max_checked_out = 0
+        self.wait_count = 0
+        self.wait_sum_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.pool = None  # current pool, for live gauges
+
+    def observe_wait(self, ms: float, timed_out: bool = False) -> None:
+        i = 0
+        while i < len(WAIT_BUCKETS_MS) and ms > WAIT_BUCKETS_MS[i]:
+            i += 1
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            self.wait_buckets[i] += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def _on_checkout(self, pool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            if isinstance(pool, QueuePool):
+                if pool.overflow() > 0:
+                    self.overflow_checkouts += 1
+                self.max_checked_out = max(self.max_checked_out, pool.checkedout())
+
+    def _inc(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for le, n in zip(WAIT_BUCKETS_MS + ["+Inf"], self.wait_buckets):
+                cumulative += n
+                buckets[str(le)] = cumulative
+            return {
+                "pool": type(pool).__name__ if pool is not None else None,
+                "size": pool.size() if isinstance(pool, QueuePool) else None,
+                "checked_out": pool.checkedout() if isinstance(pool, QueuePool) else None,
+                "overflow": pool.overflow() if isinstance(pool, QueuePool) else None,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "wait_ms": {
+                    "count": self.wait_count,
+                    "sum": round(self.wait_sum_ms, 3),
+                    "max": round(self.wait_max_ms, 3),
+                    "buckets": buckets,  # cumulative, Prometheus-style "le"
+                },
+            }
+
+
+class _TimedCheckout:
+    """Times the wait for a connection (queue wait + connect) on top of a QueuePool."""
+
+    _stats: Optional[PoolStats] = None
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self._stats is not None:
+                self._stats.observe_wait((time.perf_counter() - t0) * 1000, timed_out)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting into the same stats
+        new = super().recreate()
+        new._stats = self._stats
+        if self._stats is not None:
+            self._stats.pool = new
+        return new
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_stats: Dict[str, PoolStats] = {}
+
+
+def instrument(engine, name: str) -> PoolStats:
+    """Attach pool event listeners to a (sync or async) engine and register its stats."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    stats = PoolStats(name)
+    pool = sync_engine.pool
+    stats.pool = pool
+    if isinstance(pool, _TimedCheckout):
+        pool._stats = stats
+
+    event.listen(sync_engine, "checkout", lambda dbapi_conn, rec, proxy: stats._on_checkout(stats.pool))
+    event.listen(sync_engine, "checkin", lambda dbapi_conn, rec: stats._inc("checkins"))
+    event.listen(sync_engine, "connect", lambda dbapi_conn, rec: stats._inc("connects"))
+    event.listen(sync_engine, "invalidate", lambda dbapi_conn, rec, err: stats._inc("invalidations"))
+
+    pool_stats[name] = stats
+    return stats
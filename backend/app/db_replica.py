@@ -0,0 +1,176 @@
+# backend/app/db_replica.py
+# Read-only routes (admin dashboard and search, CSV export,
+# GET /api/v1/transactions) read from DATABASE_REPLICA_URL when it's set,
+# through get_read_db / get_async_read_db / read_sessionmaker().
+#
+# A request still goes to the primary when
+#   - no replica is configured
+#   - the last check couldn't reach the replica, or measured more than
+#     REPLICA_MAX_LAG_SECONDS of replication lag. Checks run at most every
+#     REPLICA_CHECK_SECONDS, by whichever request finds the result stale;
+#     the others keep using the previous result meanwhile
+#   - the client wrote something in the last REPLICA_READ_YOUR_WRITES_SECONDS:
+#     ReadYourWritesMiddleware puts a cookie on every POST/PUT/PATCH/DELETE
+#     response, so the dashboard after a refund or a GET after a confirm
+#     shows the write even if the replica hasn't replayed it yet
+#
+# Lag is measured on Postgres standbys (0 when everything received has been
+# replayed, else the age of the last replayed transaction). Anything else
+# counts as 0 once it answers, e.g. a second SQLite file standing in for a
+# replica in dev.
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+from . import db
+
+COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    def __init__(self, engine, max_lag: float, check_every: float, read_your_writes: float):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self.read_your_writes = read_your_writes
+        self._lock = threading.Lock()  # probe lock, only ever try-acquired
+        self.checked_at: Optional[float] = None  # monotonic
+        self.reachable = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.reads = Counter()  # where reads went and why
+        self._reads_lock = threading.Lock()  # choose() runs on threadpool threads too
+
+    # ---- health ----
+
+    def stale(self) -> bool:
+        return self.checked_at is None or time.monotonic() - self.checked_at >= self.check_every
+
+    def refresh(self) -> None:
+        """Probe reachability and lag (blocking). Concurrent callers skip; one probe is enough."""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                with self.engine.connect() as conn:
+                    if conn.dialect.name == "postgresql":
+                        lag = float(conn.exec_driver_sql(LAG_SQL).scalar() or 0)
+                    else:
+                        conn.exec_driver_sql("SELECT 1")
+                        lag = 0.0
+                self.reachable, self.lag, self.error = True, lag, None
+            except Exception as exc:
+                self.reachable, self.lag, self.error = False, None, f"{type(exc).__name__}: {exc}"[:300]
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    # ---- routing ----
+
+    def choose(self, request: Optional[Request]) -> str:
+        """'replica', or why this read goes to the primary. Doesn't probe; see stale()/refresh()."""
+        if request is not None and wrote_recently(request):
+            reason = "recent_write"
+        elif not self.reachable:
+            reason = "replica_down"
+        elif self.lag is not None and self.lag > self.max_lag:
+            reason = "replica_lagging"
+        else:
+            reason = "replica"
+        with self._reads_lock:
+            self.reads[reason] += 1
+        return reason
+
+    def status(self) -> dict:
+        with self._reads_lock:
+            reads = dict(self.reads)
+        return {
+            "reachable": self.reachable,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "max_lag_seconds": self.max_lag,
+            "checked_seconds_ago": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None,
+            "error": self.error,
+            "reads": reads,
+        }
+
+
+replica_router: Optional[ReplicaRouter] = ReplicaRouter(
+    db.replica_engine,
+    settings.REPLICA_MAX_LAG_SECONDS,
+    settings.REPLICA_CHECK_SECONDS,
+    settings.REPLICA_READ_YOUR_WRITES_SECONDS,
+) if db.replica_engine is not None else None
+
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _use_replica(request: Optional[Request]) -> bool:
+    if replica_router is None:
+        return False
+    if replica_router.stale():
+        replica_router.refresh()
+    return replica_router.choose(request) == "replica"
+
+
+def read_sessionmaker(request: Optional[Request] = None):
+    """Session factory for a read-only request: the replica's or the primary's. May probe (blocking)."""
+    return db.ReplicaSessionLocal if _use_replica(request) else db.SessionLocal
+
+
+def get_read_db(request: Request):
+    """get_db() for read-only sync routes."""
+    session = read_sessionmaker(request)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def get_async_read_db(request: Request):
+    """get_async_db() for read-only async routes."""
+    use = False
+    if replica_router is not None:
+        if replica_router.stale():
+            await run_in_threadpool(replica_router.refresh)
+        use = replica_router.choose(request) == "replica"
+    async with (db.AsyncReplicaSessionLocal if use else db.AsyncSessionLocal)() as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI: responses to unsafe methods set COOKIE, sending the client's reads to the primary for a while."""
+
+    def __init__(self, app, seconds: float = settings.REPLICA_READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                until = int(time.time() + self.seconds) + 1
+                MutableHeaders(scope=message).append(
+                    "set-cookie", f"{COOKIE}={until}; Max-Age={int(self.seconds) + 1}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,173 @@
+# backend/app/db_slowlog.py
+# Opt-in slow-query log (SLOW_QUERY_MS). Statements slower than the threshold
+# are logged with normalized SQL, parameter shapes, duration and the route (or
+# worker thread) that ran them, and kept in a ring buffer shown at
+# /admin/slow-queries.
+#
+# The first time a statement shape is slow, and whenever it sets a new worst
+# time, a background thread runs EXPLAIN for it (SQLite EXPLAIN QUERY PLAN /
+# Postgres EXPLAIN (FORMAT JSON)) on its own connection to the database that
+# ran it (primary or replica), so the request that hit the slow query never
+# waits for the plan.
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+log = logging.getLogger("app.slow_query")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|\$\d+|\?|%s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+EXPLAIN_MIN_INTERVAL = 60.0  # seconds between EXPLAINs of the same statement shape
+
+
+def normalize_sql(statement: str) -> str:
+    """Literals and bind params -> ?, IN lists collapsed, whitespace squashed."""
+    s = _STRING.sub("?", statement)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _IN_LIST.sub("(...)", s)
+    return _SPACES.sub(" ", s).strip()
+
+
+def param_shape(parameters, executemany: bool):
+    """Types, not values: {"merchant_id_1": "int"} / ["str", "int"]; executemany -> count + first row."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"rows": len(parameters), "row": param_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, size: int, explain: bool):
+        self.threshold_ms = threshold_ms
+        self.explain_enabled = explain
+        self.records: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._worst: Dict[str, float] = {}          # fingerprint -> worst ms seen
+        self._explained_at: Dict[str, float] = {}   # fingerprint -> monotonic time
+        self._queue: "queue.Queue" = queue.Queue(maxsize=100)
+        self._thread: Optional[threading.Thread] = None
+        self.explain_engines: Dict[str, object] = {}  # engine name -> sync engine on the same database
+
+    # ---- engine hooks ----
+
+    def install(self, engine, name: str, explain_engine=None) -> None:
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if explain_engine is not None:
+            self.explain_engines[name] = explain_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slowlog_t0", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            stack = conn.info.get("slowlog_t0")
+            if not stack:
+                return
+            ms = (time.perf_counter() - stack.pop()) * 1000
+            if ms >= self.threshold_ms and not conn.get_execution_options().get("slowlog_skip"):
+                self.record(name, statement, parameters, executemany, ms)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def _error(ctx):
+            if ctx.connection is not None:
+                stack = ctx.connection.info.get("slowlog_t0")
+                if stack:
+                    stack.pop()
+
+    def record(self, engine_name: str, statement: str, parameters, executemany: bool, ms: float) -> dict:
+        from .metrics import current_route
+
+        sql = normalize_sql(statement)
+        fp = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        rec = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(ms, 2),
+            "engine": engine_name,
+            "route": current_route() or threading.current_thread().name,
+            "fingerprint": fp,
+            "sql": sql,
+            "params": param_shape(parameters, executemany),
+            "plan": None,
+        }
+        with self._lock:
+            self.records.append(rec)
+            worst = self._worst.get(fp, 0.0)
+            self._worst[fp] = max(worst, ms)
+            last = self._explained_at.get(fp)
+            want_plan = (
+                self.explain_enabled and not executemany
+                and sql.split(" ", 1)[0].upper() in ("SELECT", "WITH")
+                and (last is None or (ms > worst and time.monotonic() - last > EXPLAIN_MIN_INTERVAL))
+            )
+            if want_plan:
+                self._explained_at[fp] = time.monotonic()
+        log.warning("slow query %.1fms route=%s params=%s sql=%s", ms, rec["route"], json.dumps(rec["params"]), sql)
+        if want_plan:
+            try:
+                self._queue.put_nowait((rec, engine_name, statement, parameters))
+                self._ensure_thread()
+            except queue.Full:
+                pass
+        return rec
+
+    # ---- out-of-band EXPLAIN ----
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._explain_loop, name="slowlog-explain", daemon=True)
+            self._thread.start()
+
+    def _explain_loop(self) -> None:
+        while True:
+            rec, engine_name, statement, parameters = self._queue.get()
+            try:
+                rec["plan"] = self.explain(statement, parameters, engine_name)
+            except Exception as exc:
+                rec["plan"] = f"EXPLAIN failed: {type(exc).__name__}: {exc}"
+
+    def explain(self, statement: str, parameters, engine_name: str = "sync"):
+        engine = self.explain_engines.get(engine_name) or self.explain_engines["sync"]
+        with engine.connect().execution_options(slowlog_skip=True) as conn:
+            if engine.dialect.name == "postgresql":
+                row = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+                return json.loads(row) if isinstance(row, str) else row
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            return [r[-1] for r in rows]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self.records))
+
+
+slow_query_log: Optional[SlowQueryLog] = None
+
+
+def install(engines: Dict[str, object], threshold_ms: float, size: int, explain: bool,
+            explain_engines: Optional[Dict[str, object]] = None) -> SlowQueryLog:
+    """Hook every engine. EXPLAIN runs on explain_engines[name], a sync engine
+    on the same database; sync engines default to themselves."""
+    global slow_query_log
+    slow_query_log = SlowQueryLog(threshold_ms, size, explain)
+    explain_engines = explain_engines or {}
+    for name, eng in engines.items():
+        default = eng if not hasattr(eng, "sync_engine") else None
+        slow_query_log.install(eng, name, explain_engine=explain_engines.get(name, default))
+    return slow_query_log
@@ -1,59 +1,111 @@
 # backend/app/main.py
-from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
-from starlette.exceptions import HTTPException as StarletteHTTPException
-from fastapi.exceptions import RequestValidationError
-from pathlib import Path
-import logging
-from fastapi.responses import JSONResponse
-from fastapi.exceptions import RequestValidationError
-
-# app internals
-from .db import init_db
-from .api.routes import merchants, transactions, webhooks, onboarding
-from .admin import admin_ui                  # import the APIRouter instance from admin.py
-from .public import router as public_router  # your file is public.py
-
-
-app = FastAPI(title="TapSnap API", version="0.1.0")
-
-from fastapi.middleware.cors import CORSMiddleware
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",   # Vite dev
-        "https://tapsnap.app",     # <- change to your real frontend domain later
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# create tables on startup if needed
-init_db()
-
-# templates for error pages
-templates = Jinja2Templates(directory=str(Path(__file__).resolve().parents[1] / "templates"))
+from .startup import startup  # first, so the timings cover the imports below
+
+with startup.phase("import framework"):
+    import asyncio
+    import logging
+    from contextlib import asynccontextmanager
+
+    from fastapi import Depends, FastAPI, Request
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.exceptions import RequestValidationError
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+    from sqlalchemy import text
+    from starlette.exceptions import HTTPException as StarletteHTTPException
+
+# Routers stay eager on purpose: FastAPI needs their routes registered before
+# the first request, and nearly all of this phase is app.db (SQLAlchemy, the
+# drivers) and models/schemas (pydantic), which every router needs anyway.
+# Importing them lazily would only move the cost into the first request.
+with startup.phase("import app"):
+    from .config import settings
+    from .db import async_engine, init_db
+    from .db_replica import ReadYourWritesMiddleware
+    from .api.routes import merchants, transactions, webhooks, onboarding
+    from .admin import admin_ui                  # import the APIRouter instance from admin.py
+    from .public import router as public_router  # your file is public.py
+    from .services.webhook_worker import webhook_workers
+    from .metrics import MetricsMiddleware, registry as metrics_registry
+    from .security import require_metrics_access
+    from .templating import templates  # shared with admin/public, built on first render
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables come from Alembic. create_all is a dev convenience only, and a DB
+    # that's down at boot must not kill the process: /ready reports it instead.
+    if settings.db_auto_create:
+        with startup.phase("create_all"):
+            try:
+                await run_in_threadpool(init_db)
+            except Exception:
+                logging.exception("create_all failed at startup; continuing, see /ready")
+    # webhook inbox workers (apply stored Adyen notifications in the background)
+    with startup.phase("webhook workers"):
+        webhook_workers.start()
+    startup.done()
+    yield
+    webhook_workers.stop()
+
+
+with startup.phase("build app"):
+    app = FastAPI(title="TapSnap API", version="0.1.0", lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:5173",   # Vite dev
+            "https://tapsnap.app",     # <- change to your real frontend domain later
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],  # GET /api/v1/transactions/ paging
+    )
+
+    # request count/latency/DB time per route template, served at /metrics
+    app.add_middleware(MetricsMiddleware)
 
+    # after a write, that client's reads skip the replica for a while (db_replica.py)
+    if settings.DATABASE_REPLICA_URL:
+        app.add_middleware(ReadYourWritesMiddleware)
+
+# liveness: the process is up (never touches the DB)
 @app.get("/health")
 def health():
     return {"ok": True}
 
+# readiness: can we reach the database right now?
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    try:
+        async with async_engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=settings.READY_DB_TIMEOUT_SECONDS)
+        db_ok, detail = True, "ok"
+    except Exception as exc:
+        db_ok, detail = False, f"{type(exc).__name__}: {exc}"[:300]
+    body = {"ready": db_ok, "db": detail, "startup": startup.as_dict()}
+    return JSONResponse(body, status_code=200 if db_ok else 503)
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # One root route → redirect to admin UI
 @app.get("/", include_in_schema=False)
 def root():
     return RedirectResponse(url="/admin", status_code=307)
 
 # Mount feature routers
-app.include_router(merchants.router)
-app.include_router(transactions.router)
-app.include_router(webhooks.router)
-app.include_router(onboarding.router)
+with startup.phase("mount routers"):
+    app.include_router(merchants.router)
+    app.include_router(transactions.router)
+    app.include_router(webhooks.router)
+    app.include_router(onboarding.router)
 
-app.include_router(admin_ui)         # ✅ admin: do NOT use .router here
-app.include_router(public_router)    # ✅ public: do NOT use .router here
+    app.include_router(admin_ui)         # ✅ admin: do NOT use .router here
+    app.include_router(public_router)    # ✅ public: do NOT use .router here
 
 # -----------------------------
 # Nicely formatted error pages
@@ -90,6 +142,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
             "detail": getattr(exc, "detail", ""),
         },
         status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),  # e.g. Retry-After on 429
     )
 
 @app.exception_handler(RequestValidationError)
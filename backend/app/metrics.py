@@ -0,0 +1,280 @@
+# backend/app/metrics.py
+# Prometheus-style metrics, served as text at /metrics.
+#
+# Deliberately tiny (no prometheus_client dependency): counters, gauges and
+# fixed-bucket histograms keyed by label tuples, each guarded by one lock.
+# Hot-path cost is a dict lookup + a bisect per observation.
+#
+#   MetricsMiddleware  - per route template: request count by status, latency
+#   DB hooks           - before/after_cursor_execute: queries + DB time, also
+#                        per request via a contextvar
+#   webhook_*          - bumped by the webhook endpoint and inbox workers
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * (len(self.buckets) + 2)
+            v[i] += 1
+            v[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = self.header()
+        for labels, v in items:
+            cumulative = 0
+            for le, n in zip(self.buckets + (float("inf"),), v[:-1]):
+                cumulative += n
+                le_label = 'le="%s"' % _num(le)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, labels, le_label)} {cumulative}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, labels)} {_num(v[-1])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, labels)} {cumulative}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], List[str]]] = []  # called at scrape time
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self.metrics:
+            lines.extend(m.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---- HTTP ----
+http_requests = registry.add(Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")))
+http_latency = registry.add(Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route")))
+http_in_progress = registry.add(Gauge("http_requests_in_progress", "Requests being served right now."))
+
+# ---- DB ----
+db_queries = registry.add(Counter("db_queries_total", "SQL statements executed.", ("engine",)))
+db_time = registry.add(Counter("db_query_seconds_total", "Time spent executing SQL statements.", ("engine",)))
+db_queries_per_request = registry.add(Histogram("db_queries_per_request", "SQL statements per HTTP request.", ("route",), QUERY_COUNT_BUCKETS))
+db_time_per_request = registry.add(Histogram("db_time_per_request_seconds", "DB time per HTTP request.", ("route",)))
+
+# ---- Webhooks ----
+webhook_received = registry.add(Counter("webhook_events_received_total", "Webhook notifications accepted into the inbox.", ("provider",)))
+webhook_duplicates = registry.add(Counter("webhook_events_duplicate_total", "Webhook notifications dropped as duplicates.", ("provider",)))
+webhook_dedupe_memory_hits = registry.add(Counter("webhook_dedupe_memory_hits_total", "Duplicates answered from the in-process recent-key cache."))
+webhook_processed = registry.add(Counter("webhook_events_processed_total", "Inbox events applied by the workers, by outcome.", ("outcome",)))
+webhook_items = registry.add(Counter("webhook_items_handled_total", "Notification items applied to transactions/refunds."))
+webhook_items_skipped = registry.add(Counter("webhook_items_skipped_total", "Notification items the state machine refused, by reason.", ("reason",)))
+webhook_lag = registry.add(Histogram("webhook_processing_lag_seconds", "Time from receiving an event to applying it.", (), LAG_BUCKETS))
+
+
+# ---- per-request DB accounting ----
+
+class _RequestDB:
+    __slots__ = ("queries", "seconds", "scope")
+
+    def __init__(self, scope=None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.scope = scope
+
+
+_current: ContextVar[Optional[_RequestDB]] = ContextVar("metrics_request_db", default=None)
+
+
+def _route_template(scope) -> str:
+    # FastAPI puts the matched route in the scope; label by its template
+    # ("/api/v1/transactions/{tx_id}") so cardinality stays bounded
+    return getattr(scope.get("route"), "path", None) or "<unmatched>"
+
+
+def current_route() -> Optional[str]:
+    """"METHOD /route/template" of the request being served in this context, if any."""
+    req = _current.get()
+    if req is None or req.scope is None:
+        return None
+    return f'{req.scope["method"]} {_route_template(req.scope)}'
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Count statements and DB time for a (sync or async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("metrics_t0")
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        db_queries.inc(name)
+        db_time.inc(name, amount=elapsed)
+        req = _current.get()
+        if req is not None:
+            req.queries += 1
+            req.seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(ctx):
+        # a failed statement never reaches after_cursor_execute
+        if ctx.connection is not None:
+            stack = ctx.connection.info.get("metrics_t0")
+            if stack:
+                stack.pop()
+
+
+# ---- HTTP middleware ----
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead, streaming untouched)."""
+
+    def __init__(self, app, skip_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        status = 500
+        req = _RequestDB(scope)
+        token = _current.set(req)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_progress.inc(amount=1)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            http_in_progress.inc(amount=-1)
+            _current.reset(token)
+            template = _route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, template, str(status))
+            http_latency.observe(elapsed, method, template)
+            db_queries_per_request.observe(req.queries, template)
+            db_time_per_request.observe(req.seconds, template)
+
+
+# ---- scrape-time collectors for stats kept elsewhere ----
+
+def _pool_lines() -> List[str]:
+    from .db_pool import pool_stats
+
+    out = [
+        "# HELP db_pool_checked_out Connections currently checked out.",
+        "# TYPE db_pool_checked_out gauge",
+    ]
+    snaps = {name: s.snapshot() for name, s in pool_stats.items()}
+    for name, s in snaps.items():
+        if s["checked_out"] is not None:
+            out.append(f'db_pool_checked_out{{engine="{name}"}} {s["checked_out"]}')
+    out += ["# HELP db_pool_timeouts_total Connection checkout timeouts.", "# TYPE db_pool_timeouts_total counter"]
+    for name, s in snaps.items():
+        out.append(f'db_pool_timeouts_total{{engine="{name}"}} {s["timeouts"]}')
+    return out
+
+
+def _merchant_cache_lines() -> List[str]:
+    from .services.merchant_cache import merchant_cache
+
+    s = merchant_cache.stats()
+    out = []
+    for key, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+        name = f"merchant_cache_{key}" + ("_total" if kind == "counter" else "")
+        out += [f"# HELP {name} Merchant cache {key}.", f"# TYPE {name} {kind}", f"{name} {s[key]}"]
+    return out
+
+
+registry.collectors += [_pool_lines, _merchant_cache_lines]
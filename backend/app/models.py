@@ -1,10 +1,10 @@
 # backend/app/models.py
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, func
+from sqlalchemy import BigInteger, Date, String, Integer, Float, DateTime, ForeignKey, LargeBinary, Text, Index, func
 from sqlalchemy.sql import func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -27,22 +27,38 @@ class Transaction(Base):
     __tablename__ = "transactions"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    merchant_id: Mapped[int] = mapped_column(ForeignKey("merchants.id"), index=True)
-    amount_cents: Mapped[int] = mapped_column(Integer)
-    currency: Mapped[str] = mapped_column(String(3), default="USD")
-    status: Mapped[str] = mapped_column(String(30), default="created")  # created|authorised|captured|refunded|failed
-    psp_reference: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    merchant_id: Mapped[int] = mapped_column(ForeignKey("merchants.id"))
+    # active_history (amount, currency, status): the old value is loaded before an
+    # overwrite so the daily rollup hook (services/daily_stats.py) always knows
+    # which bucket the transaction moved out of, and with how much
+    amount_cents: Mapped[int] = mapped_column(Integer, active_history=True)
+    currency: Mapped[str] = mapped_column(String(3), default="USD", active_history=True)
+    status: Mapped[str] = mapped_column(String(30), default="created", active_history=True)  # created|authorised|captured|refunded|failed
+    psp_reference: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # bumped by every status change (services/transitions.py), which only applies on top of the version it read
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     merchant: Mapped[Merchant] = relationship("Merchant", back_populates="transactions")
     refunds: Mapped[List["Refund"]] = relationship("Refund", back_populates="tx")
 
+    # Admin table / CSV export filter on status, merchant_id and a created_at
+    # range, always ORDER BY id DESC. The trailing id lets the index satisfy
+    # the sort, so "latest N" stops after N rows.
+    __table_args__ = (
+        Index("ix_transactions_merchant_id_id", "merchant_id", "id"),
+        Index("ix_transactions_status_id", "status", "id"),
+        Index("ix_transactions_merchant_id_status_id", "merchant_id", "status", "id"),
+        # status + created_at range (no merchant): narrow by both, then sort
+        Index("ix_transactions_status_created_at", "status", "created_at"),
+    )
+
 # --- NEW: simple Refund model ---
 class Refund(Base):
     __tablename__ = "refunds"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    tx_id: Mapped[int] = mapped_column(ForeignKey("transactions.id"), index=True)
+    tx_id: Mapped[int] = mapped_column(ForeignKey("transactions.id"))
     amount_cents: Mapped[int] = mapped_column(Integer)
     currency: Mapped[str] = mapped_column(String(3), default="USD")
     status: Mapped[str] = mapped_column(String(20), default="requested")  # requested|refunded|failed
@@ -51,6 +67,11 @@ class Refund(Base):
 
     tx: Mapped["Transaction"] = relationship("Transaction", back_populates="refunds")
 
+    # webhook REFUND items look up "newest refund for this tx"
+    __table_args__ = (
+        Index("ix_refunds_tx_id_id", "tx_id", "id"),
+    )
+
 
 # ---------- Payouts ----------
 class Payout(Base):
@@ -58,12 +79,34 @@ class Payout(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     merchant_id: Mapped[int] = mapped_column(ForeignKey("merchants.id"), index=True)
-    amount_cents: Mapped[int] = mapped_column(Integer)
+    amount_cents: Mapped[int] = mapped_column(BigInteger)
     currency: Mapped[str] = mapped_column(String(3), default="USD")
-    status: Mapped[str] = mapped_column(String(30), default="scheduled")  # scheduled|paid|failed
+    status: Mapped[str] = mapped_column(String(30), default="scheduled")  # scheduled|carried|paid|failed
     scheduled_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    run_id: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)  # payout job run that created it
+    # "carried" (amount <= 0, refunds outweighed captures): the later payout that took the balance over
+    carried_into: Mapped[Optional[int]] = mapped_column(ForeignKey("payouts.id"), nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
+    # one payout per merchant and currency per run; the job links items through it
+    __table_args__ = (
+        Index("ix_payouts_run_id_merchant_id_currency", "run_id", "merchant_id", "currency", unique=True),
+    )
+
+# ---------- Payout items (see app/services/payouts.py) ----------
+# What each payout was made of: +amount for a captured transaction, -refund
+# for a refunded one that an earlier payout included. The primary key makes
+# sure a transaction is paid (and clawed back) at most once. No FK to
+# transactions: rows are only written by INSERT .. SELECT from transactions,
+# which are never deleted, and the per-row check was a third of a payout run.
+class PayoutItem(Base):
+    __tablename__ = "payout_items"
+
+    transaction_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(10), primary_key=True)  # capture|refund
+    payout_id: Mapped[int] = mapped_column(ForeignKey("payouts.id"), index=True)
+    amount_cents: Mapped[int] = mapped_column(BigInteger, nullable=False)  # signed
+
 # ---------- Webhook raw events ----------
 class WebhookEvent(Base):
     __tablename__ = "webhook_events"
@@ -72,10 +115,89 @@ class WebhookEvent(Base):
     provider: Mapped[str] = mapped_column(String(50), nullable=False)  # e.g. "adyen"
     event_key: Mapped[str] = mapped_column(String(256), nullable=False, unique=True)  # idempotency key
     signature: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)       # hex HMAC (if sent)
-    raw_json: Mapped[str] = mapped_column(Text, nullable=False)                        # raw request body
-    headers: Mapped[Optional[str]] = mapped_column(Text, nullable=True)                # JSON-dumped headers
+    # body: zlib in raw_body (services/webhook_storage.py); rows from before that keep text in "raw_json"
+    raw_body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    raw_encoding: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)    # zlib|identity
+    raw_text: Mapped[Optional[str]] = mapped_column("raw_json", Text, nullable=True)  # legacy, uncompressed
+    headers: Mapped[Optional[str]] = mapped_column(Text, nullable=True)                # JSON of allowlisted headers
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    # Inbox state: the endpoint only appends "pending" rows, workers do the rest
+    status: Mapped[str] = mapped_column(String(20), default="pending", server_default="pending", nullable=False)  # pending|processing|processed|failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    claim_token: Mapped[Optional[str]] = mapped_column(String(32), nullable=True, index=True)
+    claimed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    next_attempt_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)  # retry backoff
+
+    __table_args__ = (
+        Index("ix_webhook_events_status_id", "status", "id"),
+    )
+
+    @property
+    def raw_json(self) -> Optional[str]:
+        """The raw request body as text, whichever way it is stored."""
+        if self.raw_body is not None:
+            from .services.webhook_storage import decode_body
+            return decode_body(self.raw_body, self.raw_encoding)
+        return self.raw_text
+
+    @raw_json.setter
+    def raw_json(self, body) -> None:
+        from .services.webhook_storage import encode_body
+        self.raw_body, self.raw_encoding = encode_body(body)
+        self.raw_text = None
+
+# ---------- Webhook event -> transactions it names ----------
+# One row per (transaction, event), written at ingest in the same transaction
+# as the event: workers apply each transaction's events in id order
+# (services/webhook_worker.py). No FK to transactions, a notification may
+# name one we don't have.
+class WebhookEventTx(Base):
+    __tablename__ = "webhook_event_txs"
+
+    tx_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    event_id: Mapped[int] = mapped_column(ForeignKey("webhook_events.id"), primary_key=True, index=True)
+
+# ---------- Rate limiter buckets (shared "db" backend, see ratelimit.py) ----------
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)   # "<limiter>:<client ip>"
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)  # unix time of last refill
+
+# ---------- Idempotency-Key responses (see services/idempotency.py) ----------
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope: Mapped[str] = mapped_column(String(100), primary_key=True)  # "POST /api/v1/transactions/"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)    # client's Idempotency-Key header
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256 of the request body
+    status: Mapped[str] = mapped_column(String(20), nullable=False)        # in_progress|done
+    response_status: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    locked_at: Mapped[float] = mapped_column(Float, nullable=False)                # unix time the claim was taken
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)  # unix time
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
+# ---------- Dashboard rollup (maintained by app/services/daily_stats.py) ----------
+class MerchantDailyStat(Base):
+    __tablename__ = "merchant_daily_stats"
+
+    merchant_id: Mapped[int] = mapped_column(ForeignKey("merchants.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)           # transaction's created_at day
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    status: Mapped[str] = mapped_column(String(30), primary_key=True)   # transaction's current status
+    tx_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    amount_cents: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+
+    # whole-platform reads go by day range
+    __table_args__ = (
+        Index("ix_merchant_daily_stats_day", "day"),
+    )
+
 # --- Refund requests ----------------------------------------------------------
 from sqlalchemy import ForeignKey, String, Integer, DateTime, Text  # (already imported above in your file)
 from sqlalchemy.sql import func
@@ -91,3 +213,8 @@ class RefundRequest(Base):
     requested_by: Mapped[str] = mapped_column(String(64), default="admin", nullable=False)
     status: Mapped[str] = mapped_column(String(32), default="refund_requested", nullable=False)  # reserved if you ever add a review step
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+# keeps merchant_daily_stats in step with ORM writes to transactions
+from .services import daily_stats  # noqa: E402,F401
+# FTS5 tables / prefix + trigram indexes for the admin search box (after create_all)
+from .services import search  # noqa: E402,F401
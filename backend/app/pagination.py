@@ -0,0 +1,50 @@
+# backend/app/pagination.py
+# Keyset (cursor) pagination keyed on transactions.id.
+#
+# Lists are always ordered newest first (id desc), so a page is
+# "the next N rows with id < last id seen". That is an index range scan no
+# matter how deep you go, unlike OFFSET which reads and throws away rows.
+import base64
+import json
+from typing import Optional, Sequence, Tuple
+
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque cursor for clients; don't let them depend on it being an id."""
+    raw = json.dumps({"id": int(last_id)}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Return the id inside a cursor, None for empty. Raises ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return int(json.loads(raw)["id"])
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+def keyset_query(q, id_col, limit: int, after: Optional[int] = None, before: Optional[int] = None):
+    """Restrict a query/select to one page (plus one look-ahead row).
+
+    after  -> older rows (id < after), newest first
+    before -> newer rows (id > before); fetched ascending, see finish_page()
+    """
+    if before is not None:
+        return q.where(id_col > before).order_by(id_col.asc()).limit(limit + 1)
+    if after is not None:
+        q = q.where(id_col < after)
+    return q.order_by(id_col.desc()).limit(limit + 1)
+
+
+def finish_page(rows: Sequence, limit: int, after: Optional[int] = None, before: Optional[int] = None) -> Tuple[list, bool, bool]:
+    """Trim the look-ahead row and return (rows newest first, has_prev, has_next)."""
+    rows = list(rows)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after is not None, more
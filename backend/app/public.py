@@ -1,40 +1,34 @@
-from fastapi import APIRouter, Request, Depends, Form
+import json
+
+from fastapi import APIRouter, Request, Depends, Form, Header, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from pathlib import Path
+from .templating import templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from .db import SessionLocal
+from .db import get_async_db
 from . import models
+from .services import idempotency
+from .services.merchant_cache import merchant_cache
 
 router = APIRouter(prefix="", tags=["public"], include_in_schema=False)
-TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.get("/checkout", response_class=HTMLResponse)
-def checkout_form(
+async def checkout_form(
     request: Request,
     merchant_id: int,
     amount: float = 25.00,
     currency: str = "USD",
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    m = db.get(models.Merchant, merchant_id)
+    m = await merchant_cache.get_async(db, merchant_id)
     amount_cents = int(round(amount * 100))
     return templates.TemplateResponse(
         "public/checkout.html",
         {
             "request": request,
             "merchant_id": merchant_id,
-            "merchant": m,  # NEW: pass the merchant object
+            "merchant": m,  # cached MerchantSnapshot (or None)
             "amount_cents": amount_cents,
             "display_amount": f"{amount:.2f}",
             "currency": currency,
@@ -43,7 +37,7 @@ def checkout_form(
 
 
 @router.post("/checkout", response_class=HTMLResponse)
-def checkout_submit(
+async def checkout_submit(
     request: Request,
     merchant_id: int = Form(...),
     # accept all the ways the form may send amount
@@ -51,10 +45,10 @@ def checkout_submit(
     amount_dollars: Optional[float] = Form(None),
     amount_cents: Optional[int] = Form(None),
     currency: str = Form("USD"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     # 1) basic checks
-    m = db.get(models.Merchant, merchant_id)
+    m = await merchant_cache.get_async(db, merchant_id)
     if not m:
         return templates.TemplateResponse(
             "public/checkout.html",
@@ -96,67 +90,73 @@ def checkout_submit(
         psp_reference="PSP_TEST_PUBLIC",
     )
     db.add(tx)
-    db.commit()
-    db.refresh(tx)
+    await db.commit()
+    await db.refresh(tx)
 
     return RedirectResponse(url=f"/success?tx_id={tx.id}", status_code=303)
 
 
 
 @router.get("/success", response_class=HTMLResponse)
-def success_page(
+async def success_page(
     request: Request,
     tx_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     # Try to load the transaction if a tx_id was provided. If not found, keep tx=None.
     tx = None
     if tx_id is not None:
-        tx = db.get(models.Transaction, tx_id)
+        tx = await db.get(models.Transaction, tx_id)
     return templates.TemplateResponse("public/success.html", {"request": request, "tx": tx})
 
 @router.post("/checkout.json")
-def checkout_json(
+async def checkout_json(
     request: Request,
     merchant_id: int = Form(...),
     amount: Optional[float] = Form(None),
     amount_dollars: Optional[float] = Form(None),
     amount_cents: Optional[int] = Form(None),
     currency: str = Form("USD"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    # 1) merchant exists?
-    m = db.get(models.Merchant, merchant_id)
-    if not m:
-        raise HTTPException(404, "Merchant not found")
-
-    # 2) normalize amount
-    if amount_dollars is not None:
-        amount = float(amount_dollars)
-    elif amount_cents is not None:
-        amount = round((amount_cents or 0) / 100.0, 2)
-
-    # 3) validate
-    if amount is None or amount <= 0:
-        raise HTTPException(400, "Amount must be > 0")
-    if currency != "USD":
-        raise HTTPException(400, "Only USD supported right now")
+    async def work():
+        nonlocal amount
+        # 1) merchant exists?
+        m = await merchant_cache.get_async(db, merchant_id)
+        if not m:
+            raise HTTPException(404, "Merchant not found")
+
+        # 2) normalize amount
+        if amount_dollars is not None:
+            amount = float(amount_dollars)
+        elif amount_cents is not None:
+            amount = round((amount_cents or 0) / 100.0, 2)
 
-    # 4) create tx (authorised by default in this demo)
-    cents = int(round(amount * 100))
-    tx = models.Transaction(
-        merchant_id=merchant_id,
-        amount_cents=cents,
-        currency=currency,
-        status="authorised",
-        psp_reference="PSP_TEST_PUBLIC",
-    )
-    db.add(tx)
-    db.commit()
-    db.refresh(tx)
-
-    return {
-        "ok": True,
-        "tx_id": tx.id,
-        "redirect_url": f"/public/success?tx_id={tx.id}",
-    }
+        # 3) validate
+        if amount is None or amount <= 0:
+            raise HTTPException(400, "Amount must be > 0")
+        if currency != "USD":
+            raise HTTPException(400, "Only USD supported right now")
+
+        # 4) create tx (authorised by default in this demo)
+        cents = int(round(amount * 100))
+        tx = models.Transaction(
+            merchant_id=merchant_id,
+            amount_cents=cents,
+            currency=currency,
+            status="authorised",
+            psp_reference="PSP_TEST_PUBLIC",
+        )
+        db.add(tx)
+        await db.flush()
+
+        return 200, {
+            "ok": True,
+            "tx_id": tx.id,
+            "redirect_url": f"/public/success?tx_id={tx.id}",
+        }
+
+    # mobile clients retry on flaky networks; the same Idempotency-Key replays the first result
+    fingerprint = json.dumps([merchant_id, amount, amount_dollars, amount_cents, currency])
+    return await idempotency.respond(db, idempotency_key, "POST /checkout.json", fingerprint, work)
@@ -0,0 +1,138 @@
+# backend/app/ratelimit.py
+# Token-bucket rate limiting with bounded memory.
+#
+# Each key (e.g. "admin:1.2.3.4") holds just (tokens, last refill time), so a
+# client costs O(1) memory no matter how many requests it sends. Buckets
+# refill continuously at limit/window tokens per second.
+#
+# Backends:
+#   MemoryBackend - per process, LRU capped at RATE_LIMIT_MAX_KEYS, idle keys dropped
+#   SQLBackend    - one row per key in rate_limit_buckets, shared by every uvicorn
+#                   worker; a single INSERT .. ON CONFLICT DO UPDATE .. RETURNING per hit
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import case, delete
+
+from .config import settings
+from . import models
+
+
+def parse_rate(text: Optional[str], default: Tuple[int, int] = (20, 60)) -> Tuple[int, int]:
+    """"20/m", "100/5m", "30/s" -> (limit, window_seconds)."""
+    try:
+        num, per = text.strip().lower().split("/")
+        limit = int(num)
+        if per.endswith("s"):
+            window = int(per[:-1] or 1)
+        elif per.endswith("m"):
+            window = int(per[:-1] or 1) * 60
+        elif per.endswith("h"):
+            window = int(per[:-1] or 1) * 3600
+        else:
+            window = 60
+        return limit, int(window)
+    except Exception:
+        return default
+
+
+class MemoryBackend:
+    blocking = False  # cheap enough to call on the event loop
+
+    def __init__(self, max_keys: int, idle_seconds: float):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [capacity, now]
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(capacity, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            allowed = b[0] >= 1
+            if allowed:
+                b[0] -= 1
+            retry_after = 0.0 if allowed else (1 - b[0]) / rate
+            self._evict(now)
+            return allowed, retry_after
+
+    def _evict(self, now: float) -> None:
+        # least recently used first: drop over-cap keys, then idle ones
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        while self._buckets:
+            key, b = next(iter(self._buckets.items()))
+            if now - b[1] < self.idle_seconds:
+                break
+            del self._buckets[key]
+
+
+class SQLBackend:
+    blocking = True  # sync DB round trip -> run in the threadpool
+    PRUNE_EVERY = 1000
+
+    def __init__(self, engine, idle_seconds: float):
+        self.engine = engine
+        self.idle_seconds = idle_seconds
+        self._calls = 0
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        from .db import dialect_insert
+
+        t = models.RateLimitBucket.__table__
+        refilled = t.c.tokens + (now - t.c.updated_at) * rate
+        refilled = case((refilled > capacity, capacity), else_=refilled)
+        stmt = (
+            dialect_insert(self.engine)(t)
+            .values(key=key, tokens=capacity - 1, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=[t.c.key],
+                set_={"tokens": refilled - 1, "updated_at": now},
+                where=refilled >= 1,
+            )
+            .returning(t.c.key)
+        )
+        with self.engine.begin() as conn:
+            allowed = conn.execute(stmt).first() is not None
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                conn.execute(delete(t).where(t.c.updated_at < now - self.idle_seconds))
+        return allowed, 0.0 if allowed else 1 / rate
+
+
+class RateLimiter:
+    def __init__(self, name: str, limit: int, window_seconds: int, backend):
+        self.name = name
+        self.limit = limit
+        self.window = window_seconds
+        self.rate = limit / float(window_seconds)  # tokens per second
+        self.backend = backend
+
+    def hit(self, client_key: str) -> Tuple[bool, int]:
+        """Take one token for this client. Returns (allowed, retry_after_seconds)."""
+        allowed, retry_after = self.backend.take(
+            f"{self.name}:{client_key}", float(self.limit), self.rate, time.time()
+        )
+        return allowed, max(1, int(retry_after + 0.999))
+
+
+def make_backend():
+    if settings.RATE_LIMIT_BACKEND == "db":
+        from .db import engine
+        return SQLBackend(engine, settings.RATE_LIMIT_IDLE_SECONDS)
+    return MemoryBackend(settings.RATE_LIMIT_MAX_KEYS, settings.RATE_LIMIT_IDLE_SECONDS)
+
+
+_backend = make_backend()
+admin_limiter = RateLimiter("admin", *parse_rate(settings.ADMIN_RATE_LIMIT or "20/m"), _backend)
+webhook_limiter = RateLimiter("webhook", *parse_rate(settings.WEBHOOK_RATE_LIMIT, (300, 60)), _backend)
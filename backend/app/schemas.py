@@ -31,6 +31,21 @@ class TransactionOut(BaseModel):
     class Config:
         from_attributes = True
 
+class TransactionBatchCreate(BaseModel):
+    # items are validated one by one in the route so a bad item only fails itself
+    items: list[dict]
+
+class TransactionBatchResult(BaseModel):
+    index: int                      # position in the request's items
+    ok: bool
+    transaction: Optional[TransactionOut] = None
+    error: Optional[str] = None
+
+class TransactionBatchOut(BaseModel):
+    created: int
+    failed: int
+    results: list[TransactionBatchResult]
+
 class WebhookNotification(BaseModel):
     live: str
     notificationItems: list
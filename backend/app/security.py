@@ -3,8 +3,9 @@ import os
 import secrets
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from collections import deque
-import time
+from fastapi.concurrency import run_in_threadpool
+
+from .ratelimit import RateLimiter, admin_limiter, webhook_limiter
 
 http_basic = HTTPBasic()
 
@@ -40,32 +41,23 @@ async def require_webhook_auth(credentials: HTTPBasicCredentials = Depends(http_
         )
     return True
 
-# ---- Tiny in-memory rate limiter (per IP) for webhooks ----
-_visits = {}  # ip -> deque[timestamps]
-
-def webhook_rate_limit(max_requests: int = 10, window_seconds: int = 60):
-    async def _limiter(request: Request):
-        ip = request.client.host if request.client else "unknown"
-        now = time.time()
-        dq = _visits.get(ip)
-        if dq is None:
-            dq = deque()
-            _visits[ip] = dq
-        # drop old timestamps outside the window
-        while dq and (now - dq[0] > window_seconds):
-            dq.popleft()
-        dq.append(now)
-        if len(dq) > max_requests:
-            raise HTTPException(status_code=429, detail="Too many requests")
-    return _limiter
+# ---- /metrics: bearer token for scrapers, or the admin login ----
+async def require_metrics_access(request: Request):
+    from .config import settings
+
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get("authorization", "")
+    if token and auth.lower().startswith("bearer ") and secrets.compare_digest(auth[7:].strip(), token):
+        return True
+    return await require_admin(await http_basic(request))
+
+# ---- Rate limit (per IP) for webhooks ----
+async def webhook_rate_limit(request: Request):
+    await _enforce(webhook_limiter, request, "Too many requests")
 
 
 # ==== Admin IP allow-list + rate limit (simple) ==============================
 import os
-import time
-from collections import deque
-from threading import Lock
-from typing import Deque, Dict
 from fastapi import Request, HTTPException, status
 
 def _client_ip(request: Request) -> str:
@@ -73,7 +65,7 @@ def _client_ip(request: Request) -> str:
     xff = request.headers.get("x-forwarded-for")
     if xff:
         return xff.split(",")[0].strip()
-    return (request.client.host or "unknown")
+    return request.client.host if request.client else "unknown"
 
 # ----- IP allow-list (optional) -----
 # ADMIN_IP_ALLOWLIST can be:
@@ -95,41 +87,24 @@ def check_admin_ip(request: Request):
 
 # ----- Rate limit (per IP) -----
 # ADMIN_RATE_LIMIT examples: "20/m", "100/5m", "30/s"
-_RATE_RAW = os.getenv("ADMIN_RATE_LIMIT", "20/m").strip().lower()
-
-def _parse_rate(text: str) -> tuple[int, int]:
-    # returns: (limit, window_seconds)
-    try:
-        num, per = text.split("/")
-        limit = int(num)
-        if per.endswith("s"):
-            window = int(per[:-1])
-        elif per.endswith("m"):
-            window = int(per[:-1]) * 60
-        else:
-            window = 60
-        return limit, int(window)
-    except Exception:
-        return 20, 60  # fallback: 20 per 60 seconds
-
-_LIMIT, _WINDOW = _parse_rate(_RATE_RAW)
-
-_hits: Dict[str, Deque[float]] = {}
-_hits_lock = Lock()
-
-def rate_limit_admin(request: Request):
-    """Simple fixed-window sliding limiter per IP."""
-    now = time.time()
+# Token buckets from app/ratelimit.py; RATE_LIMIT_BACKEND=db shares them across workers.
+
+async def _enforce(limiter: RateLimiter, request: Request, detail: str):
     ip = _client_ip(request)
-    with _hits_lock:
-        dq = _hits.setdefault(ip, deque())
-        # drop old timestamps
-        while dq and (now - dq[0]) > _WINDOW:
-            dq.popleft()
-        if len(dq) >= _LIMIT:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Too many admin requests. Limit is {_LIMIT} per {_WINDOW}s.",
-                headers={"Retry-After": str(_WINDOW)},
-            )
-        dq.append(now)
+    if limiter.backend.blocking:
+        allowed, retry_after = await run_in_threadpool(limiter.hit, ip)
+    else:
+        allowed, retry_after = limiter.hit(ip)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+async def rate_limit_admin(request: Request):
+    """Token bucket per IP: ADMIN_RATE_LIMIT requests per window, refilled continuously."""
+    await _enforce(
+        admin_limiter, request,
+        f"Too many admin requests. Limit is {admin_limiter.limit} per {admin_limiter.window}s.",
+    )
@@ -0,0 +1,188 @@
+# backend/app/services/count_cache.py
+# Row counts for the admin transactions table ("Page X of Y").
+#
+# An exact COUNT(*) over a big filtered set can cost more than the page
+# itself, so:
+#
+#   - no filter: the planner's row estimate (EXPLAIN on Postgres, which scales
+#     pg_class.reltuples to the table's current size; max(id) on SQLite),
+#     shown as "~N"
+#   - filters: a count that stops at ADMIN_EXACT_COUNT_MAX + 1 rows. Past
+#     that the UI drops "of Y" and pages on has-next only (the page query's
+#     look-ahead row); on Postgres an EXPLAIN estimate over the limit skips
+#     even that
+#   - small sets (under the limit, estimate or not) get an exact count
+#
+# Results are cached per process for ADMIN_COUNT_TTL_SECONDS, keyed by the
+# normalized filters. Every committed INSERT/UPDATE/DELETE on transactions
+# bumps a write version (engine events below) and exact counts from an older
+# version are recounted, so this process's own writes show up at once, other
+# processes' within the TTL. Estimates and "over" stand until the TTL: a
+# write doesn't make them any less approximate, and on a busy table they'd
+# never be reused otherwise.
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .. import models
+
+T = models.Transaction
+
+
+# ---- write version ----
+
+_version = itertools.count(1)
+write_version = 0
+
+
+def _bump() -> None:
+    global write_version
+    write_version = next(_version)
+
+
+def _writes_transactions(context) -> bool:
+    if not (context.isinsert or context.isupdate or context.isdelete):
+        return False
+    table = getattr(getattr(context.compiled, "statement", None), "table", None)
+    return getattr(table, "name", None) == T.__tablename__
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and context.compiled is not None and _writes_transactions(context):
+        conn.info["count_cache_dirty"] = True
+
+
+@event.listens_for(Engine, "commit")
+def _after_commit(conn):
+    if conn.info.pop("count_cache_dirty", False):
+        _bump()
+
+
+@event.listens_for(Engine, "rollback")
+def _after_rollback(conn):
+    conn.info.pop("count_cache_dirty", None)
+
+
+# ---- counts ----
+
+@dataclass(frozen=True)
+class Count:
+    value: int
+    kind: str  # exact | estimate ("~N") | over (more than `value`, page on has-next)
+
+    def pages(self, per_page: int) -> Optional[int]:
+        if self.kind == "over":
+            return None
+        return max(1, (self.value + per_page - 1) // per_page)
+
+    @property
+    def label(self) -> str:
+        if self.kind == "estimate":
+            return f"~{self.value:,}"
+        if self.kind == "over":
+            return f"{self.value:,}+"
+        return f"{self.value:,}"
+
+
+def filter_key(filters: dict) -> Tuple:
+    """Same filters -> same key: empty values dropped, dates as ISO strings, sorted."""
+    out = []
+    for k, v in sorted(filters.items()):
+        if v is None or v == "":
+            continue
+        if isinstance(v, (date, datetime)):
+            v = v.isoformat()
+        elif isinstance(v, str):
+            v = v.strip()
+        out.append((k, v))
+    return tuple(out)
+
+
+def estimate(db: Session, stmt) -> Optional[int]:
+    """Planner row estimate for a SELECT (Postgres), None elsewhere."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    compiled = stmt.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def capped_count(db: Session, stmt, cap: int) -> int:
+    """COUNT(*) of stmt's rows that reads at most cap + 1 of them."""
+    return db.execute(select(func.count()).select_from(stmt.limit(cap + 1).subquery())).scalar_one()
+
+
+class CountCache:
+    def __init__(self, max_size: int, ttl: float, exact_max: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.exact_max = exact_max
+        self._data: "OrderedDict[Tuple, Tuple[float, int, Count]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _compute(self, db: Session, key: Tuple, apply_filters: Callable) -> Count:
+        stmt = apply_filters(select(T.id))
+        est = estimate(db, stmt)
+        if est is None and not key and db.get_bind().dialect.name == "sqlite":
+            est = db.execute(select(func.max(T.id))).scalar() or 0
+        if est is not None and est > self.exact_max:
+            return Count(est, "estimate") if not key else Count(self.exact_max, "over")
+        n = capped_count(db, stmt, self.exact_max)
+        return Count(self.exact_max, "over") if n > self.exact_max else Count(n, "exact")
+
+    def get(self, db: Session, filters: dict, apply_filters: Callable) -> Count:
+        """Count for the transactions matching `filters`; apply_filters(select) adds their WHERE."""
+        key = filter_key(filters)
+        now = time.monotonic()
+        version = write_version
+        with self._lock:
+            entry = self._data.get(key)
+            # approximate answers don't go stale on a write, exact ones do
+            if entry is not None and entry[0] > now and (entry[2].kind != "exact" or entry[1] == version):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        count = self._compute(db, key, apply_filters)
+        with self._lock:
+            self._data[key] = (now + self.ttl, version, count)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "exact_max": self.exact_max,
+                "write_version": write_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+transaction_counts = CountCache(
+    settings.ADMIN_COUNT_CACHE_SIZE,
+    settings.ADMIN_COUNT_TTL_SECONDS,
+    settings.ADMIN_EXACT_COUNT_MAX,
+)
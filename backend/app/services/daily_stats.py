@@ -0,0 +1,236 @@
+# backend/app/services/daily_stats.py
+# merchant_daily_stats: per (merchant, day, currency, status) counts and cents.
+#
+# A transaction lives in exactly one row: the day it was created, under its
+# current status and currency. Inserting a transaction adds +1 there; a
+# change of status, amount or currency moves it (-1 and the old amount under
+# the old values, +1 and the new amount under the new ones). Dashboard reads
+# then scan O(days x merchants) rows instead of the transactions table.
+#
+# ORM writes are covered by the after_flush hook below (checkout, confirm,
+# webhook workers, admin refunds all go through a Session). Core INSERT /
+# UPDATE statements bypass it and must call record_inserted() or add_deltas()
+# (with the old and new values) themselves, in the same transaction.
+# rebuild() recomputes from scratch.
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Date, delete, event, func, inspect, select, text, true
+from sqlalchemy.orm import Session
+
+from ..db import dialect_insert
+from .. import models
+
+T = models.Transaction
+S = models.MerchantDailyStat
+
+# statuses that mean "the PSP approved it at some point"
+APPROVED = ("authorised", "captured", "refunded", "refund_requested")
+REFUNDED = ("refunded",)
+
+_day = func.date(T.created_at)
+day_of = func.date(T.created_at, type_=Date)  # same, read back as a date
+_currency = func.coalesce(T.currency, "USD")
+_status = func.coalesce(T.status, "created")
+
+
+def _grouped(*where):
+    """SELECT of rollup rows (+count, +cents) for the transactions matching `where`."""
+    return (
+        select(
+            T.merchant_id,
+            _day,
+            _currency,
+            _status,
+            func.count(),
+            func.coalesce(func.sum(T.amount_cents), 0),
+        )
+        .where(*where)
+        .group_by(T.merchant_id, _day, _currency, _status)
+    )
+
+
+def _upsert(bind, select_stmt):
+    ins = dialect_insert(bind)(S).from_select(
+        ["merchant_id", "day", "currency", "status", "tx_count", "amount_cents"], select_stmt
+    )
+    return ins.on_conflict_do_update(
+        index_elements=[S.merchant_id, S.day, S.currency, S.status],
+        set_={
+            "tx_count": S.tx_count + ins.excluded.tx_count,
+            "amount_cents": S.amount_cents + ins.excluded.amount_cents,
+        },
+    )
+
+
+def record_inserted(bind, tx_ids: Iterable[int]):
+    """Statement adding freshly inserted transactions to the rollup."""
+    return _upsert(bind, _grouped(T.id.in_(list(tx_ids))))
+
+
+def add_deltas(conn, deltas: Dict[tuple, List[int]]) -> None:
+    """Add precomputed (merchant_id, day, currency, status) -> [count, cents] deltas.
+
+    For bulk writers that already know each transaction's old and new values.
+    Rows go in key order, so concurrent callers lock rollup rows in the same
+    order and can't deadlock each other.
+    """
+    rows = [
+        {"merchant_id": k[0], "day": k[1], "currency": k[2], "status": k[3], "tx_count": v[0], "amount_cents": v[1]}
+        for k, v in sorted(deltas.items()) if v[0] or v[1]
+    ]
+    if not rows:
+        return
+    ins = dialect_insert(conn)(S)
+    conn.execute(ins.on_conflict_do_update(
+        index_elements=[S.merchant_id, S.day, S.currency, S.status],
+        set_={
+            "tx_count": S.tx_count + ins.excluded.tx_count,
+            "amount_cents": S.amount_cents + ins.excluded.amount_cents,
+        },
+    ), rows)
+
+
+# ---- ORM hook ----
+
+# what a rollup row is keyed/summed on that an UPDATE can change; each has
+# active_history on the model so the value it had before the flush is known
+_TRACKED = ("status", "amount_cents", "currency")
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    # Rows are written but "new"/"dirty" and attribute history still describe
+    # this flush, so we know exactly which transactions appeared or changed.
+    added: List[int] = []
+    before: Dict[int, dict] = {}  # id -> {column: value before this flush} for what changed
+    for obj in session.new:
+        if isinstance(obj, T):
+            added.append(obj.id)
+    for obj in session.dirty:
+        if not isinstance(obj, T):
+            continue
+        attrs = inspect(obj).attrs
+        old = {}
+        for name in _TRACKED:
+            hist = attrs[name].history
+            if hist.deleted and hist.added and hist.deleted[0] != hist.added[0]:
+                old[name] = hist.deleted[0]
+        if old:
+            before[obj.id] = old
+    if not added and not before:
+        return
+
+    conn = session.connection()
+    if added:
+        conn.execute(record_inserted(conn, added))
+    if before:
+        # the rows as just written give the new values (and the day, as the
+        # database computes it); history gives the old ones
+        deltas: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+        rows = conn.execute(
+            select(T.id, T.merchant_id, day_of.label("day"), T.status, T.amount_cents, T.currency)
+            .where(T.id.in_(list(before)))
+        )
+        for r in rows:
+            old = before[r.id]
+            for sign, status, amount, currency in (
+                (-1, old.get("status", r.status), old.get("amount_cents", r.amount_cents),
+                 old.get("currency", r.currency)),
+                (1, r.status, r.amount_cents, r.currency),
+            ):
+                d = deltas[(r.merchant_id, r.day, currency or "USD", status or "created")]
+                d[0] += sign
+                d[1] += sign * (amount or 0)
+        add_deltas(conn, deltas)
+
+
+# ---- rebuild / backfill ----
+
+def rebuild(engine, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Recompute the rollup (optionally only days start..end inclusive). Returns rows written.
+
+    Runs in one transaction. On Postgres the rollup table is locked first so
+    concurrent incremental updates wait and land on top of the rebuilt rows.
+    """
+    day_filter = []
+    tx_filter = []
+    if start:
+        day_filter.append(S.day >= start)
+        tx_filter.append(T.created_at >= datetime.combine(start, datetime.min.time()))
+    if end:
+        day_filter.append(S.day <= end)
+        tx_filter.append(T.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("LOCK TABLE merchant_daily_stats IN EXCLUSIVE MODE"))
+        conn.execute(delete(S).where(*day_filter))
+        conn.execute(_upsert(conn, _grouped(true(), *tx_filter)))
+        return conn.execute(select(func.count()).select_from(S).where(*day_filter)).scalar_one()
+
+
+# ---- reads ----
+
+def stats_query(merchant_id: Optional[int] = None, start: Optional[date] = None, end: Optional[date] = None):
+    """Rollup rows summed per (day, currency, status), optionally for one merchant."""
+    q = select(S.day, S.currency, S.status, func.sum(S.tx_count), func.sum(S.amount_cents))
+    if merchant_id is not None:
+        q = q.where(S.merchant_id == merchant_id)
+    if start:
+        q = q.where(S.day >= start)
+    if end:
+        q = q.where(S.day <= end)
+    return q.group_by(S.day, S.currency, S.status).order_by(S.day)
+
+
+def top_merchants_query(start: Optional[date] = None, end: Optional[date] = None, limit: int = 5):
+    """Merchants with the most approved volume in the window."""
+    vol = func.sum(S.amount_cents).label("volume_cents")
+    q = select(S.merchant_id, S.currency, vol, func.sum(S.tx_count).label("approved")).where(S.status.in_(APPROVED))
+    if start:
+        q = q.where(S.day >= start)
+    if end:
+        q = q.where(S.day <= end)
+    return q.group_by(S.merchant_id, S.currency).order_by(vol.desc()).limit(limit)
+
+
+def _rate(n: int, d: int) -> Optional[float]:
+    return round(n / d, 4) if d else None
+
+
+def summarize(rows) -> dict:
+    """Turn stats_query() rows into per-currency totals and a daily series."""
+    totals: Dict[str, dict] = {}
+    daily: Dict[tuple, dict] = {}
+    for day, currency, status, count, cents in rows:
+        count, cents = int(count or 0), int(cents or 0)
+        for bucket in (
+            totals.setdefault(currency, {"by_status": {}}),
+            daily.setdefault((day, currency), {"day": day.isoformat(), "currency": currency, "by_status": {}}),
+        ):
+            st = bucket["by_status"].setdefault(status, {"count": 0, "amount_cents": 0})
+            st["count"] += count
+            st["amount_cents"] += cents
+
+    def finish(bucket: dict) -> dict:
+        by = bucket["by_status"]
+        count = sum(v["count"] for v in by.values())
+        attempted = count - by.get("created", {}).get("count", 0)
+        approved = sum(by.get(s, {}).get("count", 0) for s in APPROVED)
+        refunded = sum(by.get(s, {}).get("count", 0) for s in REFUNDED)
+        bucket.update(
+            tx_count=count,
+            approved=approved,
+            volume_cents=sum(by.get(s, {}).get("amount_cents", 0) for s in APPROVED),
+            refunded_cents=sum(by.get(s, {}).get("amount_cents", 0) for s in REFUNDED),
+            approval_rate=_rate(approved, attempted),
+            refund_rate=_rate(refunded, approved),
+        )
+        return bucket
+
+    return {
+        "totals": {cur: finish(b) for cur, b in totals.items()},
+        "daily": [finish(b) for _, b in sorted(daily.items())],
+    }
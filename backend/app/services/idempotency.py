@@ -0,0 +1,228 @@
+# backend/app/services/idempotency.py
+# Idempotency-Key replay for the transaction-creating routes
+# (POST /api/v1/transactions/ and /checkout.json).
+#
+# The first request with a key claims a row in idempotency_keys (INSERT .. ON
+# CONFLICT DO NOTHING, committed before any work). Its handler then runs
+# without committing; the response status/body is written to the claim row
+# and committed in the same transaction as the new transaction row, so a
+# stored response always matches what was created.
+#
+# Retries with the same key get that stored response back (from a per-process
+# LRU first, then the table) without touching transactions. A duplicate that
+# arrives while the first is still running waits for it: on an in-process
+# asyncio.Event when both hit the same worker, by polling the row otherwise.
+# Errors (404, 400, crashes) release the claim, so the retry runs for real.
+#
+# Same key with a different body -> 422. Still running after
+# IDEMPOTENCY_WAIT_SECONDS -> 409. Claims older than
+# IDEMPOTENCY_LOCK_TIMEOUT_SECONDS (crashed worker) are taken over.
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..db import dialect_insert
+from ..metrics import registry, Counter
+from .. import models
+
+K = models.IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL = 300.0  # seconds between sweeps of expired rows
+REPLAY_HEADER = "Idempotent-Replayed"
+
+requests_total = registry.add(Counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key, by outcome.", ("outcome",)
+))
+
+# handler: does the work in the session without committing, returns (status, JSON-able body)
+Work = Callable[[], Awaitable[Tuple[int, object]]]
+
+
+class ResponseCache:
+    """(scope, key) -> (request_hash, status, body bytes, expires_at) for finished requests."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ck: tuple, now: float):
+        with self._lock:
+            entry = self._data.get(ck)
+            if entry is None:
+                return None
+            if entry[3] <= now:
+                del self._data[ck]
+                return None
+            self._data.move_to_end(ck)
+            return entry
+
+    def put(self, ck: tuple, request_hash: str, status: int, body: bytes, expires_at: float) -> None:
+        with self._lock:
+            self._data[ck] = (request_hash, status, body, expires_at)
+            self._data.move_to_end(ck)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+response_cache = ResponseCache(settings.IDEMPOTENCY_CACHE_SIZE)
+_inflight: Dict[tuple, asyncio.Event] = {}  # claims held by this process
+_last_purge = 0.0
+
+
+def request_hash(fingerprint: str) -> str:
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def _replay(status: int, body: bytes) -> Response:
+    return Response(body, status_code=status, media_type="application/json", headers={REPLAY_HEADER: "true"})
+
+
+def _check_hash(stored: str, req_hash: str) -> None:
+    if stored != req_hash:
+        requests_total.inc("mismatch")
+        raise HTTPException(422, "Idempotency-Key was already used with a different request")
+
+
+async def _claim(db: AsyncSession, scope: str, key: str, req_hash: str, now: float) -> bool:
+    ins = dialect_insert(db.get_bind())(K).values(
+        scope=scope, key=key, request_hash=req_hash, status="in_progress",
+        locked_at=now, expires_at=now + settings.IDEMPOTENCY_TTL_SECONDS,
+    ).on_conflict_do_nothing(index_elements=[K.scope, K.key]).returning(K.key)
+    # RETURNING rather than rowcount: async psycopg reports -1 for this INSERT
+    claimed = (await db.execute(ins)).scalar_one_or_none() is not None
+    await db.commit()
+    return claimed
+
+
+async def _take_over(db: AsyncSession, scope: str, key: str, row, req_hash: str, now: float) -> bool:
+    """Re-claim a row whose owner died (stale in_progress) or that expired."""
+    res = await db.execute(
+        update(K)
+        .where(K.scope == scope, K.key == key, K.status == row.status, K.locked_at == row.locked_at)
+        .values(request_hash=req_hash, status="in_progress", response_status=None, response_body=None,
+                locked_at=now, expires_at=now + settings.IDEMPOTENCY_TTL_SECONDS)
+    )
+    await db.commit()
+    return res.rowcount == 1
+
+
+async def _purge_expired(db: AsyncSession, now: float) -> None:
+    global _last_purge
+    if now - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = now
+    await db.execute(delete(K).where(K.expires_at < now))
+    await db.commit()
+
+
+async def respond(db: AsyncSession, key: Optional[str], scope: str, fingerprint: str, work: Work) -> Response:
+    """Run `work` once per (scope, key) and commit; replay its response for retries.
+
+    Without a key this is just work() + commit.
+    """
+    if key is None:
+        status, content = await work()
+        await db.commit()
+        return JSONResponse(content, status_code=status)
+
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    ck = (scope, key)
+    req_hash = request_hash(fingerprint)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    poll = 0.02
+    while True:
+        now = time.time()
+        hit = response_cache.get(ck, now)
+        if hit is not None:
+            _check_hash(hit[0], req_hash)
+            requests_total.inc("replayed")
+            return _replay(hit[1], hit[2])
+
+        event = _inflight.get(ck)
+        if event is not None:
+            # the original is running in this process: wait for it, then look again
+            try:
+                await asyncio.wait_for(event.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+            continue
+
+        event = _inflight[ck] = asyncio.Event()
+        try:
+            owned = await _claim(db, scope, key, req_hash, now)
+            if not owned:
+                row = (await db.execute(
+                    select(K.request_hash, K.status, K.response_status, K.response_body, K.locked_at, K.expires_at)
+                    .where(K.scope == scope, K.key == key)
+                )).one_or_none()
+                await db.rollback()
+                if row is None:
+                    continue  # released between our insert and read; try again
+                if row.expires_at <= now or (
+                    row.status == "in_progress" and now - row.locked_at > settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS
+                ):
+                    owned = await _take_over(db, scope, key, row, req_hash, now)
+                else:
+                    _check_hash(row.request_hash, req_hash)
+                    if row.status == "done":
+                        body = row.response_body.encode()
+                        response_cache.put(ck, row.request_hash, row.response_status, body, row.expires_at)
+                        requests_total.inc("replayed")
+                        return _replay(row.response_status, body)
+            if owned:
+                requests_total.inc("new")
+                return await _run_owned(db, scope, key, req_hash, work, now)
+        finally:
+            if _inflight.get(ck) is event:
+                del _inflight[ck]
+            event.set()
+
+        # another process holds the claim: poll until it finishes
+        if time.monotonic() + poll > deadline:
+            break
+        await asyncio.sleep(poll)
+        poll = min(poll * 2, 0.5)
+
+    requests_total.inc("in_progress")
+    raise HTTPException(409, "A request with this Idempotency-Key is still being processed", headers={"Retry-After": "1"})
+
+
+async def _run_owned(db: AsyncSession, scope: str, key: str, req_hash: str, work: Work, now: float) -> Response:
+    try:
+        status, content = await work()
+        response = JSONResponse(content, status_code=status)
+        expires_at = now + settings.IDEMPOTENCY_TTL_SECONDS
+        await db.execute(
+            update(K).where(K.scope == scope, K.key == key)
+            .values(status="done", response_status=status, response_body=response.body.decode(), expires_at=expires_at)
+        )
+        await db.commit()
+    except BaseException:
+        # nothing was created: drop the claim so a retry runs the request for real
+        await db.rollback()
+        await db.execute(delete(K).where(K.scope == scope, K.key == key, K.status == "in_progress"))
+        await db.commit()
+        raise
+    response_cache.put((scope, key), req_hash, status, response.body, expires_at)
+    try:
+        await _purge_expired(db, now)
+    except Exception:
+        await db.rollback()
+    return response
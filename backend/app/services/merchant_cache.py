@@ -0,0 +1,118 @@
+# backend/app/services/merchant_cache.py
+# Read-through, in-process cache of merchants for the checkout paths.
+#
+# Merchants almost never change, so checkout/transaction creation reads an
+# immutable snapshot from here instead of hitting the DB every time.
+# Entries expire after MERCHANT_CACHE_TTL_SECONDS, the least recently used
+# ones are dropped past MERCHANT_CACHE_SIZE, and writes through the merchant
+# routes call invalidate(). Unknown ids are cached too, briefly, so a bad
+# merchant_id can't hammer the DB.
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .. import models
+
+
+@dataclass(frozen=True)
+class MerchantSnapshot:
+    id: int
+    name: str
+    email: str
+    platform_account: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, m: models.Merchant) -> "MerchantSnapshot":
+        return cls(m.id, m.name, m.email, m.platform_account, m.created_at)
+
+
+_MISSING = object()
+
+
+class MerchantCache:
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[int, tuple[float, Optional[MerchantSnapshot]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _lookup(self, merchant_id: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(merchant_id)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(merchant_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[merchant_id]
+            self.misses += 1
+            return _MISSING
+
+    def _store(self, merchant_id: int, snap: Optional[MerchantSnapshot]) -> None:
+        ttl = self.ttl if snap is not None else self.negative_ttl
+        with self._lock:
+            self._data[merchant_id] = (time.monotonic() + ttl, snap)
+            self._data.move_to_end(merchant_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    async def get_async(self, db: AsyncSession, merchant_id: int) -> Optional[MerchantSnapshot]:
+        snap = self._lookup(merchant_id)
+        if snap is _MISSING:
+            m = await db.get(models.Merchant, merchant_id)
+            snap = MerchantSnapshot.from_model(m) if m else None
+            self._store(merchant_id, snap)
+        return snap
+
+    def get(self, db: Session, merchant_id: int) -> Optional[MerchantSnapshot]:
+        snap = self._lookup(merchant_id)
+        if snap is _MISSING:
+            m = db.get(models.Merchant, merchant_id)
+            snap = MerchantSnapshot.from_model(m) if m else None
+            self._store(merchant_id, snap)
+        return snap
+
+    def invalidate(self, merchant_id: Optional[int] = None) -> None:
+        """Drop one merchant (after create/update) or everything."""
+        with self._lock:
+            self.invalidations += 1
+            if merchant_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(merchant_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+merchant_cache = MerchantCache(
+    settings.MERCHANT_CACHE_SIZE,
+    settings.MERCHANT_CACHE_TTL_SECONDS,
+    settings.MERCHANT_CACHE_NEGATIVE_TTL_SECONDS,
+)
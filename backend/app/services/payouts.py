@@ -0,0 +1,267 @@
+# backend/app/services/payouts.py
+# Payout job: turns what merchants are owed into payouts rows. Driven by
+# scripts/run_payouts.py.
+#
+# A merchant's payout is captured minus refunded since its previous payouts:
+#   + amount of every "captured" transaction no payout included yet
+#   - the refunded amount (its refunds rows marked refunded, else the whole
+#     amount) of every "refunded" transaction an earlier payout did include
+#   + what its last run left owing, if refunds outweighed captures then
+# A transaction refunded before it was ever paid out never comes up at all.
+# payout_items records each of those lines and the payout it went into; its
+# primary key (transaction_id, kind) is what stops a transaction being paid
+# (or clawed back) twice, whether a run is repeated, dies half-way or
+# overlaps another one.
+#
+# With `until`, a capture counts if the transaction was created before it and
+# a refund if all its refunded refunds rows were (no rows: the transaction was).
+#
+# A merchant whose refunds outweigh its new captures gets a "carried" payout:
+# amount <= 0, never paid, but it owns its lines like any other, so they
+# aren't selected again. The next payout for that merchant and currency
+# absorbs it (carried_into) and is that much smaller; one that comes out
+# <= 0 again is carried in turn.
+#
+# Merchants are cut into id ranges of chunk_size and handed to a thread pool,
+# one DB transaction per chunk, everything set-based:
+#   1. one grouped query over the chunk's unpaid lines: per merchant and
+#      currency, captured minus refunded
+#   2. one executemany INSERT of a payout per group
+#   3. one INSERT .. SELECT of the lines, joined to their payout (ON CONFLICT
+#      DO NOTHING)
+#   4. one UPDATE pointing open carried payouts at this run's payout
+#   5. one UPDATE setting each payout to the sum of the items it actually
+#      got plus what it absorbed: transactions can change between 1 and 3,
+#      and a payout must always equal its items and carried balances; then
+#      payouts <= 0 become "carried" and ones that got no items at all go
+# Only the grouped rows reach Python, so memory depends on chunk_size, not
+# on the transactions table.
+#
+# On Postgres the job ANALYZEs payout_items itself whenever the run has
+# doubled it: autovacuum lags a big first run, and an anti-join planned
+# against "the table is empty" statistics turns into a scan per transaction.
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import BigInteger, and_, case, cast, delete, exists, func, literal, select, text, union_all, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, aliased
+
+from ..db import dialect_insert
+from .. import models
+
+T = models.Transaction
+R = models.Refund
+P = models.Payout
+I = models.PayoutItem
+
+RETRIES = 5
+RETRY_SQLSTATES = ("40P01", "40001")  # deadlock / serialization failure
+ANALYZE_MIN_ROWS = 10_000  # payout_items rows added before stats are worth refreshing
+
+_currency = func.coalesce(T.currency, "USD")
+
+
+def _merchants(col, lo: int, hi: int):
+    return and_(col >= lo, col < hi)
+
+
+def new_captures(lo: int, hi: int, until: Optional[datetime] = None):
+    """Lines for captured transactions not paid out yet (merchant ids lo <= id < hi)."""
+    where = [
+        _merchants(T.merchant_id, lo, hi),
+        T.status == "captured",
+        ~exists().where(I.transaction_id == T.id, I.kind == "capture"),
+    ]
+    if until is not None:
+        where.append(T.created_at < until)
+    return select(
+        T.id.label("transaction_id"), literal("capture").label("kind"), T.merchant_id,
+        _currency.label("currency"), T.amount_cents.label("amount_cents"),
+    ).where(*where)
+
+
+def new_refunds(lo: int, hi: int, until: Optional[datetime] = None):
+    """Lines (negative) for paid-out transactions that have since been refunded."""
+    refunded = (
+        select(func.sum(R.amount_cents))
+        .where(R.tx_id == T.id, R.status == "refunded")
+        .scalar_subquery()
+    )
+    where = [
+        _merchants(T.merchant_id, lo, hi),
+        T.status == "refunded",
+        exists().where(I.transaction_id == T.id, I.kind == "capture"),
+        ~exists().where(I.transaction_id == T.id, I.kind == "refund"),
+    ]
+    if until is not None:
+        # one line per transaction: wait until every part of the refund is in
+        where += [T.created_at < until,
+                  ~exists().where(R.tx_id == T.id, R.status == "refunded", R.created_at >= until)]
+    return select(
+        T.id.label("transaction_id"), literal("refund").label("kind"), T.merchant_id,
+        _currency.label("currency"), (-func.coalesce(refunded, T.amount_cents)).label("amount_cents"),
+    ).where(*where)
+
+
+def pay_chunk(db: Session, run_id: str, lo: int, hi: int, until: Optional[datetime] = None,
+              scheduled_at: Optional[datetime] = None) -> dict:
+    """Create this run's payouts for merchant ids lo <= id < hi. Does not commit."""
+    conn = db.connection()
+    lines = union_all(new_captures(lo, hi, until), new_refunds(lo, hi, until)).subquery()
+    totals = conn.execute(
+        select(
+            lines.c.merchant_id,
+            lines.c.currency,
+            # sum(bigint) is numeric on Postgres; back to int
+            cast(func.sum(case((lines.c.kind == "capture", lines.c.amount_cents), else_=0)), BigInteger).label("captured"),
+            cast(-func.sum(case((lines.c.kind == "refund", lines.c.amount_cents), else_=0)), BigInteger).label("refunded"),
+        )
+        .group_by(lines.c.merchant_id, lines.c.currency)
+    ).all()
+    result = {"payouts": 0, "items": 0, "paid_cents": 0, "carried_over": 0}
+    if not totals:
+        return result
+
+    # amounts and status are settled below, from what actually got linked
+    conn.execute(P.__table__.insert(), [
+        {"merchant_id": t.merchant_id, "currency": t.currency, "amount_cents": t.captured - t.refunded,
+         "status": "scheduled", "scheduled_at": scheduled_at, "run_id": run_id}
+        for t in totals
+    ])
+    ours = and_(P.run_id == run_id, _merchants(P.merchant_id, lo, hi))
+    items = (
+        select(lines.c.transaction_id, lines.c.kind, P.id, lines.c.amount_cents)
+        .join(P, and_(ours, P.merchant_id == lines.c.merchant_id, P.currency == lines.c.currency))
+    )
+    ins = dialect_insert(conn)(I).from_select(["transaction_id", "kind", "payout_id", "amount_cents"], items)
+    # INSERT rowcounts are only kept when asked for (psycopg reports -1 otherwise)
+    result["items"] = conn.execute(ins.on_conflict_do_nothing().execution_options(preserve_rowcount=True)).rowcount
+
+    # earlier runs' carried balances go into this run's payout for the same merchant and currency
+    new = aliased(P)
+    into = select(new.id).where(
+        new.run_id == run_id, new.merchant_id == P.merchant_id, new.currency == P.currency,
+    ).scalar_subquery()
+    conn.execute(update(P).where(
+        _merchants(P.merchant_id, lo, hi), P.status == "carried", P.carried_into.is_(None), into.is_not(None),
+    ).values(carried_into=into))
+
+    absorbed = aliased(P)
+    conn.execute(update(P).where(ours).values(amount_cents=(
+        select(func.coalesce(func.sum(I.amount_cents), 0)).where(I.payout_id == P.id).scalar_subquery()
+        + select(func.coalesce(func.sum(absorbed.amount_cents), 0)).where(absorbed.carried_into == P.id).scalar_subquery()
+    )))
+    empty = select(P.id).where(ours, ~exists().where(I.payout_id == P.id))
+    if conn.execute(empty.limit(1)).first() is not None:
+        # everything it was going to pay changed under us: nothing to record
+        conn.execute(update(P).where(P.carried_into.in_(empty)).values(carried_into=None))
+        conn.execute(delete(P).where(P.id.in_(empty)))
+    conn.execute(update(P).where(ours, P.amount_cents <= 0).values(status="carried"))
+
+    for status, count, cents in conn.execute(
+        select(P.status, func.count(), cast(func.coalesce(func.sum(P.amount_cents), 0), BigInteger))
+        .where(ours).group_by(P.status)
+    ):
+        if status == "carried":
+            result["carried_over"] = count
+        else:
+            result.update(payouts=count, paid_cents=cents)
+    return result
+
+
+def _run_chunk(session_factory, run_id: str, lo: int, hi: int, until, scheduled_at, dry_run: bool) -> dict:
+    with session_factory() as db:
+        for attempt in range(RETRIES + 1):
+            try:
+                result = pay_chunk(db, run_id, lo, hi, until, scheduled_at)
+                if dry_run:
+                    db.rollback()
+                else:
+                    db.commit()
+                return result
+            except OperationalError as exc:
+                db.rollback()
+                if attempt == RETRIES or getattr(exc.orig, "sqlstate", None) not in RETRY_SQLSTATES:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+
+
+def _planned_rows(db: Session) -> Optional[int]:
+    """payout_items rows according to the Postgres planner's stats; None elsewhere."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    rows = db.execute(text("SELECT reltuples FROM pg_class WHERE oid = 'payout_items'::regclass")).scalar()
+    return max(0, int(rows or 0))  # -1: never analyzed
+
+
+def _analyze(session_factory) -> None:
+    with session_factory() as db:
+        db.execute(text("ANALYZE payout_items"))
+        db.commit()
+
+
+def run(
+    session_factory,
+    until: Optional[datetime] = None,
+    scheduled_at: Optional[datetime] = None,
+    chunk_size: int = 1000,
+    workers: int = 4,
+    dry_run: bool = False,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    progress_every: float = 2.0,
+) -> dict:
+    """Create payouts for everything payable (captured before `until`, if given). Returns totals.
+
+    Chunks commit independently: if one fails the rest are cancelled and the
+    error is raised; what did commit stays, and running again picks up the rest.
+    """
+    run_id = uuid.uuid4().hex
+    scheduled_at = scheduled_at or datetime.now(timezone.utc)
+    with session_factory() as db:
+        first, last = db.execute(select(func.min(models.Merchant.id), func.max(models.Merchant.id))).one()
+        planned = None if dry_run else _planned_rows(db)
+    chunks = [] if first is None else [
+        (lo, min(lo + chunk_size, last + 1)) for lo in range(first, last + 1, chunk_size)
+    ]
+
+    keys = ("payouts", "items", "paid_cents", "carried_over")
+    totals = dict.fromkeys(keys, 0)
+    done = added = 0  # added: payout_items rows since stats were last refreshed
+    started = last_report = time.perf_counter()
+    with ThreadPoolExecutor(max(1, workers), thread_name_prefix="payouts") as pool:
+        futures = [
+            pool.submit(_run_chunk, session_factory, run_id, lo, hi, until, scheduled_at, dry_run)
+            for lo, hi in chunks
+        ]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                for k, v in result.items():
+                    totals[k] += v
+                done += 1
+                if planned is not None:
+                    added += result["items"]
+                    if added >= max(ANALYZE_MIN_ROWS, planned):
+                        _analyze(session_factory)
+                        planned, added = planned + added, 0
+                if on_progress and time.perf_counter() - last_report >= progress_every:
+                    last_report = time.perf_counter()
+                    on_progress({"chunks": done, "of": len(chunks), **totals,
+                                 "seconds": round(last_report - started, 2)})
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+
+    return {
+        "run_id": run_id,
+        **totals,
+        "chunks": len(chunks),
+        "workers": max(1, workers),
+        "seconds": round(time.perf_counter() - started, 2),
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,309 @@
+# backend/app/services/search.py
+# Admin search box: one string against transactions.psp_reference,
+# merchants.name and merchants.email.
+#
+# Every lookup is an index probe, so latency doesn't grow with the tables:
+#
+#   exact     the psp_reference / email btrees (any length)
+#   prefix    psp_reference: SQLite the same btree as a range, Postgres
+#             lower(col) text_pattern_ops btrees (also on merchant name/email);
+#             read in index order so a short prefix stops after CANDIDATES
+#   substring SQLite: FTS5 tables with the trigram tokenizer
+#             (transactions_search, merchants_search), external content so
+#             they hold only the index, kept in step by triggers.
+#             Postgres: GIN lower(col) gin_trgm_ops, when pg_trgm is installed.
+#             TRIGRAM+ characters, case-insensitive.
+#
+# Each source hands back at most CANDIDATES ids; the rows are ranked here:
+# exact match, prefix, start of a word (an email's domain, a name's second
+# word), anywhere, newest first within a rank. Migration 0009 creates the
+# same objects; install() is the create_all path.
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, or_, select, text
+from sqlalchemy.orm import Session
+
+from ..db import Base
+from .. import models
+
+T = models.Transaction
+M = models.Merchant
+
+TRIGRAM = 3        # shortest query the substring indexes can answer
+CANDIDATES = 200   # ids taken from each index before ranking
+MAX_QUERY = 100
+
+RANKS = ("exact", "prefix", "word", "substring")
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_search USING fts5("
+    "psp_reference, content='transactions', content_rowid='id', tokenize='trigram', columnsize=0)",
+    "CREATE TRIGGER IF NOT EXISTS transactions_search_ai AFTER INSERT ON transactions "
+    "WHEN new.psp_reference IS NOT NULL BEGIN "
+    "INSERT INTO transactions_search(rowid, psp_reference) VALUES (new.id, new.psp_reference); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_search_ad AFTER DELETE ON transactions "
+    "WHEN old.psp_reference IS NOT NULL BEGIN "
+    "INSERT INTO transactions_search(transactions_search, rowid, psp_reference) VALUES ('delete', old.id, old.psp_reference); END",
+    # status updates rewrite psp_reference with the same value; only real changes touch the index
+    "CREATE TRIGGER IF NOT EXISTS transactions_search_au AFTER UPDATE OF psp_reference ON transactions "
+    "WHEN old.psp_reference IS NOT new.psp_reference BEGIN "
+    "INSERT INTO transactions_search(transactions_search, rowid, psp_reference) "
+    "SELECT 'delete', old.id, old.psp_reference WHERE old.psp_reference IS NOT NULL; "
+    "INSERT INTO transactions_search(rowid, psp_reference) "
+    "SELECT new.id, new.psp_reference WHERE new.psp_reference IS NOT NULL; END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS merchants_search USING fts5("
+    "name, email, content='merchants', content_rowid='id', tokenize='trigram', columnsize=0)",
+    "CREATE TRIGGER IF NOT EXISTS merchants_search_ai AFTER INSERT ON merchants BEGIN "
+    "INSERT INTO merchants_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS merchants_search_ad AFTER DELETE ON merchants BEGIN "
+    "INSERT INTO merchants_search(merchants_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS merchants_search_au AFTER UPDATE OF name, email ON merchants BEGIN "
+    "INSERT INTO merchants_search(merchants_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO merchants_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+]
+SQLITE_BACKFILL = {
+    "transactions_search": "INSERT INTO transactions_search(rowid, psp_reference) "
+                           "SELECT id, psp_reference FROM transactions WHERE psp_reference IS NOT NULL",
+    "merchants_search": "INSERT INTO merchants_search(rowid, name, email) SELECT id, name, email FROM merchants",
+}
+
+POSTGRES_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_transactions_psp_reference_prefix ON transactions (lower(psp_reference) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_merchants_name_prefix ON merchants (lower(name) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_merchants_email_prefix ON merchants (lower(email) text_pattern_ops)",
+]
+POSTGRES_TRGM_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_transactions_psp_reference_trgm ON transactions USING gin (lower(psp_reference) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_merchants_name_trgm ON merchants USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_merchants_email_trgm ON merchants USING gin (lower(email) gin_trgm_ops)",
+]
+
+
+def install(conn) -> None:
+    """Create the search tables/indexes for conn's dialect if missing (idempotent)."""
+    if conn.dialect.name == "sqlite":
+        have = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name IN ('transactions_search', 'merchants_search')"
+        ).scalars())
+        for ddl in SQLITE_DDL:
+            conn.exec_driver_sql(ddl)
+        for table, backfill in SQLITE_BACKFILL.items():
+            if table not in have:
+                conn.exec_driver_sql(backfill)
+    elif conn.dialect.name == "postgresql":
+        for ddl in POSTGRES_DDL:
+            conn.exec_driver_sql(ddl)
+        if _pg_has_trgm(conn):
+            for ddl in POSTGRES_TRGM_DDL:
+                conn.exec_driver_sql(ddl)
+    _features.clear()
+    _samples.clear()
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _after_create(target, connection, **kw):
+    install(connection)
+
+
+# ---- what this database can do ----
+
+_features: Dict[str, bool] = {}  # engine url -> substring search available
+
+
+def _pg_has_trgm(conn) -> bool:
+    return conn.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+
+
+def substring_search(db: Session) -> bool:
+    """True if this database has the trigram index (FTS5 tables / pg_trgm)."""
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _features:
+        conn = db.connection()
+        if bind.dialect.name == "sqlite":
+            _features[key] = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = 'transactions_search'"
+            ).first() is not None
+        elif bind.dialect.name == "postgresql":
+            _features[key] = _pg_has_trgm(conn)
+        else:
+            _features[key] = False
+    return _features[key]
+
+
+# ---- candidates ----
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_ids(db: Session, table: str, q: str) -> List[int]:
+    phrase = '"' + q.replace('"', '""') + '"'
+    return list(db.execute(
+        text(f"SELECT rowid FROM {table} WHERE {table} MATCH :q ORDER BY rowid DESC LIMIT :n"),
+        {"q": phrase, "n": CANDIDATES},
+    ).scalars())
+
+
+def _pg_ids(db: Session, model, columns, pattern: str) -> List[int]:
+    where = or_(*(func.lower(c).like(pattern, escape="\\") for c in columns))
+    return list(db.execute(select(model.id).where(where).order_by(model.id.desc()).limit(CANDIDATES)).scalars())
+
+
+# FTS5 reads the whole doclist of every trigram in a query, and some trigrams
+# are in nearly every PSP reference ("psp", a shared leading timestamp): one
+# of those costs ~100 ms at a few million rows. So substring lookups AND
+# together the rarest few trigrams of the query, by frequency in a sample of
+# recent references, and confirm the hits with LIKE.
+SAMPLE_ROWS = 5000
+SAMPLE_TTL = 3600.0
+COMMON = 0.02   # in more than 2% of sampled references: not worth reading
+RARE_TERMS = 3
+
+_samples: Dict[str, tuple] = {}  # engine url -> (taken at, trigram -> references containing it, sample size)
+
+
+def _trigrams(s: str) -> set:
+    return {s[i:i + TRIGRAM] for i in range(len(s) - TRIGRAM + 1)}
+
+
+def _psp_sample(db: Session) -> tuple:
+    key = str(db.get_bind().url)
+    hit = _samples.get(key)
+    if hit is None or time.monotonic() - hit[0] > SAMPLE_TTL:
+        refs = db.execute(
+            select(T.psp_reference).where(T.psp_reference.is_not(None)).order_by(T.id.desc()).limit(SAMPLE_ROWS)
+        ).scalars().all()
+        freq = Counter(t for r in refs for t in _trigrams(r.lower()))
+        hit = _samples[key] = (time.monotonic(), freq, len(refs))
+    return hit
+
+
+def _psp_substring_ids(db: Session, needle: str) -> List[int]:
+    _, freq, n = _psp_sample(db)
+    rare = sorted((freq[t], t) for t in _trigrams(needle))
+    rare = [t for c, t in rare if c <= COMMON * n][:RARE_TERMS]
+    if not rare or n < 100:
+        # nothing selective to lead with; the full phrase is exact and, with
+        # this many matches, stops early on ORDER BY rowid DESC LIMIT
+        return _fts_ids(db, "transactions_search", needle)
+    return list(db.execute(
+        text(
+            "SELECT s.rowid FROM transactions_search s JOIN transactions t ON t.id = s.rowid "
+            "WHERE transactions_search MATCH :m AND lower(t.psp_reference) LIKE :p ESCAPE '\\' "
+            "ORDER BY s.rowid DESC LIMIT :n"
+        ),
+        {"m": " AND ".join('"' + t.replace('"', '""') + '"' for t in rare),
+         "p": "%" + _like_escape(needle) + "%", "n": CANDIDATES},
+    ).scalars())
+
+
+def _transaction_ids(db: Session, q: str, needle: str, substring: bool) -> set:
+    ids = set(db.execute(select(T.id).where(T.psp_reference.in_({q, q.upper()})).limit(CANDIDATES)).scalars())
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        # prefixes straight off the psp_reference btree, in index order so a
+        # short prefix still stops after CANDIDATES rows (case-sensitive:
+        # as typed and upper-cased)
+        for prefix in {q, q.upper()}:
+            ids.update(db.execute(
+                select(T.id).where(T.psp_reference >= prefix, T.psp_reference < prefix + "\U0010ffff")
+                .order_by(T.psp_reference).limit(CANDIDATES)
+            ).scalars())
+        if substring and len(q) >= TRIGRAM:
+            ids.update(_psp_substring_ids(db, needle))
+    elif dialect == "postgresql":
+        pattern = _like_escape(needle)
+        ids.update(db.execute(
+            select(T.id).where(func.lower(T.psp_reference).like(pattern + "%", escape="\\"))
+            .order_by(func.lower(T.psp_reference)).limit(CANDIDATES)
+        ).scalars())
+        if substring and len(q) >= TRIGRAM:
+            ids.update(_pg_ids(db, T, [T.psp_reference], "%" + pattern + "%"))
+    return ids
+
+
+def _merchant_ids(db: Session, q: str, needle: str, substring: bool) -> set:
+    ids = set(db.execute(select(M.id).where(M.email.in_({q, needle}))).scalars())
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        if substring and len(q) >= TRIGRAM:
+            ids.update(_fts_ids(db, "merchants_search", q))
+    elif dialect == "postgresql":
+        pattern = _like_escape(needle)
+        ids.update(_pg_ids(db, M, [M.name, M.email], pattern + "%"))
+        if substring and len(q) >= TRIGRAM:
+            ids.update(_pg_ids(db, M, [M.name, M.email], "%" + pattern + "%"))
+    return ids
+
+
+# ---- ranking ----
+
+def rank(value: Optional[str], needle: str) -> Optional[int]:
+    """Index into RANKS for how `needle` (lower-case) matches `value`, None if it doesn't."""
+    v = (value or "").lower()
+    if v == needle:
+        return 0
+    if v.startswith(needle):
+        return 1
+    i = v.find(needle)
+    if i < 0:
+        return None
+    while i >= 0:
+        if not v[i - 1].isalnum():
+            return 2
+        i = v.find(needle, i + 1)
+    return 3
+
+
+def _ranked(rows, needle: str, fields, limit: int) -> List[dict]:
+    """Rows as dicts with rank/matched (best field, earlier fields win ties), best first, newest first within a rank."""
+    hits = []
+    for r in rows:
+        found = [(n, i) for i, f in enumerate(fields) for n in (rank(getattr(r, f), needle),) if n is not None]
+        # FTS5 case folding isn't quite str.lower(); whatever it matched ranks last
+        best, i = min(found) if found else (len(RANKS) - 1, 0)
+        matched = fields[i]
+        hits.append((best, -r.id, {**r._mapping, "rank": RANKS[best], "matched": matched}))
+    hits.sort(key=lambda h: h[:2])
+    return [h[2] for h in hits[:limit]]
+
+
+@dataclass
+class Results:
+    query: str
+    merchants: List[dict] = field(default_factory=list)
+    transactions: List[dict] = field(default_factory=list)
+    substring: bool = False  # False: exact/prefix matches only
+    ms: float = 0.0
+
+
+def search(db: Session, q: str, limit: int = 20) -> Results:
+    """Ranked merchants and transactions matching `q`, at most `limit` of each."""
+    started = time.perf_counter()
+    q = " ".join((q or "").split())[:MAX_QUERY]
+    out = Results(query=q, substring=substring_search(db))
+    if not q:
+        return out
+    needle = q.lower()
+
+    m_ids = _merchant_ids(db, q, needle, out.substring)
+    if m_ids:
+        rows = db.execute(select(M.id, M.name, M.email, M.created_at).where(M.id.in_(m_ids))).all()
+        out.merchants = _ranked(rows, needle, ("name", "email"), limit)
+
+    t_ids = _transaction_ids(db, q, needle, out.substring)
+    if t_ids:
+        rows = db.execute(
+            select(T.id, T.merchant_id, M.name.label("merchant_name"), T.amount_cents, T.currency,
+                   T.status, T.psp_reference, T.created_at)
+            .join(M, M.id == T.merchant_id)
+            .where(T.id.in_(t_ids))
+        ).all()
+        out.transactions = _ranked(rows, needle, ("psp_reference",), limit)
+
+    out.ms = round((time.perf_counter() - started) * 1000, 2)
+    return out
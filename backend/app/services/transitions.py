@@ -0,0 +1,241 @@
+# backend/app/services/transitions.py
+# Every Transaction status change goes through here.
+#
+# ALLOWED_FROM is the state machine: which statuses may move to which. A
+# change is one conditional UPDATE
+#
+#     UPDATE transactions SET status = :to, version = version + 1, ...
+#     WHERE id = :id AND status IN (:allowed) AND version = :read_version
+#
+# so two writers racing for the same transaction can't both win, and a late
+# or replayed notification can't drag it backwards (a refunded payment stays
+# refunded). 0 rows means someone moved it since we read it: re-read and try
+# again, or report that it didn't apply. No SELECT ... FOR UPDATE, so a busy
+# merchant's transactions never queue on row locks.
+#
+# These are Core UPDATEs and bypass the daily_stats after_flush hook; the
+# rollup row moves here (add_deltas) from the values read and written.
+# Nothing in this module commits.
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import daily_stats
+
+T = models.Transaction
+
+# target status -> statuses it may be entered from
+ALLOWED_FROM: Dict[str, tuple] = {
+    "authorised": ("created",),
+    "captured": ("authorised",),
+    "refund_requested": ("authorised", "captured"),
+    "refunded": ("authorised", "captured", "refund_requested"),
+    "failed": ("created", "authorised", "refund_requested"),
+}
+STATUSES = ("created",) + tuple(ALLOWED_FROM)
+RETRIES = 3  # re-reads after losing a race before giving up
+
+# what a transition can write besides status/version
+WRITABLE = ("amount_cents", "currency", "psp_reference")
+
+
+class Conflict(Exception):
+    """Still losing the race after RETRIES re-reads."""
+
+
+def allowed(current: Optional[str], target: str) -> bool:
+    return (current or "created") in ALLOWED_FROM.get(target, ())
+
+
+def _reachable_from(status: str) -> frozenset:
+    seen, todo = set(), [status]
+    while todo:
+        here = todo.pop()
+        for to, froms in ALLOWED_FROM.items():
+            if here in froms and to not in seen:
+                seen.add(to)
+                todo.append(to)
+    return frozenset(seen)
+
+
+# status -> every status it can still get to in one or more moves
+REACHABLE: Dict[str, frozenset] = {s: _reachable_from(s) for s in STATUSES}
+
+
+def reachable(current: Optional[str], target: str) -> bool:
+    """Not allowed yet but could be later (a CAPTURE for a payment that isn't authorised yet)."""
+    return target in REACHABLE.get(current or "created", ())
+
+
+@dataclass(frozen=True)
+class Outcome:
+    applied: bool
+    reason: str              # applied | unchanged (already there) | not_allowed | not_found | conflict
+    status: Optional[str]    # status after the call, as far as we know
+    version: Optional[int]
+
+
+# ---- state rows ----
+
+def state_query(tx_ids: Iterable[int]):
+    """Plain rows with what a transition needs to check and to move the rollup."""
+    return select(
+        T.id, T.merchant_id, daily_stats.day_of.label("day"),
+        T.status, T.amount_cents, T.currency, T.psp_reference, T.version,
+    ).where(T.id.in_(list(tx_ids)))
+
+
+def load_states(db: Session, tx_ids: Iterable[int]) -> Dict[int, SimpleNamespace]:
+    """id -> mutable copy of the row (apply_item-able); .before keeps the values as read."""
+    states = {}
+    for r in db.execute(state_query(tx_ids)):
+        ns = SimpleNamespace(**r._mapping)
+        ns.before = (r.status, r.amount_cents, r.currency, r.psp_reference)
+        states[r.id] = ns
+    return states
+
+
+def changed(state) -> bool:
+    return (state.status, state.amount_cents, state.currency, state.psp_reference) != state.before
+
+
+def add_move(deltas: Dict[tuple, List[int]], state) -> None:
+    """Rollup deltas for one transaction going from state.before to its current values."""
+    old_status, old_amount, old_currency, _ = state.before
+    for sign, status, amount, currency in (
+        (-1, old_status, old_amount, old_currency),
+        (1, state.status, state.amount_cents, state.currency),
+    ):
+        d = deltas[(state.merchant_id, state.day, currency or "USD", status or "created")]
+        d[0] += sign
+        d[1] += sign * (amount or 0)
+
+
+def new_deltas() -> Dict[tuple, List[int]]:
+    return defaultdict(lambda: [0, 0])
+
+
+# Many states at once (webhook notifications, replay): status/version checked
+# per row against what was read. Replay runs it as one executemany, where
+# rowcount is the sum: a short count only says some row lost its race, so the
+# whole batch is redone. apply_notification runs it once per transaction
+# instead, since it re-reads and re-folds just the ones that lost.
+batch_update = (
+    update(T.__table__)
+    .where(
+        T.__table__.c.id == bindparam("b_id"),
+        T.__table__.c.status.is_not_distinct_from(bindparam("b_old_status")),
+        T.__table__.c.version == bindparam("b_version"),
+    )
+    .values(
+        status=bindparam("b_status"), amount_cents=bindparam("b_amount_cents"),
+        currency=bindparam("b_currency"), psp_reference=bindparam("b_psp_reference"),
+        version=T.__table__.c.version + 1,
+    )
+)
+
+
+def batch_params(state) -> dict:
+    return {
+        "b_id": state.id, "b_old_status": state.before[0], "b_version": state.version,
+        "b_status": state.status, "b_amount_cents": state.amount_cents,
+        "b_currency": state.currency, "b_psp_reference": state.psp_reference,
+    }
+
+
+# ---- one transaction ----
+
+def _statement(row, target: str, values: dict):
+    return (
+        update(T)
+        .where(T.id == row.id, func.coalesce(T.status, "created").in_(ALLOWED_FROM[target]), T.version == row.version)
+        .values(status=target, version=T.version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _check(row, target: str) -> Optional[Outcome]:
+    """Outcome if there's nothing to write, None if the UPDATE should be tried."""
+    if row is None:
+        return Outcome(False, "not_found", None, None)
+    if (row.status or "created") == target:
+        return Outcome(False, "unchanged", row.status, row.version)
+    if not allowed(row.status, target):
+        return Outcome(False, "not_allowed", row.status, row.version)
+    return None
+
+
+def _deltas(row, target: str, values: dict) -> Dict[tuple, List[int]]:
+    state = SimpleNamespace(**row._mapping)
+    state.before = (row.status, row.amount_cents, row.currency, row.psp_reference)
+    state.status = target
+    for k, v in values.items():
+        setattr(state, k, v)
+    deltas = new_deltas()
+    add_move(deltas, state)
+    return deltas
+
+
+def _validate(target: str, values: dict) -> None:
+    if target not in ALLOWED_FROM:
+        raise ValueError(f"unknown transaction status {target!r}")
+    extra = set(values) - set(WRITABLE)
+    if extra:
+        raise ValueError(f"transition can't write {sorted(extra)}")
+
+
+def _attempts(tx_id: int, target: str, expected_version: Optional[int], values: dict):
+    """The transition without the I/O, shared by transition() and transition_async().
+
+    A generator: yields each statement to run and gets its result sent back;
+    returns (Outcome, rollup deltas to add, or None).
+    """
+    _validate(target, values)
+    for _ in range(1 if expected_version is not None else RETRIES + 1):
+        row = (yield state_query([tx_id])).one_or_none()
+        done = _check(row, target)
+        if done is not None:
+            return done, None
+        if expected_version is not None and row.version != expected_version:
+            return Outcome(False, "conflict", row.status, row.version), None
+        if (yield _statement(row, target, values)).rowcount == 1:
+            return Outcome(True, "applied", target, row.version + 1), _deltas(row, target, values)
+    return Outcome(False, "conflict", row.status, row.version), None
+
+
+def transition(db: Session, tx_id: int, target: str, expected_version: Optional[int] = None, **values) -> Outcome:
+    """Move one transaction to `target` if the table allows it. Does not commit.
+
+    expected_version: only apply on top of exactly that version (no retry);
+    otherwise read the current row and retry up to RETRIES times on a race.
+    """
+    steps = _attempts(tx_id, target, expected_version, values)
+    try:
+        stmt = next(steps)
+        while True:
+            stmt = steps.send(db.execute(stmt))
+    except StopIteration as stop:
+        outcome, deltas = stop.value
+    if deltas:
+        daily_stats.add_deltas(db.connection(), deltas)
+    return outcome
+
+
+async def transition_async(db: AsyncSession, tx_id: int, target: str, expected_version: Optional[int] = None, **values) -> Outcome:
+    """transition() for the async routes."""
+    steps = _attempts(tx_id, target, expected_version, values)
+    try:
+        stmt = next(steps)
+        while True:
+            stmt = steps.send(await db.execute(stmt))
+    except StopIteration as stop:
+        outcome, deltas = stop.value
+    if deltas:
+        await db.run_sync(lambda s: daily_stats.add_deltas(s.connection(), deltas))
+    return outcome
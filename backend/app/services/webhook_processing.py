@@ -0,0 +1,252 @@
+# backend/app/services/webhook_processing.py
+# Business side of Adyen notifications: turn a stored payload into
+# Transaction / Refund updates. Called by the inbox workers, never by the
+# HTTP endpoint itself.
+import json
+import re
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import daily_stats, transitions
+
+TX_REF = re.compile(r"tx_(\d+)")
+
+
+class NotYet(Exception):
+    """Items arrived before the events they depend on; try the notification again later."""
+
+
+def parse_payload(raw_text: str) -> Any:
+    try:
+        return json.loads(raw_text) if raw_text else {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def notification_items(p: Any) -> Iterator[dict]:
+    """Yield each NotificationRequestItem, no matter the shape."""
+    if isinstance(p, dict):
+        if "notificationItems" in p and isinstance(p["notificationItems"], list):
+            for wrapper in p["notificationItems"]:
+                if isinstance(wrapper, dict) and "NotificationRequestItem" in wrapper:
+                    yield wrapper["NotificationRequestItem"]
+                else:
+                    yield wrapper
+        elif "NotificationRequestItem" in p:
+            yield p["NotificationRequestItem"]
+        else:
+            yield p
+    elif isinstance(p, list):
+        for item in p:
+            yield item
+
+
+def _tx_id(merchant_ref: str) -> Optional[int]:
+    # Extract tx_id from merchantReference like "tx_123"
+    m = TX_REF.search(merchant_ref)
+    if not m:
+        return None
+    try:
+        return int(m.group(1))
+    except ValueError:
+        return None
+
+
+def parse_items(payload: Any) -> List[tuple]:
+    """(tx_id, event_code, success, psp_ref, item) for each item that names a transaction."""
+    parsed = []
+    for nri in notification_items(payload):
+        nri = nri or {}
+        event_code = str(nri.get("eventCode", "")).upper()
+        success = str(nri.get("success", "")).lower() == "true"
+        psp_ref = nri.get("pspReference") or nri.get("psp_reference")
+        tx_id = _tx_id(str(nri.get("merchantReference", "")))
+        if tx_id is not None:
+            parsed.append((tx_id, event_code, success, psp_ref, nri))
+    return parsed
+
+
+def payload_tx_ids(payload: Any) -> List[int]:
+    """Every transaction the notification names, once each: what the inbox orders events by."""
+    return sorted({p[0] for p in parse_items(payload)})
+
+
+# event code -> status it moves the transaction to on (success, failure)
+TARGETS = {
+    "AUTHORISATION": ("authorised", "failed"),
+    "CAPTURE": ("captured", "failed"),
+    "REFUND": ("refunded", "failed"),
+}
+
+
+def item_target(event_code: str, success: bool) -> Optional[str]:
+    pair = TARGETS.get(event_code)
+    return None if pair is None else pair[0 if success else 1]
+
+
+def apply_item(tx, rf, event_code: str, success: bool, psp_ref, nri: dict) -> bool:
+    """Apply one item to a transaction (and its newest refund, if any).
+
+    Works on anything with the model's attributes, ORM object or not.
+    Doesn't check the state machine; fold() does. Returns False for event
+    codes we ignore.
+    """
+    target = item_target(event_code, success)
+    if target is None:
+        return False
+    tx.status = target
+    if psp_ref:
+        tx.psp_reference = psp_ref
+
+    # --- AUTHORISATION: sync amount/currency if provided ---
+    if event_code == "AUTHORISATION":
+        amt = nri.get("amount") or {}
+        if isinstance(amt, dict):
+            if isinstance(amt.get("value"), int):
+                tx.amount_cents = int(amt["value"])
+            if isinstance(amt.get("currency"), str):
+                tx.currency = amt["currency"]
+
+    # --- REFUND: mark the newest refund row for this tx ---
+    elif event_code == "REFUND" and rf:
+        rf.status = "refunded" if success else "failed"
+        if psp_ref:
+            rf.psp_reference = psp_ref
+    return True
+
+
+# ---- applying a batch of items ----
+
+R = models.Refund
+
+refund_update = (
+    update(R.__table__)
+    .where(R.__table__.c.id == bindparam("b_id"))
+    .values(status=bindparam("b_status"), psp_reference=bindparam("b_psp_reference"))
+)
+
+
+def newest_refunds(db: Session, tx_ids) -> dict:
+    """tx_id -> mutable copy of its newest refund row; one grouped query."""
+    refunds = {}
+    if tx_ids:
+        newest = select(func.max(R.id)).where(R.tx_id.in_(list(tx_ids))).group_by(R.tx_id)
+        for r in db.execute(select(R.id, R.tx_id, R.status, R.psp_reference).where(R.id.in_(newest))):
+            rf = SimpleNamespace(**r._mapping)
+            rf.before = (r.status, r.psp_reference)
+            refunds[r.tx_id] = rf
+    return refunds
+
+
+def refund_tx_ids(parsed: List[tuple], states: dict) -> set:
+    return {tx_id for tx_id, code, *_ in parsed if code == "REFUND" and tx_id in states}
+
+
+def prepare(db: Session, parsed: List[tuple]):
+    """Load state rows for the items' transactions (+ newest refunds) and fold the items in.
+
+    One IN query for the transactions, one grouped query for the refunds.
+    Returns (states, refunds, handled per tx_id, skipped) as fold() does;
+    nothing is written yet.
+    """
+    states = transitions.load_states(db, {p[0] for p in parsed})
+    refunds = newest_refunds(db, refund_tx_ids(parsed, states))
+    return (states, refunds) + fold(states, refunds, parsed)
+
+
+def fold(states: dict, refunds: dict, parsed: List[tuple]) -> Tuple[Counter, List[tuple]]:
+    """Apply items in order to the state rows, skipping moves transitions.ALLOWED_FROM forbids.
+
+    Returns (handled per tx_id, skipped). skipped has (item, status it met,
+    reason) per refused item:
+      unchanged    already there (a second CAPTURE)
+      early        not yet, but the status can still get there (a CAPTURE
+                   ahead of its AUTHORISATION)
+      not_allowed  never from here (a late AUTHORISATION for a refunded payment)
+    """
+    handled, skipped = Counter(), []
+    for item in parsed:
+        tx_id, event_code, success, psp_ref, nri = item
+        tx = states.get(tx_id)
+        target = item_target(event_code, success)
+        if tx is None or target is None:
+            continue
+        if not transitions.allowed(tx.status, target):
+            if (tx.status or "created") == target:
+                reason = "unchanged"
+            elif transitions.reachable(tx.status, target):
+                reason = "early"
+            else:
+                reason = "not_allowed"
+            skipped.append((item, tx.status, reason))
+            continue
+        if apply_item(tx, refunds.get(tx_id), event_code, success, psp_ref, nri):
+            handled[tx_id] += 1
+    return handled, skipped
+
+
+def describe(skip: tuple) -> str:
+    """One skipped item for logs / last_error: "CAPTURE tx_12 (refunded): not_allowed"."""
+    (tx_id, event_code, success, _, _), status, reason = skip
+    return f"{event_code}{'' if success else ' failure'} tx_{tx_id} ({status or 'created'}): {reason}"
+
+
+def refund_params(rf) -> Optional[dict]:
+    if (rf.status, rf.psp_reference) == rf.before:
+        return None
+    return {"b_id": rf.id, "b_status": rf.status, "b_psp_reference": rf.psp_reference}
+
+
+def apply_notification(db: Session, payload: Any, retry_early: bool = True) -> Tuple[int, List[tuple]]:
+    """Apply AUTHORISATION / CAPTURE / REFUND items to the DB session.
+
+    Set-based: all referenced transactions are read in one query and the
+    items folded in, in order, per transaction (see fold()). Each changed
+    transaction is then one versioned UPDATE (transitions.batch_update);
+    transactions that lost a race to another writer are re-read and their
+    items folded again, up to transitions.RETRIES times.
+
+    An "early" item raises NotYet before anything is written, so the whole
+    notification is retried once what it waits for has arrived; with
+    retry_early=False (its last attempt) it's skipped like the rest.
+
+    Returns (items that moved a transaction, skipped items as from fold()).
+    Does not commit.
+    """
+    parsed = parse_items(payload)
+    handled, skipped = 0, []
+    for _ in range(transitions.RETRIES + 1):
+        if not parsed:
+            return handled, skipped
+        states, refunds, per_tx, refused = prepare(db, parsed)
+        early = [s for s in refused if s[2] == "early"]
+        if early and retry_early:
+            raise NotYet("; ".join(describe(s) for s in early))
+        conn = db.connection()
+        lost, refund_rows = set(), []
+        deltas = transitions.new_deltas()
+        for tx_id, state in states.items():
+            if not transitions.changed(state):
+                continue
+            if conn.execute(transitions.batch_update, transitions.batch_params(state)).rowcount != 1:
+                lost.add(tx_id)
+                continue
+            transitions.add_move(deltas, state)
+            handled += per_tx[tx_id]
+            rf = refunds.get(tx_id)
+            params = rf and refund_params(rf)
+            if params:
+                refund_rows.append(params)
+        if refund_rows:
+            conn.execute(refund_update, refund_rows)
+        daily_stats.add_deltas(conn, deltas)
+        skipped += [s for s in refused if s[0][0] not in lost]  # lost ones get folded again
+        parsed = [p for p in parsed if p[0] in lost]
+    if parsed:
+        raise transitions.Conflict(f"transactions {sorted({p[0] for p in parsed})} kept changing underneath")
+    return handled, skipped
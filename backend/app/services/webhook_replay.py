@@ -0,0 +1,357 @@
+# backend/app/services/webhook_replay.py
+# Re-apply stored webhook_events to transactions/refunds, e.g. after a bug fix
+# in webhook_processing or a restore. Driven by scripts/replay_webhooks.py.
+#
+# One reader walks the matching events in id order (keyset pages of plain
+# columns, no ORM rows), decodes each body and parses it into notification
+# items (webhook_processing.parse_items). Items are routed to worker threads by tx_id % workers, so every
+# transaction belongs to exactly one worker and sees its items in the order
+# they were received; different transactions go in parallel.
+#
+# Workers take batch_size items at a time through apply_batch(): the same
+# read + fold as apply_notification() (webhook_processing.prepare, so the
+# transitions.ALLOWED_FROM rules hold), but all changed transactions are
+# written with one executemany of the versioned UPDATE. The daily_stats
+# deltas are upserted in key order so parallel workers don't deadlock on
+# shared rollup rows. A batch that loses a race with live traffic (a
+# transaction changed since it was read, or a deadlock) is rolled back and
+# redone.
+#
+# The events themselves are left alone (status, attempts, processed_at).
+# dry_run reads and folds the same way but writes nothing. What a batch would
+# have changed stays in the worker's memory (changed rows only) and stands in
+# for the DB row in its later batches, so the totals match a real run.
+#
+# Replay goes through the same forward-only state machine as live traffic, so
+# it can't undo a wrong status (a bug that marked a payment refunded). rebuild
+# does: the filters only pick the transactions, then every stored event of
+# those transactions is replayed with each one folded from "created" instead
+# of its current status, i.e. the status is recomputed from its webhook
+# history alone. Moves that never came from a webhook (the confirm route,
+# admin refund requests) aren't in that history and are not kept.
+import copy
+import queue
+import threading
+import time
+from collections import Counter as Tally
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import daily_stats, transitions, webhook_processing
+from .webhook_processing import notification_items, parse_items, parse_payload
+from .webhook_storage import decode_body
+
+DEFAULT_STATUSES = ("processed", "failed")
+QUEUE_DEPTH = 8  # pages buffered per worker before the reader waits
+RETRIES = 5
+RETRY_SQLSTATES = ("40P01", "40001")  # deadlock / serialization failure
+
+
+def like_pattern(glob: str) -> str:
+    """Shell-style event_key pattern ("adyen:PSP*") -> SQL LIKE pattern (escape char '\\')."""
+    out = []
+    for ch in glob:
+        if ch in "\\%_":
+            out.append("\\" + ch)
+        elif ch == "*":
+            out.append("%")
+        elif ch == "?":
+            out.append("_")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _filters(since, until, provider, key_pattern, statuses) -> list:
+    ev = models.WebhookEvent
+    where = []
+    if since is not None:
+        where.append(ev.created_at >= since)
+    if until is not None:
+        where.append(ev.created_at < until)
+    if provider:
+        where.append(ev.provider == provider)
+    if key_pattern:
+        where.append(ev.event_key.like(like_pattern(key_pattern), escape="\\"))
+    if statuses:
+        where.append(ev.status.in_(list(statuses)))
+    return where
+
+
+def _prepare(db: Session, parsed: List[tuple], carried: Optional[tuple] = None, fresh: Iterable[int] = ()):
+    """webhook_processing.prepare(); rows in carried (states, refunds) replace the DB's,
+    transactions in fresh are folded from "created" (rebuild)."""
+    carried_states, carried_refunds = carried if carried is not None else ({}, {})
+    tx_ids = {p[0] for p in parsed}
+    states = transitions.load_states(db, tx_ids - carried_states.keys())
+    # copies: a batch that's redone must start from the same rows
+    states.update((t, copy.copy(carried_states[t])) for t in tx_ids & carried_states.keys())
+    wanted = webhook_processing.refund_tx_ids(parsed, states)
+    refunds = webhook_processing.newest_refunds(db, wanted - carried_refunds.keys())
+    refunds.update((t, copy.copy(carried_refunds[t])) for t in wanted & carried_refunds.keys())
+    for t in fresh:
+        if t in states:
+            states[t].status = "created"  # .before keeps the DB's, so the UPDATE and rollup still line up
+    return (states, refunds) + webhook_processing.fold(states, refunds, parsed)
+
+
+def _reasons(skipped: List[tuple]) -> Tally:
+    return Tally(reason for _, _, reason in skipped)
+
+
+def dry_batch(db: Session, parsed: List[tuple], carried: tuple, fresh: Iterable[int] = ()) -> tuple:
+    """apply_batch() that writes nothing.
+
+    carried is (tx_id -> state, tx_id -> refund) of rows earlier batches
+    would have changed; this batch's changes are added to it.
+    """
+    states, refunds, per_tx, skipped = _prepare(db, parsed, carried, fresh)
+    carried[0].update((t, s) for t, s in states.items() if transitions.changed(s))
+    carried[1].update((t, rf) for t, rf in refunds.items() if webhook_processing.refund_params(rf))
+    return sum(per_tx.values()), _reasons(skipped)
+
+
+def apply_batch(db: Session, parsed: List[tuple], fresh: Iterable[int] = ()) -> tuple:
+    """apply_notification() for bulk replay, on parse_items() tuples.
+
+    All changed transactions go out as one executemany of the versioned
+    UPDATE; if any of them lost a race the whole batch raises
+    transitions.Conflict and the worker rolls back and redoes it.
+    Transactions in fresh are folded from "created" (rebuild).
+    Returns (items that moved a transaction, skipped items per fold() reason).
+    Does not commit.
+    """
+    if not parsed:
+        return 0, Tally()
+    states, refunds, per_tx, skipped = _prepare(db, parsed, fresh=fresh)
+    moved = [s for s in states.values() if transitions.changed(s)]
+    conn = db.connection()
+    if moved:
+        res = conn.execute(transitions.batch_update, [transitions.batch_params(s) for s in moved])
+        if res.rowcount != len(moved):
+            raise transitions.Conflict(f"{len(moved) - res.rowcount} transactions changed during replay")
+    refund_rows = [p for p in (webhook_processing.refund_params(rf) for rf in refunds.values()) if p]
+    if refund_rows:
+        conn.execute(webhook_processing.refund_update, refund_rows)
+    deltas = transitions.new_deltas()
+    for state in moved:
+        transitions.add_move(deltas, state)
+    daily_stats.add_deltas(conn, deltas)
+    return sum(per_tx.values()), _reasons(skipped)
+
+
+class _Progress:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = 0
+        self.items = 0
+        self.unmatched = 0  # items without a tx_N merchantReference
+        self.applied = 0    # items that found their transaction
+        self.batches = 0
+        self.codes = Tally()
+        self.skipped = Tally()  # items the state machine refused, by fold() reason
+        self.error: Optional[BaseException] = None
+
+    def add(self, **kw) -> None:
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self, started: float) -> dict:
+        with self.lock:
+            secs = time.perf_counter() - started
+            return {
+                "events": self.events,
+                "items": self.items,
+                "applied": self.applied,
+                "unmatched": self.unmatched,
+                "batches": self.batches,
+                "seconds": round(secs, 2),
+                "events_per_second": round(self.events / secs) if secs > 0 else None,
+            }
+
+
+class _Worker(threading.Thread):
+    def __init__(self, n: int, session_factory, batch_size: int, dry_run: bool, progress: _Progress,
+                 rebuild: bool = False):
+        super().__init__(name=f"webhook-replay-{n}", daemon=True)
+        self.inbox: "queue.Queue[Optional[List[tuple]]]" = queue.Queue(QUEUE_DEPTH)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.carried = ({}, {})  # dry run: rows this worker would have changed so far
+        self.rebuild = rebuild
+        self.seen: set = set()  # rebuild: transactions already folded from "created"
+
+    def _apply(self, db, items: List[tuple]) -> None:
+        fresh = {p[0] for p in items} - self.seen if self.rebuild else ()
+        if self.dry_run:
+            try:
+                handled, skipped = dry_batch(db, items, self.carried, fresh)
+            finally:
+                db.rollback()  # nothing written, just ends the read transaction
+            self.seen.update(fresh)
+            self.progress.add(applied=handled, batches=1, skipped=skipped)
+            return
+        for attempt in range(RETRIES + 1):
+            try:
+                handled, skipped = apply_batch(db, items, fresh)
+                db.commit()
+                break
+            except (OperationalError, transitions.Conflict) as exc:
+                db.rollback()
+                if attempt == RETRIES:
+                    raise
+                if isinstance(exc, OperationalError) and getattr(exc.orig, "sqlstate", None) not in RETRY_SQLSTATES:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+        self.seen.update(fresh)
+        self.progress.add(applied=handled, batches=1, skipped=skipped)
+
+    def run(self) -> None:
+        pending: List[tuple] = []
+        db = self.session_factory()
+        try:
+            while True:
+                page = self.inbox.get()
+                if self.progress.error is not None:
+                    if page is None:
+                        return
+                    continue  # keep draining so the reader never blocks on us
+                try:
+                    if page is None:
+                        if pending:
+                            self._apply(db, pending)
+                        return
+                    pending.extend(page)
+                    while len(pending) >= self.batch_size:
+                        self._apply(db, pending[:self.batch_size])
+                        del pending[:self.batch_size]
+                except BaseException as exc:
+                    db.rollback()
+                    with self.progress.lock:
+                        self.progress.error = self.progress.error or exc
+        finally:
+            db.close()
+
+
+def replay(
+    session_factory,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    provider: Optional[str] = None,
+    key_pattern: Optional[str] = None,
+    statuses: Optional[Sequence[str]] = DEFAULT_STATUSES,
+    workers: int = 4,
+    batch_size: int = 1000,
+    page_size: int = 5000,
+    dry_run: bool = False,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    progress_every: float = 2.0,
+    rebuild: bool = False,
+) -> dict:
+    """Re-apply matching webhook events in received order per transaction. Returns totals.
+
+    rebuild: the filters (except provider/statuses) only select transactions;
+    all their events are replayed, folding each transaction from "created".
+    """
+    ev = models.WebhookEvent
+    where = _filters(since, until, provider, key_pattern, statuses)
+    selected = None
+    if rebuild:
+        selected = _transactions(session_factory, where, page_size)
+        where = _filters(None, None, provider, None, statuses)
+    progress = _Progress()
+    pool = [_Worker(i, session_factory, batch_size, dry_run, progress, rebuild) for i in range(max(1, workers))]
+    for w in pool:
+        w.start()
+
+    started = last_report = time.perf_counter()
+    last_id = 0
+    try:
+        while progress.error is None and (selected is None or selected):
+            with session_factory() as db:
+                rows = db.execute(
+                    select(ev.id, ev.raw_body, ev.raw_encoding, ev.raw_text)
+                    .where(*where, ev.id > last_id).order_by(ev.id).limit(page_size)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            _dispatch(rows, pool, progress, selected)
+
+            if on_progress and time.perf_counter() - last_report >= progress_every:
+                last_report = time.perf_counter()
+                on_progress(progress.snapshot(started))
+            if len(rows) < page_size:
+                break
+    finally:
+        for w in pool:
+            w.inbox.put(None)
+        for w in pool:
+            w.join()
+
+    if progress.error is not None:
+        raise progress.error
+    result = progress.snapshot(started)
+    result.update(last_event_id=last_id, workers=len(pool), dry_run=dry_run, event_codes=dict(progress.codes),
+                  skipped=dict(progress.skipped))
+    if rebuild:
+        result.update(rebuild=True, transactions=len(selected))
+    return result
+
+
+def _items(row):
+    """(raw items, parse_items() tuples) of one event row."""
+    body = decode_body(row.raw_body, row.raw_encoding) if row.raw_body is not None else row.raw_text
+    raw_items = [nri if isinstance(nri, dict) else {} for nri in notification_items(parse_payload(body))]
+    return raw_items, parse_items(raw_items)
+
+
+def _transactions(session_factory, where: list, page_size: int) -> set:
+    """tx ids named by the matching events (rebuild's selection)."""
+    ev = models.WebhookEvent
+    tx_ids, last_id = set(), 0
+    while True:
+        with session_factory() as db:
+            rows = db.execute(
+                select(ev.id, ev.raw_body, ev.raw_encoding, ev.raw_text)
+                .where(*where, ev.id > last_id).order_by(ev.id).limit(page_size)
+            ).all()
+        for row in rows:
+            tx_ids.update(p[0] for p in _items(row)[1])
+        if len(rows) < page_size:
+            return tx_ids
+        last_id = rows[-1].id
+
+
+def _dispatch(rows: Iterable, pool: List[_Worker], progress: _Progress, only: Optional[set] = None) -> None:
+    """Decode one page of events and hand each worker its transactions' items, in order.
+
+    only: just these transactions' items (rebuild); the rest count as events/items only.
+    """
+    pages: List[List[tuple]] = [[] for _ in pool]
+    events = items = unmatched = 0
+    codes = Tally()
+    for row in rows:
+        raw_items, parsed = _items(row)
+        events += 1
+        items += len(raw_items)
+        unmatched += len(raw_items) - len(parsed)
+        if only is not None:
+            parsed = [p for p in parsed if p[0] in only]
+        for p in parsed:
+            codes[p[1]] += 1
+            pages[p[0] % len(pool)].append(p)
+    with progress.lock:
+        progress.codes.update(codes)
+    progress.add(events=events, items=items, unmatched=unmatched)
+    for w, page in zip(pool, pages):
+        if page:
+            w.inbox.put(page)
@@ -0,0 +1,215 @@
+# backend/app/services/webhook_storage.py
+# How webhook_events keeps raw notifications, and how long.
+#
+# Bodies are stored zlib-compressed in raw_body (raw_encoding says how);
+# WebhookEvent.raw_json decodes transparently, so readers never see bytes.
+# Rows written before compression keep their text in the old raw_json column
+# until compress_legacy() rewrites them. Only WEBHOOK_HEADER_ALLOWLIST headers
+# are kept (no Authorization, cookies, proxy noise).
+#
+# RecentKeys remembers event keys this process has stored or seen, so the
+# endpoint can ack Adyen's retries without a query.
+#
+# Retention: purge_processed() deletes processed events older than
+# WEBHOOK_RETENTION_DAYS in batches of WEBHOOK_RETENTION_BATCH_SIZE, one short
+# transaction per batch, optionally appending them to a gzip JSONL archive
+# first. Pending/failed events are never touched.
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+
+from ..config import settings
+
+COMPRESS_LEVEL = 6
+MIN_COMPRESS_BYTES = 128  # tiny bodies don't shrink; store them as-is
+
+
+# ---- body codec ----
+
+def encode_body(body) -> Tuple[bytes, str]:
+    """str/bytes -> (stored bytes, encoding)."""
+    raw = body.encode("utf-8") if isinstance(body, str) else bytes(body)
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return raw, "identity"
+    return zlib.compress(raw, COMPRESS_LEVEL), "zlib"
+
+
+def decode_body(data: Optional[bytes], encoding: Optional[str]) -> Optional[str]:
+    if data is None:
+        return None
+    if encoding == "zlib":
+        data = zlib.decompress(data)
+    elif encoding not in (None, "identity"):
+        raise ValueError(f"unknown webhook body encoding {encoding!r}")
+    return bytes(data).decode("utf-8", "ignore")
+
+
+# ---- recently stored event keys ----
+
+class RecentKeys:
+    """Bounded LRU set of event keys known to be in webhook_events.
+
+    Exact, not a Bloom filter: a false positive here would ack a
+    notification without ever storing it. Only keys whose insert (or
+    conflict) was committed are added, and the DB stays the authority for
+    anything that has fallen out.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._keys: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key: str) -> bool:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+recent_event_keys = RecentKeys(settings.WEBHOOK_RECENT_KEYS)
+
+
+# ---- headers ----
+
+def _allowlist() -> frozenset:
+    return frozenset(h.strip().lower() for h in settings.WEBHOOK_HEADER_ALLOWLIST.split(",") if h.strip())
+
+
+def filter_headers(headers: Mapping[str, str]) -> str:
+    """JSON of just the allowlisted request headers."""
+    keep = _allowlist()
+    return json.dumps({k.lower(): v for k, v in headers.items() if k.lower() in keep}, sort_keys=True)
+
+
+# ---- retention ----
+
+def _archive_row(evt) -> dict:
+    return {
+        "id": evt.id,
+        "provider": evt.provider,
+        "event_key": evt.event_key,
+        "signature": evt.signature,
+        "headers": evt.headers,
+        "raw": evt.raw_json,
+        "status": evt.status,
+        "attempts": evt.attempts,
+        "created_at": evt.created_at.isoformat() if evt.created_at else None,
+        "processed_at": evt.processed_at.isoformat() if evt.processed_at else None,
+    }
+
+
+def purge_processed(
+    session_factory,
+    older_than_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    pause: float = 0.0,
+    max_batches: Optional[int] = None,
+    dry_run: bool = False,
+) -> dict:
+    """Delete (and optionally archive) processed events older than N days, batch by batch."""
+    from .. import models
+
+    ev = models.WebhookEvent
+    days = settings.WEBHOOK_RETENTION_DAYS if older_than_days is None else older_than_days
+    size = batch_size or settings.WEBHOOK_RETENTION_BATCH_SIZE
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    # rows migrated from before the inbox have no processed_at
+    old_enough = (ev.status == "processed", func.coalesce(ev.processed_at, ev.created_at) < cutoff)
+
+    if dry_run:
+        with session_factory() as db:
+            n = db.scalar(select(func.count()).select_from(ev).where(*old_enough))
+        return {"cutoff": cutoff.isoformat(), "matching": n, "deleted": 0, "batches": 0, "archive": None}
+
+    archive = None
+    archive_path = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"webhook_events-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.jsonl.gz")
+        archive = gzip.open(archive_path, "at", encoding="utf-8")
+
+    deleted = batches = 0
+    last_id = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            with session_factory() as db:
+                # walk the (status, id) index upwards; old events have the low ids
+                target = ev if archive else ev.id  # whole rows only when archiving
+                rows = db.scalars(select(target).where(*old_enough, ev.id > last_id).order_by(ev.id).limit(size)).all()
+                if not rows:
+                    break
+                ids = [r.id for r in rows] if archive else list(rows)
+                if archive:
+                    for evt in rows:
+                        archive.write(json.dumps(_archive_row(evt)) + "\n")
+                    archive.flush()
+                gone = (ev.id.in_(ids), ev.status == "processed")
+                links = models.WebhookEventTx
+                db.execute(delete(links).where(links.event_id.in_(select(ev.id).where(*gone))))
+                res = db.execute(delete(ev).where(*gone).execution_options(synchronize_session=False))
+                db.commit()
+            deleted += res.rowcount
+            batches += 1
+            last_id = ids[-1]
+            if len(ids) < size:
+                break
+            if pause:
+                time.sleep(pause)  # let the inbox workers and autovacuum breathe
+    finally:
+        if archive:
+            archive.close()
+    return {"cutoff": cutoff.isoformat(), "deleted": deleted, "batches": batches, "archive": archive_path}
+
+
+def compress_legacy(session_factory, batch_size: Optional[int] = None, pause: float = 0.0) -> int:
+    """Move bodies of pre-compression rows from raw_json text into raw_body. Returns rows rewritten."""
+    from .. import models
+
+    ev = models.WebhookEvent
+    size = batch_size or settings.WEBHOOK_RETENTION_BATCH_SIZE
+    done = 0
+    while True:
+        with session_factory() as db:
+            rows = db.execute(
+                select(ev.id, ev.raw_text, ev.headers).where(ev.raw_body.is_(None), ev.raw_text.is_not(None)).order_by(ev.id).limit(size)
+            ).all()
+            if not rows:
+                return done
+            for id_, text, headers in rows:
+                body, encoding = encode_body(text)
+                try:
+                    kept = filter_headers(json.loads(headers)) if headers else headers
+                except ValueError:
+                    kept = None
+                db.execute(
+                    update(ev).where(ev.id == id_)
+                    .values(raw_body=body, raw_encoding=encoding, raw_text=None, headers=kept)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        done += len(rows)
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,206 @@
+# backend/app/services/webhook_worker.py
+# In-process workers for the webhook inbox.
+#
+# The HTTP endpoint appends every notification to `webhook_events` with
+# status="pending" and returns. Worker threads claim pending rows in batches,
+# apply them (see webhook_processing.py) and mark each row processed, or
+# pending again / failed after WEBHOOK_MAX_ATTEMPTS errors. A failed attempt
+# backs off exponentially (next_attempt_at) instead of being re-claimed on the
+# spot. A notification that comes too early (a CAPTURE for a payment that
+# isn't authorised yet, see webhook_processing.NotYet) is retried the same
+# way; on its last attempt it's applied as far as it goes. Items the state
+# machine refuses are counted and listed in last_error of the processed row.
+#
+# Events of one transaction (webhook_event_txs) are applied in the order they
+# arrived: an event isn't claimable while an older one naming any of the same
+# transactions is being processed or hasn't been tried yet, so two workers
+# can't race a CAPTURE past its AUTHORISATION. An older event that already
+# failed an attempt doesn't hold newer ones back; it may well be waiting for
+# one of them.
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from ..config import settings
+from ..db import SessionLocal
+from .. import metrics, models
+from .webhook_processing import NotYet, apply_notification, describe, parse_payload
+
+log = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _due(ev, now: datetime):
+    return and_(ev.status == "pending", or_(ev.next_attempt_at.is_(None), ev.next_attempt_at <= now))
+
+
+def _claimable(now: datetime, stale_before: datetime):
+    ev = models.WebhookEvent
+    return or_(
+        _due(ev, now),
+        # a worker that died mid-batch leaves rows in "processing"
+        and_(ev.status == "processing", ev.claimed_at < stale_before),
+    )
+
+
+def _no_older_open(ev):
+    """No older event for any of its transactions untried or being worked on."""
+    mine, theirs = aliased(models.WebhookEventTx), aliased(models.WebhookEventTx)
+    older = aliased(models.WebhookEvent)
+    return ~exists().where(
+        mine.event_id == ev.id,
+        theirs.tx_id == mine.tx_id,
+        theirs.event_id < ev.id,
+        older.id == theirs.event_id,
+        or_(older.status == "processing", and_(older.status == "pending", older.attempts == 0)),
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before attempt number attempts + 1."""
+    base, cap = settings.WEBHOOK_RETRY_BASE_SECONDS, settings.WEBHOOK_RETRY_MAX_SECONDS
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+def claim_batch(db: Session, limit: int) -> List[models.WebhookEvent]:
+    """Atomically mark up to `limit` pending events as ours and return them (oldest first).
+
+    At most the oldest open event per transaction (an event naming several waits
+    for all of them); the rest wait for a later batch.
+    """
+    ev = models.WebhookEvent
+    now = _utcnow()
+    stale_before = now - timedelta(seconds=settings.WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+
+    q = select(ev.id).where(_claimable(now, stale_before), _no_older_open(ev)).order_by(ev.id).limit(limit)
+    if db.get_bind().dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    ids = db.scalars(q).all()
+    if not ids:
+        db.rollback()
+        return []
+
+    # The WHERE repeats the claim condition so two workers racing for the same
+    # ids can't both win (SQLite has no SKIP LOCKED).
+    token = uuid.uuid4().hex
+    db.execute(
+        update(ev)
+        .where(ev.id.in_(ids), _claimable(now, stale_before))
+        .values(status="processing", claim_token=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return list(db.scalars(select(ev).where(ev.claim_token == token).order_by(ev.id)))
+
+
+def process_event(db: Session, evt: models.WebhookEvent) -> bool:
+    """Apply one claimed event in its own DB transaction. Returns True on success."""
+    try:
+        last_try = (evt.attempts or 0) + 1 >= settings.WEBHOOK_MAX_ATTEMPTS
+        handled, skipped = apply_notification(db, parse_payload(evt.raw_json), retry_early=not last_try)
+        refused = [describe(s) for s in skipped if s[2] != "unchanged"]
+        received, now = evt.created_at, _utcnow()
+        evt.status = "processed"
+        evt.processed_at = now
+        evt.last_error = "; ".join(refused)[:2000] if refused else None
+        evt.next_attempt_at = None
+        db.commit()
+        metrics.webhook_processed.inc("processed")
+        metrics.webhook_items.inc(amount=handled)
+        for _, _, reason in skipped:
+            metrics.webhook_items_skipped.inc(reason)
+        if refused:
+            log.warning("Webhook event %s: skipped %s", evt.id, "; ".join(refused))
+        if received is not None:
+            if received.tzinfo is None:  # SQLite hands back naive UTC
+                received = received.replace(tzinfo=timezone.utc)
+            metrics.webhook_lag.observe(max(0.0, (now - received).total_seconds()))
+        return True
+    except Exception as exc:
+        db.rollback()
+        if isinstance(exc, NotYet):
+            log.info("Webhook event %s came early, will retry: %s", evt.id, exc)
+        else:
+            log.exception("Webhook event %s failed", evt.id)
+        evt = db.get(models.WebhookEvent, evt.id)
+        if evt is None:
+            return False
+        evt.attempts = (evt.attempts or 0) + 1
+        evt.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+        evt.status = "failed" if evt.attempts >= settings.WEBHOOK_MAX_ATTEMPTS else "pending"
+        evt.next_attempt_at = _utcnow() + timedelta(seconds=retry_delay(evt.attempts)) if evt.status == "pending" else None
+        evt.claim_token = None
+        db.commit()
+        metrics.webhook_processed.inc("failed" if evt.status == "failed" else "retry")
+        return False
+
+
+class WebhookWorkerPool:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+    ):
+        self.session_factory = session_factory
+        self.workers = workers if workers is not None else settings.WEBHOOK_WORKERS
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.poll_seconds = poll_seconds or settings.WEBHOOK_POLL_SECONDS
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def notify(self) -> None:
+        """Called by the endpoint after storing an event so workers don't wait for the next poll."""
+        self._wake.set()
+
+    def run_once(self) -> int:
+        """Claim and process one batch. Returns the number of events claimed."""
+        db = self.session_factory()
+        try:
+            events = claim_batch(db, self.batch_size)
+            for evt in events:
+                process_event(db, evt)
+            return len(events)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                log.exception("Webhook worker loop error")
+                claimed = 0
+            if claimed:
+                continue
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+
+webhook_workers = WebhookWorkerPool()
@@ -0,0 +1,41 @@
+# backend/app/startup.py
+# Per-phase startup timing. main.py wraps import/setup steps and the lifespan
+# steps in startup.phase(...); the breakdown is logged once the app is ready
+# and returned by /ready.
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+log = logging.getLogger("app.startup")
+
+
+class StartupReport:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_ms = None
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - t) * 1000))
+
+    def done(self) -> None:
+        self.ready_ms = (time.perf_counter() - self.t0) * 1000
+        log.info(
+            "startup %.0fms: %s", self.ready_ms,
+            ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.phases),
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases},
+            "total_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+        }
+
+
+startup = StartupReport()
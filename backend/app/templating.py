@@ -0,0 +1,77 @@
+# backend/app/templating.py
+# The one template environment shared by main (error pages), admin and public.
+# Built on first render, so importing the app doesn't pay for Jinja.
+#
+# Compiled templates go to a FileSystemBytecodeCache (TEMPLATE_CACHE_DIR), so a
+# new worker loads bytecode instead of parsing + compiling every template again;
+# `python scripts/precompile_templates.py` fills that cache at build time. In
+# prod auto_reload is off: once loaded, a template is never re-checked on disk.
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "templates"  # -> backend/templates
+DEFAULT_CACHE_DIR = TEMPLATES_DIR.parent / ".jinja_cache"
+
+log = logging.getLogger("app.templating")
+
+
+def _cache_dir(directory: Optional[str]) -> Optional[str]:
+    """The bytecode cache dir, created if needed; None if disabled or it can't be created."""
+    if directory == "":
+        return None
+    path = Path(directory) if directory else DEFAULT_CACHE_DIR
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        log.warning("template bytecode cache disabled: %s", exc)
+        return None
+    return str(path)
+
+
+def _bytecode_cache(directory: str):
+    from jinja2 import FileSystemBytecodeCache
+
+    class _Cache(FileSystemBytecodeCache):
+        # a read-only image still serves the precompiled files; never fail a render over a write
+        def dump_bytecode(self, bucket):
+            try:
+                super().dump_bytecode(bucket)
+            except OSError as exc:
+                log.debug("could not write template bytecode: %s", exc)
+
+    return _Cache(directory)
+
+
+def build(cache_dir: Optional[str] = None, auto_reload: Optional[bool] = None):
+    """A Jinja2Templates over templates/ with bytecode cache + reload policy from settings."""
+    from fastapi.templating import Jinja2Templates
+    from .config import settings
+
+    directory = _cache_dir(settings.TEMPLATE_CACHE_DIR if cache_dir is None else cache_dir)
+    return Jinja2Templates(
+        directory=str(TEMPLATES_DIR),
+        bytecode_cache=_bytecode_cache(directory) if directory else None,
+        auto_reload=settings.template_auto_reload if auto_reload is None else auto_reload,
+    )
+
+
+def precompile(env=None) -> List[str]:
+    """Load every template once so its bytecode lands in the cache. Returns the names."""
+    env = env or templates.env
+    names = [n for n in env.list_templates() if n.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+class _LazyTemplates:
+    _impl = None
+
+    def __getattr__(self, name):
+        if self._impl is None:
+            type(self)._impl = build()
+        return getattr(self._impl, name)
+
+
+templates = _LazyTemplates()
@@ -0,0 +1,3 @@
+# Benchmarks for the hot paths. Run from backend/, e.g.
+#   python -m bench.explain_plans --rows 200000
+# They create their own databases; point --pg-url at a scratch database.
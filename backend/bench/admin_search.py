@@ -0,0 +1,107 @@
+# backend/bench/admin_search.py
+# Latency of the admin search box (app.services.search) on a big table.
+#
+# Seeds --transactions transactions (bench.seed; PSP references look like
+# PSP0123456789AB) and --merchants merchants, then times search() for a mix of
+# what support types: a full PSP reference, its first/middle characters, a
+# merchant email, a name fragment, an email domain, 2 characters, and a miss.
+# Each kind runs --repeat times with fresh values; exits 1 if any p99 is over
+# --budget-ms. For comparison it also times the unindexed way once (LIKE
+# '%...%' over transactions), unless --no-scan.
+#
+#   python -m bench.admin_search --transactions 2000000
+#   python -m bench.admin_search --db-url postgresql://postgres@/tapsnap_bench?host=/tmp/pgdata
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _pct(samples, p):
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(len(s) * p))], 2) if s else None
+
+
+def _queries(refs, merchants, rnd):
+    """kind -> function returning a fresh query string."""
+    return {
+        "psp_exact": lambda: rnd.choice(refs),
+        "psp_prefix": lambda: rnd.choice(refs)[:9],
+        "psp_middle": lambda: rnd.choice(refs)[5:12].lower(),
+        "email_exact": lambda: rnd.choice(merchants).email,
+        "name_fragment": lambda: "chant " + rnd.choice(merchants).name.rsplit(" ", 1)[-1],
+        "email_domain": lambda: "bench.local",
+        "two_chars": lambda: rnd.choice(refs)[3:5],
+        "no_match": lambda: f"ZZ{rnd.getrandbits(40):010X}",
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="admin search latency")
+    ap.add_argument("--transactions", type=int, default=1_000_000)
+    ap.add_argument("--merchants", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=50, help="searches per query kind")
+    ap.add_argument("--budget-ms", type=float, default=50.0)
+    ap.add_argument("--no-scan", action="store_true", help="skip the unindexed LIKE comparison")
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file")
+    args = ap.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "search.db")
+    from sqlalchemy import func, select
+    from app import models
+    from app.db import SessionLocal, engine
+    from app.services import search
+    from bench.seed import seed
+
+    t0 = time.perf_counter()
+    seeded = seed(engine, args.transactions, merchants=args.merchants)
+    seed_s = time.perf_counter() - t0
+
+    rnd = random.Random(11)
+    T = models.Transaction
+    with SessionLocal() as db:
+        max_id = db.execute(select(func.max(T.id))).scalar_one()
+        sample_ids = [rnd.randint(1, max_id) for _ in range(args.repeat * 4)]
+        refs = [r for r in db.execute(select(T.psp_reference).where(T.id.in_(sample_ids))).scalars() if r]
+        merchants = db.execute(select(models.Merchant.name, models.Merchant.email).limit(args.merchants)).all()
+        substring = search.substring_search(db)
+
+    kinds = {}
+    over = []
+    with SessionLocal() as db:
+        search.search(db, refs[0])  # warm the connection and feature check
+        for kind, make in _queries(refs, merchants, rnd).items():
+            samples, found = [], 0
+            for _ in range(args.repeat):
+                q = make()
+                t = time.perf_counter()
+                res = search.search(db, q)
+                samples.append((time.perf_counter() - t) * 1000)
+                found += bool(res.merchants or res.transactions)
+            kinds[kind] = {"p50_ms": _pct(samples, 0.5), "p99_ms": _pct(samples, 0.99), "max_ms": _pct(samples, 1.0),
+                           "with_results": found}
+            if kinds[kind]["p99_ms"] > args.budget_ms:
+                over.append(kind)
+
+        scan = None
+        if not args.no_scan:
+            q = refs[1][5:12].lower()
+            t = time.perf_counter()
+            n = len(db.execute(
+                select(T.id).where(func.lower(T.psp_reference).like(f"%{q}%")).order_by(T.id.desc()).limit(search.CANDIDATES)
+            ).all())
+            scan = {"query": q, "rows": n, "ms": round((time.perf_counter() - t) * 1000, 2)}
+
+    print(json.dumps({
+        "database": engine.dialect.name, "transactions": seeded["transactions"], "merchants": seeded["merchants"],
+        "seed_seconds": round(seed_s, 1), "substring_index": substring, "budget_ms": args.budget_ms,
+        "kinds": kinds, "unindexed_like_scan": scan, "over_budget": over,
+    }, indent=2))
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# backend/bench/batch_throughput.py
+# Throughput of POST /api/v1/transactions/batch vs the single-item route.
+#
+# Drives the ASGI app in-process with httpx and creates the same number of
+# transactions both ways, then prints items/second for each.
+#
+#   python -m bench.batch_throughput --items 5000 --batch-sizes 50,200,500
+#   python -m bench.batch_throughput --db-url postgresql+psycopg://.../tapsnap_bench
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def _pct(samples, p):
+    if not samples:
+        return None
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(len(s) * p))], 3)
+
+
+async def _drive(client, requests, concurrency):
+    """Send (path, json) requests with `concurrency` workers; return latencies in ms."""
+    queue = asyncio.Queue()
+    for r in requests:
+        queue.put_nowait(r)
+    latencies = []
+
+    async def worker():
+        while True:
+            try:
+                path, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            resp = await client.post(path, json=body)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            resp.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def run(items: int, batch_sizes, concurrency: int) -> dict:
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/api/v1/merchants/", json={"name": "Bench", "email": f"bench{time.time_ns()}@example.com"})
+        r.raise_for_status()
+        mid = r.json()["id"]
+        item = {"merchant_id": mid, "amount_cents": 1234, "currency": "USD"}
+
+        results = {}
+        t0 = time.perf_counter()
+        lat = await _drive(client, [("/api/v1/transactions/", item)] * items, concurrency)
+        elapsed = time.perf_counter() - t0
+        results["single"] = {
+            "requests": items, "seconds": round(elapsed, 3), "items_per_s": round(items / elapsed, 1),
+            "p50_ms": _pct(lat, 0.50), "p95_ms": _pct(lat, 0.95),
+        }
+
+        for size in batch_sizes:
+            n_req = max(1, items // size)
+            body = {"items": [item] * size}
+            t0 = time.perf_counter()
+            lat = await _drive(client, [("/api/v1/transactions/batch", body)] * n_req, concurrency)
+            elapsed = time.perf_counter() - t0
+            results[f"batch_{size}"] = {
+                "requests": n_req, "seconds": round(elapsed, 3), "items_per_s": round(n_req * size / elapsed, 1),
+                "p50_ms": _pct(lat, 0.50), "p95_ms": _pct(lat, 0.95),
+            }
+
+    # pooled aiosqlite connections own non-daemon threads; close them or we never exit
+    from app.db import async_engine
+    await async_engine.dispose()
+    return results
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="single vs batch transaction creation")
+    ap.add_argument("--items", type=int, default=2000)
+    ap.add_argument("--batch-sizes", default="50,200,500")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--db-url", default=None, help="defaults to a fresh temp SQLite file")
+    args = ap.parse_args(argv)
+
+    # the app reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "batch_bench.db")
+    from app.db import engine
+    from bench.seed import prepare
+    prepare(engine)
+
+    sizes = [int(x) for x in args.batch_sizes.split(",") if x]
+    results = asyncio.run(run(args.items, sizes, args.concurrency))
+    base = results["single"]["items_per_s"]
+    for name, r in results.items():
+        r["speedup_vs_single"] = round(r["items_per_s"] / base, 1) if base else None
+    print(json.dumps({"database": os.environ["DATABASE_URL"].split("@")[-1], "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
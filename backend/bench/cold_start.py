@@ -0,0 +1,88 @@
+# backend/bench/cold_start.py
+# Time-to-first-request of a fresh process: import app.main, run the lifespan,
+# serve one API request. Each sample is a new interpreter, like a new container.
+#
+#   python -m bench.cold_start --runs 15 [--db-url ...] [--env prod]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = r"""
+import asyncio, json, time
+import httpx  # the client isn't part of the app's startup
+t0 = time.perf_counter()
+from app.main import app
+t_import = time.perf_counter()
+
+async def first_request():
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        t_ready = time.perf_counter()
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as c:
+            r = await c.get("/api/v1/transactions/?limit=1")
+        t_first = time.perf_counter()
+    from app.db import async_engine
+    await async_engine.dispose()
+    return r.status_code, t_ready, t_first
+
+status, t_ready, t_first = asyncio.run(first_request())
+try:
+    from app.startup import startup
+    phases = startup.as_dict()["phases_ms"]
+except ImportError:
+    phases = None
+print(json.dumps({
+    "status": status,
+    "import_ms": (t_import - t0) * 1000,
+    "ready_ms": (t_ready - t0) * 1000,
+    "first_request_ms": (t_first - t0) * 1000,
+    "phases_ms": phases,
+}))
+"""
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="cold start: import + lifespan + first request")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file (tables created first)")
+    ap.add_argument("--env", default=None, help="APP_ENV for the child (prod skips create_all)")
+    args = ap.parse_args(argv)
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "cold.db")
+    if args.env:
+        env["APP_ENV"] = args.env
+    # the schema exists already, as it would after `alembic upgrade head`
+    subprocess.run([sys.executable, "-c", "from app.db import init_db; init_db()"], env=env, check=True)
+
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], env=env, check=True, capture_output=True, text=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    def summary(key):
+        vals = [s[key] for s in samples]
+        return {"min": round(min(vals), 1), "median": round(statistics.median(vals), 1)}
+
+    phases = {}
+    for s in samples:
+        for name, ms in (s["phases_ms"] or {}).items():
+            phases.setdefault(name, []).append(ms)
+    print(json.dumps({
+        "runs": args.runs,
+        "app_env": env.get("APP_ENV", "dev"),
+        "database": env["DATABASE_URL"].split("://", 1)[0],
+        "import_ms": summary("import_ms"),
+        "ready_ms": summary("ready_ms"),
+        "first_request_ms": summary("first_request_ms"),
+        "phases_median_ms": {k: round(statistics.median(v), 1) for k, v in phases.items()},
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
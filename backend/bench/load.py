@@ -0,0 +1,253 @@
+# backend/bench/load.py
+# Load test for the hot endpoints: /checkout.json, POST /api/v1/transactions/,
+# /api/v1/webhooks/adyen (batched notifications, basic auth + HMAC) and /admin/.
+#
+# Seeds a dataset, then runs `--concurrency` httpx AsyncClient workers for
+# `--duration` seconds, each picking a route from the weighted `--mix`.
+# Prints (or writes with --out) JSON with throughput and p50/p95/p99 per
+# route, so two runs can be diffed.
+#
+# In-process (ASGI transport, app started with its lifespan):
+#   python -m bench.load --duration 20 --concurrency 16
+#   python -m bench.load --db-url postgresql+psycopg://postgres@localhost/tapsnap_bench
+# Against a running server (seed the same database it uses, pass its secrets):
+#   python -m bench.load --base-url http://127.0.0.1:8000 --db-url ... --webhook-secret ...
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+DEFAULT_MIX = "checkout_json=35,create_tx=30,webhook=25,admin=10"
+BENCH_SECRET = "bench-signing-secret"
+
+
+def _pct(sorted_ms, p):
+    if not sorted_ms:
+        return None
+    return round(sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * p))], 3)
+
+
+class Recorder:
+    """Latencies and status codes per route; samples before `start_at` are warmup."""
+
+    def __init__(self):
+        self.start_at = 0.0
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def add(self, route, t0, ms, status):
+        if t0 < self.start_at:
+            return
+        self.latencies[route].append(ms)
+        self.statuses[route][str(status)] += 1
+
+    def report(self, elapsed):
+        routes = {}
+        for route, lat in sorted(self.latencies.items()):
+            lat.sort()
+            routes[route] = {
+                "requests": len(lat),
+                "rps": round(len(lat) / elapsed, 1),
+                "mean_ms": round(sum(lat) / len(lat), 3),
+                "p50_ms": _pct(lat, 0.50),
+                "p95_ms": _pct(lat, 0.95),
+                "p99_ms": _pct(lat, 0.99),
+                "max_ms": round(lat[-1], 3),
+                "status": dict(self.statuses[route]),
+            }
+        total = sum(r["requests"] for r in routes.values())
+        return {
+            "seconds": round(elapsed, 3),
+            "requests": total,
+            "rps": round(total / elapsed, 1) if elapsed else None,
+            "errors": dict(self.errors),
+            "routes": routes,
+        }
+
+
+# ---- request builders ----
+
+class Workload:
+    def __init__(self, rnd, merchant_ids, tx_range, args):
+        self.rnd = rnd
+        self.merchant_ids = merchant_ids
+        self.tx_lo, self.tx_hi = tx_range
+        self.args = args
+        self.sent_webhooks = []  # recent bodies, some get re-sent like Adyen retries
+        admin = base64.b64encode(f"{args.admin_user}:{args.admin_pass}".encode()).decode()
+        hook = base64.b64encode(f"{args.webhook_user}:{args.webhook_pass}".encode()).decode()
+        self.admin_auth = {"Authorization": f"Basic {admin}"}
+        self.webhook_auth = {"Authorization": f"Basic {hook}"}
+
+    def checkout_json(self, client):
+        data = {"merchant_id": self.rnd.choice(self.merchant_ids), "amount": f"{self.rnd.randint(100, 20000) / 100:.2f}", "currency": "USD"}
+        return client.post("/checkout.json", data=data)
+
+    def create_tx(self, client):
+        body = {"merchant_id": self.rnd.choice(self.merchant_ids), "amount_cents": self.rnd.randint(100, 50000), "currency": "USD"}
+        return client.post("/api/v1/transactions/", json=body)
+
+    def webhook(self, client):
+        rnd = self.rnd
+        if self.sent_webhooks and rnd.random() < self.args.webhook_dup_ratio:
+            raw = rnd.choice(self.sent_webhooks)
+        else:
+            items = []
+            for _ in range(rnd.randint(1, self.args.webhook_items)):
+                tx_id = rnd.randint(self.tx_lo, self.tx_hi)
+                items.append({"NotificationRequestItem": {
+                    "eventCode": rnd.choices(["AUTHORISATION", "CAPTURE", "REFUND"], [6, 3, 1])[0],
+                    "success": "true" if rnd.random() < 0.9 else "false",
+                    "pspReference": uuid.uuid4().hex[:16].upper(),
+                    "merchantReference": f"tx_{tx_id}",
+                    "amount": {"value": rnd.randint(100, 50000), "currency": "USD"},
+                }})
+            raw = json.dumps({"live": "false", "notificationItems": items}).encode()
+            self.sent_webhooks.append(raw)
+            del self.sent_webhooks[:-200]
+        headers = {**self.webhook_auth, "Content-Type": "application/json"}
+        if self.args.webhook_secret:
+            headers["X-Signature"] = hmac.new(self.args.webhook_secret.encode(), raw, hashlib.sha256).hexdigest()
+        return client.post("/api/v1/webhooks/adyen", content=raw, headers=headers)
+
+    def admin(self, client):
+        rnd = self.rnd
+        params = {}
+        if rnd.random() < 0.4:
+            params["status"] = rnd.choice(["authorised", "captured", "refunded", "created"])
+        if rnd.random() < 0.3:
+            params["merchant_id"] = rnd.choice(self.merchant_ids)
+        return client.get("/admin/", params=params, headers=self.admin_auth)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def _worker(client, workload, mix, rec, stop_at, worker_id):
+    names, weights = list(mix), list(mix.values())
+    # each worker looks like a different client so per-IP rate limits behave like production
+    client.headers["X-Forwarded-For"] = f"10.9.{worker_id // 250}.{worker_id % 250 + 1}"
+    while time.perf_counter() < stop_at:
+        route = workload.rnd.choices(names, weights)[0]
+        t0 = time.perf_counter()
+        try:
+            resp = await getattr(workload, route)(client)
+            status = resp.status_code
+        except Exception as e:  # connection errors against a remote server
+            rec.errors[type(e).__name__] += 1
+            status = "error"
+        rec.add(route, t0, (time.perf_counter() - t0) * 1000, status)
+
+
+async def run(args, merchant_ids, tx_range) -> dict:
+    import httpx
+
+    mix = parse_mix(args.mix)
+    rec = Recorder()
+    rnd = random.Random(args.seed)
+    workload = Workload(rnd, merchant_ids, tx_range, args)
+
+    async def drive(make_client):
+        clients = [make_client() for _ in range(args.concurrency)]
+        t0 = time.perf_counter()
+        rec.start_at = t0 + args.warmup
+        stop_at = rec.start_at + args.duration
+        await asyncio.gather(*(_worker(c, workload, mix, rec, stop_at, i) for i, c in enumerate(clients)))
+        for c in clients:
+            await c.aclose()
+        return time.perf_counter() - rec.start_at
+
+    if args.base_url:
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        elapsed = await drive(lambda: httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30))
+    else:
+        from app.main import app
+        from app.db import async_engine
+
+        # app errors come back as 500s (like uvicorn) instead of raising in the worker
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        # run the app's startup/shutdown (webhook workers etc.) like uvicorn would
+        async with app.router.lifespan_context(app):
+            elapsed = await drive(lambda: httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30))
+        # pooled aiosqlite connections own non-daemon threads; close them or we never exit
+        await async_engine.dispose()
+    return rec.report(elapsed)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="load test the hot endpoints, JSON latency report")
+    ap.add_argument("--db-url", default=None, help="defaults to a fresh temp SQLite file")
+    ap.add_argument("--base-url", default=None, help="hit a running server instead of the in-process app")
+    ap.add_argument("--transactions", type=int, default=20_000, help="seeded transactions")
+    ap.add_argument("--merchants", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=15.0, help="measured seconds")
+    ap.add_argument("--warmup", type=float, default=2.0, help="seconds not counted")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="route=weight,... (checkout_json, create_tx, webhook, admin)")
+    ap.add_argument("--webhook-items", type=int, default=20, help="max notification items per webhook")
+    ap.add_argument("--webhook-dup-ratio", type=float, default=0.05, help="share of webhooks that are re-sends")
+    ap.add_argument("--webhook-secret", default=None, help="HMAC secret (in-process default: a bench secret)")
+    ap.add_argument("--webhook-user", default=os.getenv("WEBHOOK_USER", "tapsnap"))
+    ap.add_argument("--webhook-pass", default=os.getenv("WEBHOOK_PASS", "supersecret4321$"))
+    ap.add_argument("--admin-user", default=os.getenv("ADMIN_USER", "admin"))
+    ap.add_argument("--admin-pass", default=os.getenv("ADMIN_PASSWORD", "changeme"))
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=None, help="also write the JSON report here")
+    args = ap.parse_args(argv)
+
+    # the app reads its settings at import time
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_bench.db")
+    if not args.base_url:
+        args.webhook_secret = args.webhook_secret or BENCH_SECRET
+        os.environ["WEBHOOK_SIGNING_SECRET"] = args.webhook_secret
+        # measure the endpoints, not the rate limiter's 429s
+        os.environ.setdefault("ADMIN_RATE_LIMIT", "1000000/s")
+        os.environ.setdefault("WEBHOOK_RATE_LIMIT", "1000000/s")
+
+    from sqlalchemy import func, select
+    from app.db import engine
+    from app import models
+    from bench.seed import seed
+
+    t0 = time.perf_counter()
+    seeded = seed(engine, args.transactions, merchants=args.merchants, seed_value=args.seed)
+    seeded["seconds"] = round(time.perf_counter() - t0, 2)
+    with engine.connect() as conn:
+        merchant_ids = list(conn.execute(select(models.Merchant.id)).scalars())
+        tx_range = conn.execute(select(func.min(models.Transaction.id), func.max(models.Transaction.id))).one()
+    engine.dispose()
+
+    report = asyncio.run(run(args, merchant_ids, tuple(tx_range)))
+    out = {
+        "database": engine.dialect.name,
+        "target": args.base_url or "in-process",
+        "config": {k: getattr(args, k) for k in ("transactions", "merchants", "duration", "warmup", "concurrency", "mix", "webhook_items", "webhook_dup_ratio", "seed")},
+        "seed": seeded,
+        **report,
+    }
+    text = json.dumps(out, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# backend/bench/payouts.py
+# Throughput and memory of the payout job (app.services.payouts) on a big table.
+#
+# Seeds --transactions transactions over --merchants merchants (bench.seed;
+# about a third captured, some refunded), then for each --workers value
+# empties payouts/payout_items and pays everything out from scratch. After
+# the last one it checks the payouts add up to the captured total computed
+# directly, and times a re-run (nothing new: the anti-join over already paid
+# transactions is all it costs). Peak RSS is reported to show memory doesn't
+# grow with the table.
+#
+#   python -m bench.payouts --transactions 2000000 --merchants 20000
+#   python -m bench.payouts --db-url postgresql://postgres@/tapsnap_bench?host=/tmp/pgdata --workers 1,4
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="payout job throughput")
+    ap.add_argument("--transactions", type=int, default=1_000_000)
+    ap.add_argument("--merchants", type=int, default=10_000)
+    ap.add_argument("--workers", default="1", help="comma-separated worker counts, one full run each")
+    ap.add_argument("--chunk-size", type=int, default=1000, help="merchant ids per chunk")
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file")
+    args = ap.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "payouts.db")
+    from sqlalchemy import delete, func, select
+    from app import models
+    from app.db import SessionLocal, engine
+    from app.services import payouts
+    from bench.seed import seed
+
+    t0 = time.perf_counter()
+    seeded = seed(engine, args.transactions, merchants=args.merchants)
+    seed_s = time.perf_counter() - t0
+
+    T = models.Transaction
+    runs = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        with engine.begin() as conn:
+            conn.execute(delete(models.PayoutItem))
+            conn.execute(delete(models.Payout))
+        r = payouts.run(SessionLocal, chunk_size=args.chunk_size, workers=workers)
+        runs.append({k: r[k] for k in ("workers", "chunks", "payouts", "items", "paid_cents", "seconds")})
+        runs[-1]["items_per_second"] = round(r["items"] / r["seconds"]) if r["seconds"] else None
+
+    with engine.connect() as conn:
+        captured = conn.execute(
+            select(func.coalesce(func.sum(T.amount_cents), 0)).where(T.status == "captured")
+        ).scalar_one()
+    rerun = payouts.run(SessionLocal, chunk_size=args.chunk_size, workers=runs[-1]["workers"])
+
+    print(json.dumps({
+        "database": engine.dialect.name, "transactions": seeded["transactions"], "merchants": seeded["merchants"],
+        "seed_seconds": round(seed_s, 1), "chunk_size": args.chunk_size, "runs": runs,
+        "paid_matches_captured": runs[-1]["paid_cents"] == int(captured),
+        "rerun": {k: rerun[k] for k in ("payouts", "items", "seconds")},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }, indent=2))
+    return 0 if runs[-1]["paid_cents"] == int(captured) and not rerun["payouts"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
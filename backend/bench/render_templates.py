@@ -0,0 +1,115 @@
+# backend/bench/render_templates.py
+# Render time of admin/index.html with 10/100/1000 transaction rows, old
+# template setup vs the shared environment in app/templating.py.
+#
+#   before: Jinja2Templates(directory=...) as admin/public/main each built it -
+#           no bytecode cache, auto_reload on (a stat() per get_template)
+#   after:  app.templating.build() in prod mode - FileSystemBytecodeCache filled
+#           by precompile(), auto_reload off
+#
+# "cold" is a fresh environment's first render (what every new worker pays:
+# compile from source vs load bytecode), "warm" is the steady state. Each
+# render goes through get_template() like TemplateResponse does.
+#
+#   python -m bench.render_templates --rows 10,100,1000 --repeat 200
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+TEMPLATE = "admin/index.html"
+
+
+def _context(rows: int) -> dict:
+    now = datetime(2026, 10, 1, 12, 0, 0)
+    statuses = ["authorised", "captured", "refunded", "created"]
+    merchants = [
+        SimpleNamespace(id=i, name=f"Merchant {i}", email=f"m{i}@example.com", created_at=now - timedelta(days=i))
+        for i in range(1, 21)
+    ]
+    txs = [
+        SimpleNamespace(
+            id=100000 - i, merchant_id=i % 20 + 1, amount_cents=1000 + i * 7, currency="USD",
+            status=statuses[i % 4], psp_reference=f"PSP{i:012d}" if i % 3 else None,
+            created_at=now - timedelta(minutes=i),
+        )
+        for i in range(rows)
+    ]
+    by_status = {s: {"count": 10, "amount_cents": 12345} for s in statuses}
+    totals = {"USD": {"by_status": by_status, "tx_count": 40, "approved": 30, "volume_cents": 37035,
+                      "refunded_cents": 12345, "approval_rate": 1.0, "refund_rate": 0.3333}}
+    return {
+        "request": None, "merchants": merchants, "stats_days": 30, "stats_totals": totals,
+        "top_merchants": [{"id": m.id, "name": m.name, "currency": "USD", "volume_cents": 5000, "approved": 3} for m in merchants[:5]],
+        "txs": txs, "page": 1, "pages": 10, "count": SimpleNamespace(kind="exact", label=f"{rows * 10:,}"), "has_prev": False, "has_next": True,
+        "prev_url": None, "next_url": "/admin/?page=2&after=abc",
+        "status": None, "merchant_id": None, "from": None, "to": None,
+    }
+
+
+def _render(env, ctx) -> str:
+    return env.get_template(TEMPLATE).render(ctx)
+
+
+def _cold(make_env, ctx, samples: int) -> float:
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        _render(make_env(), ctx)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def _warm(env, ctx, repeat: int) -> float:
+    _render(env, ctx)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        _render(env, ctx)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="admin/index.html render time, before/after the shared env")
+    ap.add_argument("--rows", default="10,100,1000")
+    ap.add_argument("--repeat", type=int, default=200, help="warm renders per case")
+    ap.add_argument("--cold-samples", type=int, default=20, help="fresh environments per case")
+    args = ap.parse_args(argv)
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "render.db"))
+    from fastapi.templating import Jinja2Templates
+    from app.templating import TEMPLATES_DIR, build, precompile
+
+    cache_dir = tempfile.mkdtemp(prefix="jinja_bench_")
+    precompile(build(cache_dir=cache_dir, auto_reload=False).env)
+
+    def before():
+        return Jinja2Templates(directory=str(TEMPLATES_DIR)).env
+
+    def after():
+        return build(cache_dir=cache_dir, auto_reload=False).env
+
+    results = []
+    warm_before, warm_after = before(), after()
+    for rows in [int(r) for r in args.rows.split(",")]:
+        ctx = _context(rows)
+        assert _render(warm_before, ctx) == _render(warm_after, ctx)
+        results.append({
+            "rows": rows,
+            "cold_before_ms": round(_cold(before, ctx, args.cold_samples), 3),
+            "cold_after_ms": round(_cold(after, ctx, args.cold_samples), 3),
+            "warm_before_ms": round(_warm(warm_before, ctx, args.repeat), 3),
+            "warm_after_ms": round(_warm(warm_after, ctx, args.repeat), 3),
+        })
+    print(json.dumps({"template": TEMPLATE, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
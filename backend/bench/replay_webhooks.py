@@ -0,0 +1,87 @@
+# backend/bench/replay_webhooks.py
+# Throughput of app.services.webhook_replay over a seeded webhook_events table.
+#
+# Seeds --transactions transactions (bench.seed) and --events stored
+# notifications against them (AUTHORISATION -> CAPTURE -> some REFUNDs, single
+# and batched items, compressed like the endpoint stores them), then replays
+# everything once per --workers value and prints events/second.
+#
+#   python -m bench.replay_webhooks --events 200000 --workers 1,4
+#   python -m bench.replay_webhooks --db-url postgresql://postgres@/tapsnap_bench?host=/tmp/pgdata --workers 1,4,8
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _seed_events(engine, events: int, tx_ids, batch: int = 5000, seed_value: int = 7) -> int:
+    from sqlalchemy import func, insert, select
+    from app import models
+    from app.services.webhook_storage import encode_body
+
+    ev = models.WebhookEvent
+    with engine.begin() as conn:
+        have = conn.execute(select(func.count()).select_from(ev)).scalar_one()
+    rnd = random.Random(seed_value)
+    codes = ["AUTHORISATION", "CAPTURE", "CAPTURE", "REFUND"]
+    n = have
+    while n < events:
+        rows = []
+        for _ in range(min(batch, events - n)):
+            items = []
+            for _ in range(1 if rnd.random() < 0.8 else rnd.randint(2, 5)):
+                items.append({"NotificationRequestItem": {
+                    "eventCode": rnd.choice(codes), "success": "true" if rnd.random() < 0.95 else "false",
+                    "merchantReference": f"tx_{rnd.choice(tx_ids)}", "pspReference": f"PSP{rnd.getrandbits(48):012X}",
+                    "amount": {"value": rnd.randint(100, 50_000), "currency": "USD"},
+                }})
+            body, encoding = encode_body(json.dumps({"live": "false", "notificationItems": items}))
+            rows.append({
+                "provider": "adyen", "event_key": f"bench:{n}", "raw_body": body, "raw_encoding": encoding,
+                "headers": "{}", "status": "processed", "attempts": 1,
+            })
+            n += 1
+        with engine.begin() as conn:
+            conn.execute(insert(ev), rows)
+    return n
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="webhook replay throughput")
+    ap.add_argument("--events", type=int, default=100_000)
+    ap.add_argument("--transactions", type=int, default=50_000)
+    ap.add_argument("--workers", default="1,4")
+    ap.add_argument("--batch-size", type=int, default=1000)
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file")
+    args = ap.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "replay.db")
+    from sqlalchemy import select
+    from app import models
+    from app.db import SessionLocal, engine
+    from app.services import webhook_replay
+    from bench.seed import seed
+
+    t0 = time.perf_counter()
+    seed(engine, args.transactions)
+    with engine.connect() as conn:
+        tx_ids = list(conn.execute(select(models.Transaction.id)).scalars())
+    total = _seed_events(engine, args.events, tx_ids)
+    seeded_s = time.perf_counter() - t0
+
+    runs = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        r = webhook_replay.replay(SessionLocal, statuses=None, workers=workers, batch_size=args.batch_size)
+        runs.append({k: r[k] for k in ("workers", "events", "items", "applied", "batches", "seconds", "events_per_second")})
+    print(json.dumps({
+        "database": engine.dialect.name, "events": total, "transactions": len(tx_ids),
+        "seed_seconds": round(seeded_s, 1), "runs": runs,
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# backend/bench/transition_contention.py
+# Many tasks racing to change the status of the same transaction.
+#
+# Each round creates one transaction and starts --tasks coroutines at once,
+# each with its own session, all trying to authorise it (a confirm racing
+# webhook AUTHORISATION retries): exactly one should win. Three ways:
+#
+#   rmw         the old code: db.get(), set .status, commit
+#   for_update  SELECT ... FOR UPDATE, check, set, commit (Postgres only)
+#   conditional services/transitions.py: one UPDATE ... WHERE status IN (...) AND version = ?
+#
+# Reports attempts/second, latency, rounds where more than one task believed
+# it won (lost updates) and how far merchant_daily_stats drifted from a rebuild.
+#
+#   python -m bench.transition_contention --rounds 50 --tasks 32
+#   python -m bench.transition_contention --db-url postgresql://postgres@/tapsnap_bench?host=/tmp/pgdata
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def _pct(samples, p):
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(len(s) * p))], 2) if s else None
+
+
+async def _rmw(make_session, tx_id, target):
+    from app import models
+    async with make_session() as db:
+        tx = await db.get(models.Transaction, tx_id)
+        if tx.status != "created":
+            return False
+        tx.status = target
+        await db.commit()
+        return True
+
+
+async def _for_update(make_session, tx_id, target):
+    from sqlalchemy import select
+    from app import models
+    async with make_session() as db:
+        tx = (await db.scalars(select(models.Transaction).where(models.Transaction.id == tx_id).with_for_update())).one()
+        if tx.status != "created":
+            await db.rollback()
+            return False
+        tx.status = target
+        await db.commit()
+        return True
+
+
+async def _conditional(make_session, tx_id, target):
+    from app.services import transitions
+    async with make_session() as db:
+        outcome = await transitions.transition_async(db, tx_id, target)
+        await db.commit()
+        return outcome.applied
+
+
+MODES = {"rmw": _rmw, "for_update": _for_update, "conditional": _conditional}
+
+
+async def _run_mode(mode, rounds, tasks, merchant_id):
+    from app import models
+    from app.db import AsyncSessionLocal
+
+    attempt = MODES[mode]
+    latencies, errors, multi_winner = [], 0, 0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        async with AsyncSessionLocal() as db:
+            tx = models.Transaction(merchant_id=merchant_id, amount_cents=1000, currency="USD", status="created")
+            db.add(tx)
+            await db.commit()
+            tx_id = tx.id
+        start = asyncio.Event()
+
+        async def one():
+            await start.wait()
+            t = time.perf_counter()
+            try:
+                return await attempt(AsyncSessionLocal, tx_id, "authorised")
+            finally:
+                latencies.append((time.perf_counter() - t) * 1000)
+
+        running = [asyncio.create_task(one()) for _ in range(tasks)]
+        await asyncio.sleep(0)
+        start.set()
+        results = await asyncio.gather(*running, return_exceptions=True)
+        errors += sum(1 for r in results if isinstance(r, BaseException))
+        multi_winner += sum(1 for r in results if r is True) > 1
+    elapsed = time.perf_counter() - t0
+    return {
+        "mode": mode,
+        "attempts_per_second": round(rounds * tasks / elapsed),
+        "p50_ms": _pct(latencies, 0.5),
+        "p99_ms": _pct(latencies, 0.99),
+        "errors": errors,
+        "rounds_with_lost_updates": multi_winner,
+    }
+
+
+def _drift(engine) -> int:
+    """Sum of |tx_count| differences between the live rollup and a rebuild."""
+    from sqlalchemy import select
+    from app import models
+    from app.services import daily_stats
+
+    S = models.MerchantDailyStat
+    cols = (S.merchant_id, S.day, S.currency, S.status)
+    with engine.connect() as conn:
+        live = {tuple(r[:4]): r[4] for r in conn.execute(select(*cols, S.tx_count))}
+    daily_stats.rebuild(engine)
+    with engine.connect() as conn:
+        rebuilt = {tuple(r[:4]): r[4] for r in conn.execute(select(*cols, S.tx_count))}
+    return sum(abs(live.get(k, 0) - rebuilt.get(k, 0)) for k in set(live) | set(rebuilt))
+
+
+async def _main(args):
+    from app import models
+    from app.db import AsyncSessionLocal, async_engine, engine, init_db
+
+    init_db()
+    async with AsyncSessionLocal() as db:
+        m = models.Merchant(name="Contention", email=f"contention-{time.time_ns()}@bench.local")
+        db.add(m)
+        await db.commit()
+        merchant_id = m.id
+
+    modes = [m for m in args.modes.split(",") if engine.dialect.name == "postgresql" or m != "for_update"]
+    results = []
+    for mode in modes:
+        r = await _run_mode(mode, args.rounds, args.tasks, merchant_id)
+        r["rollup_drift"] = _drift(engine)  # rebuild() resets it for the next mode
+        results.append(r)
+    await async_engine.dispose()
+    return {"database": engine.dialect.name, "rounds": args.rounds, "tasks": args.tasks, "results": results}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="status transitions under contention on one transaction")
+    ap.add_argument("--rounds", type=int, default=30)
+    ap.add_argument("--tasks", type=int, default=32, help="concurrent writers per transaction")
+    ap.add_argument("--modes", default="rmw,for_update,conditional")
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file")
+    args = ap.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "contention.db")
+    print(json.dumps(asyncio.run(_main(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Compile every template under templates/ into the Jinja bytecode cache.
+
+    python scripts/precompile_templates.py                  # -> TEMPLATE_CACHE_DIR (default backend/.jinja_cache)
+    python scripts/precompile_templates.py --cache-dir /srv/jinja
+
+Run at image build time (see the Dockerfile) so new workers load bytecode
+instead of parsing and compiling admin/, public/, errors/ and base.html.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.templating import build, precompile  # noqa: E402
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--cache-dir", default=None, help="overrides TEMPLATE_CACHE_DIR")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    env = build(cache_dir=args.cache_dir).env
+    if env.bytecode_cache is None:
+        print("template bytecode cache is disabled (TEMPLATE_CACHE_DIR=\"\")", file=sys.stderr)
+        return 1
+    names = precompile(env)
+    print(f"{len(names)} templates compiled into {env.bytecode_cache.directory} in {time.perf_counter() - t0:.2f}s")
+    for name in names:
+        print(f"  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
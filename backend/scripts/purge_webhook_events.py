@@ -0,0 +1,49 @@
+"""Delete (or archive, then delete) processed webhook events past retention.
+
+    python scripts/purge_webhook_events.py                        # WEBHOOK_RETENTION_DAYS, batches of WEBHOOK_RETENTION_BATCH_SIZE
+    python scripts/purge_webhook_events.py --days 14 --archive-dir /var/backups/webhooks
+    python scripts/purge_webhook_events.py --dry-run              # just count what would go
+    python scripts/purge_webhook_events.py --compress-legacy      # also compress rows stored before 0007
+
+Meant for cron. Each batch is its own short transaction, so the inbox workers
+and the webhook endpoint keep running while it works. Pending and failed
+events are never deleted.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.config import settings  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.services import webhook_storage  # noqa: E402
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--days", type=int, default=settings.WEBHOOK_RETENTION_DAYS)
+    ap.add_argument("--batch-size", type=int, default=settings.WEBHOOK_RETENTION_BATCH_SIZE)
+    ap.add_argument("--archive-dir", default=settings.WEBHOOK_ARCHIVE_DIR, help="write purged events to gzip JSONL here first")
+    ap.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    ap.add_argument("--max-batches", type=int, default=None, help="stop after this many batches")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--compress-legacy", action="store_true", help="move uncompressed bodies into raw_body")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    result = webhook_storage.purge_processed(
+        SessionLocal, args.days, args.batch_size, args.archive_dir,
+        pause=args.pause, max_batches=args.max_batches, dry_run=args.dry_run,
+    )
+    if args.compress_legacy and not args.dry_run:
+        result["compressed"] = webhook_storage.compress_legacy(SessionLocal, args.batch_size, pause=args.pause)
+    result["seconds"] = round(time.perf_counter() - t0, 2)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
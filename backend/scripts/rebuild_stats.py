@@ -0,0 +1,35 @@
+"""Rebuild merchant_daily_stats from transactions.
+
+    python scripts/rebuild_stats.py                      # everything
+    python scripts/rebuild_stats.py --start 2026-10-01   # just these days (inclusive)
+    python scripts/rebuild_stats.py --start 2026-10-01 --end 2026-10-07
+
+Safe to run while the app is up: it runs in one transaction (and locks the
+rollup table on Postgres), so incremental updates never get lost.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.db import engine  # noqa: E402
+from app.services import daily_stats  # noqa: E402
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--start", type=date.fromisoformat, default=None)
+    ap.add_argument("--end", type=date.fromisoformat, default=None)
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    rows = daily_stats.rebuild(engine, args.start, args.end)
+    print(f"merchant_daily_stats: {rows} rows rebuilt in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Create payouts: captured minus refunded per merchant since its last payout.
+
+    python scripts/run_payouts.py                          # everything payable now
+    python scripts/run_payouts.py --until 2026-10-18       # captures and refunds from before this
+    python scripts/run_payouts.py --workers 8 --chunk-size 2000
+    python scripts/run_payouts.py --dry-run                # compute, report, roll back
+
+Safe to re-run (and to run again after a crash): transactions already in a
+payout are skipped via payout_items. Refunds outweighing captures are
+recorded as a "carried" payout the next one absorbs. Merchants go in id
+ranges of --chunk-size, --workers at a time, each range in its own
+transaction.
+Progress goes to stderr, the totals to stdout as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.db import SessionLocal, engine  # noqa: E402
+from app.services import payouts  # noqa: E402
+
+
+def _when(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _progress(p: dict) -> None:
+    print(
+        f"chunks {p['chunks']:,}/{p['of']:,}  payouts {p['payouts']:,}  items {p['items']:,}  "
+        f"paid {p['paid_cents'] / 100:,.2f}  {p['seconds']}s",
+        file=sys.stderr, flush=True,
+    )
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--until", type=_when, default=None, help="only captures/refunds from before (ISO date/time, UTC)")
+    ap.add_argument("--scheduled-at", type=_when, default=None, help="payouts' scheduled_at (default: now)")
+    ap.add_argument("--chunk-size", type=int, default=1000, help="merchant ids per transaction")
+    # SQLite allows one writer at a time; more threads only wait on the lock
+    default_workers = 1 if engine.dialect.name == "sqlite" else 4
+    ap.add_argument("--workers", type=int, default=default_workers)
+    ap.add_argument("--dry-run", action="store_true", help="compute everything, then roll back")
+    ap.add_argument("--quiet", action="store_true", help="no progress lines")
+    args = ap.parse_args(argv)
+
+    result = payouts.run(
+        SessionLocal, until=args.until, scheduled_at=args.scheduled_at, chunk_size=args.chunk_size,
+        workers=args.workers, dry_run=args.dry_run, on_progress=None if args.quiet else _progress,
+    )
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
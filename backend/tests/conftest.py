@@ -0,0 +1,95 @@
+# backend/tests/conftest.py
+# Tests run against a throwaway SQLite file: DATABASE_URL has to be set before
+# anything imports app.db, which builds its engines at import time.
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+_tmp = tempfile.mkdtemp(prefix="tapsnap-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["DATABASE_REPLICA_URL"] = ""
+os.environ.pop("SLOW_QUERY_MS", None)
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import models  # noqa: E402
+from app.db import Base, SessionLocal, engine, init_db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def merchant(db):
+    m = models.Merchant(name="Corner Cafe", email="cafe@example.com")
+    db.add(m)
+    db.commit()
+    return m
+
+
+@pytest.fixture
+def make_tx(db, merchant):
+    def make(status="created", amount_cents=1000, merchant_id=None):
+        tx = models.Transaction(merchant_id=merchant_id or merchant.id, amount_cents=amount_cents,
+                                currency="EUR", status=status)
+        db.add(tx)
+        db.commit()
+        return tx
+    return make
+
+
+def notification(*items):
+    """Adyen-shaped payload; items are (tx_id, event_code) or (tx_id, event_code, success)."""
+    return {"notificationItems": [
+        {"NotificationRequestItem": {
+            "eventCode": code, "success": "true" if (rest[0] if rest else True) else "false",
+            "merchantReference": f"tx_{tx_id}", "pspReference": f"PSP{tx_id}{code[:3]}",
+        }}
+        for tx_id, code, *rest in items
+    ]}
+
+
+@pytest.fixture
+def store_event(db):
+    """Put a notification in the inbox the way the endpoint does."""
+    def store(*items, key=None):
+        payload = notification(*items)
+        evt = models.WebhookEvent(provider="adyen", event_key=key or f"k{id(payload)}", status="pending")
+        evt.raw_json = json.dumps(payload)
+        db.add(evt)
+        db.flush()
+        db.add_all(models.WebhookEventTx(tx_id=t, event_id=evt.id) for t in {i[0] for i in items})
+        db.commit()
+        return evt
+    return store
+
+
+@contextmanager
+def concurrent_write(sql: str, times: int = 1, before: str = "UPDATE transactions"):
+    """Run `sql` on the same connection just before the next `times` statements
+    starting with `before`: another writer that got in between our read and
+    our conditional UPDATE."""
+    left = [times]
+
+    def hook(conn, cursor, statement, parameters, context, executemany):
+        if left[0] and statement.startswith(before):
+            left[0] -= 1
+            cursor.connection.execute(sql)
+
+    event.listen(engine, "before_cursor_execute", hook)
+    try:
+        yield
+    finally:
+        event.remove(engine, "before_cursor_execute", hook)
@@ -0,0 +1,47 @@
+from sqlalchemy import select
+
+from app import models
+from app.db import engine
+from app.services import daily_stats
+
+S = models.MerchantDailyStat
+
+
+def _rollup(db):
+    db.expire_all()
+    return sorted(
+        (r.merchant_id, r.day, r.currency, r.status, r.tx_count, r.amount_cents)
+        for r in db.scalars(select(S)) if r.tx_count or r.amount_cents
+    )
+
+
+def _matches_rebuild(db):
+    kept = _rollup(db)
+    daily_stats.rebuild(engine)
+    return kept == _rollup(db)
+
+
+def test_insert_and_status_change(db, make_tx):
+    tx = make_tx(amount_cents=500)
+    tx.status = "authorised"
+    db.commit()
+    assert _matches_rebuild(db)
+
+
+def test_amount_and_status_change_in_one_flush(db, make_tx):
+    tx = make_tx(amount_cents=500)
+    make_tx(amount_cents=700)
+    tx.status = "authorised"
+    tx.amount_cents = 450
+    db.commit()
+    assert _matches_rebuild(db)
+
+
+def test_amount_or_currency_alone(db, make_tx):
+    tx = make_tx(status="captured", amount_cents=500)
+    tx.amount_cents = 300
+    db.commit()
+    tx.currency = "GBP"
+    db.commit()
+    assert _matches_rebuild(db)
+    assert ("GBP", "captured", 1, 300) in [r[2:] for r in _rollup(db)]
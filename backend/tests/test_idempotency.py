@@ -0,0 +1,73 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.main import app
+from app.services import idempotency
+from app.services.merchant_cache import merchant_cache
+
+URL = "/api/v1/transactions/"
+
+
+@pytest.fixture
+def client():
+    # no `with`: the lifespan would start the webhook workers
+    idempotency.response_cache.clear()
+    merchant_cache.invalidate()
+    return TestClient(app)
+
+
+def _count(db):
+    db.expire_all()
+    return db.query(models.Transaction).count()
+
+
+def test_retry_gets_the_first_response(client, db, merchant):
+    body = {"merchant_id": merchant.id, "amount_cents": 1250, "currency": "EUR"}
+    first = client.post(URL, json=body, headers={"Idempotency-Key": "sale-1"})
+    again = client.post(URL, json=body, headers={"Idempotency-Key": "sale-1"})
+
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers.get(idempotency.REPLAY_HEADER) == "true"
+    assert idempotency.REPLAY_HEADER not in first.headers
+    assert _count(db) == 1
+
+
+def test_replay_from_the_table_after_a_restart(client, db, merchant):
+    body = {"merchant_id": merchant.id, "amount_cents": 1250}
+    first = client.post(URL, json=body, headers={"Idempotency-Key": "sale-2"})
+    idempotency.response_cache.clear()  # another process / a restart
+
+    again = client.post(URL, json=body, headers={"Idempotency-Key": "sale-2"})
+    assert again.json() == first.json()
+    assert again.headers.get(idempotency.REPLAY_HEADER) == "true"
+    assert _count(db) == 1
+
+
+def test_same_key_different_body_is_rejected(client, db, merchant):
+    client.post(URL, json={"merchant_id": merchant.id, "amount_cents": 1250}, headers={"Idempotency-Key": "sale-3"})
+    other = client.post(URL, json={"merchant_id": merchant.id, "amount_cents": 999}, headers={"Idempotency-Key": "sale-3"})
+    assert other.status_code == 422
+    assert _count(db) == 1
+
+
+def test_errors_release_the_key(client, db, merchant):
+    body = {"merchant_id": merchant.id + 1, "amount_cents": 100}
+    assert client.post(URL, json=body, headers={"Idempotency-Key": "sale-4"}).status_code == 404
+
+    # the merchant shows up; the retry runs for real instead of replaying the 404
+    db.add(models.Merchant(id=merchant.id + 1, name="Late Cafe", email="late@example.com"))
+    db.commit()
+    merchant_cache.invalidate()
+    ok = client.post(URL, json=body, headers={"Idempotency-Key": "sale-4"})
+    assert ok.status_code == 200
+    assert idempotency.REPLAY_HEADER not in ok.headers
+    assert _count(db) == 1
+
+
+def test_no_key_no_dedupe(client, db, merchant):
+    body = {"merchant_id": merchant.id, "amount_cents": 1250}
+    client.post(URL, json=body)
+    client.post(URL, json=body)
+    assert _count(db) == 2
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app import models
+from app.db import SessionLocal
+from app.services import payouts
+
+from conftest import concurrent_write
+
+
+def _payouts(db):
+    db.expire_all()
+    return sorted(
+        (p.merchant_id, p.currency, p.amount_cents)
+        for p in db.scalars(select(models.Payout))
+    )
+
+
+def _items(db):
+    return dict(db.execute(select(models.PayoutItem.kind, func.count()).group_by(models.PayoutItem.kind)).all())
+
+
+def test_pays_captured_once(db, merchant, make_tx):
+    make_tx("captured", 1000)
+    make_tx("captured", 250)
+    make_tx("authorised", 9999)
+
+    result = payouts.run(SessionLocal, workers=1)
+    assert (result["payouts"], result["items"], result["paid_cents"]) == (1, 2, 1250)
+    assert _payouts(db) == [(merchant.id, "EUR", 1250)]
+
+    # a re-run has nothing left to pay
+    again = payouts.run(SessionLocal, workers=1)
+    assert (again["payouts"], again["items"]) == (0, 0)
+    assert _payouts(db) == [(merchant.id, "EUR", 1250)]
+
+
+def test_refund_after_payout_is_clawed_back(db, merchant, make_tx):
+    paid = make_tx("captured", 1000)
+    payouts.run(SessionLocal, workers=1)
+
+    paid.status = "refunded"
+    make_tx("captured", 3000)
+    db.commit()
+    payouts.run(SessionLocal, workers=1)
+
+    assert _payouts(db) == [(merchant.id, "EUR", 1000), (merchant.id, "EUR", 2000)]
+    assert _items(db) == {"capture": 2, "refund": 1}
+
+
+def test_refunds_outweighing_captures_carry_over(db, merchant, make_tx):
+    paid = make_tx("captured", 1000)
+    payouts.run(SessionLocal, workers=1)
+    paid.status = "refunded"
+    db.commit()
+    make_tx("captured", 400)
+
+    result = payouts.run(SessionLocal, workers=1)
+    assert (result["payouts"], result["carried_over"], result["items"]) == (0, 1, 2)
+    carried = db.scalars(select(models.Payout).where(models.Payout.status == "carried")).one()
+    assert carried.amount_cents == -600
+
+    # the carried lines aren't picked up again
+    again = payouts.run(SessionLocal, workers=1)
+    assert (again["payouts"], again["carried_over"], again["items"]) == (0, 0, 0)
+
+    make_tx("captured", 800)
+    result = payouts.run(SessionLocal, workers=1)
+    assert (result["payouts"], result["paid_cents"]) == (1, 200)
+    assert _payouts(db) == [(merchant.id, "EUR", -600), (merchant.id, "EUR", 200), (merchant.id, "EUR", 1000)]
+    db.refresh(carried)
+    newest = db.scalars(select(models.Payout).order_by(models.Payout.id.desc())).first()
+    assert carried.carried_into == newest.id
+
+
+def test_until_applies_to_refunds(db, merchant, make_tx):
+    cutoff = datetime.now(timezone.utc) + timedelta(minutes=1)
+    paid = make_tx("captured", 1000)
+    payouts.run(SessionLocal, workers=1)
+    paid.status = "refunded"
+    db.add(models.Refund(tx_id=paid.id, amount_cents=1000, currency="EUR", status="refunded",
+                         created_at=cutoff + timedelta(hours=1)))
+    make_tx("captured", 300)
+    db.commit()
+
+    result = payouts.run(SessionLocal, workers=1, until=cutoff)
+    assert (result["payouts"], result["paid_cents"], result["carried_over"]) == (1, 300, 0)
+    assert _items(db) == {"capture": 2}
+    assert payouts.run(SessionLocal, workers=1)["carried_over"] == 1
+
+
+def test_refunded_before_payout_never_shows_up(db, merchant, make_tx):
+    make_tx("refunded", 1000)
+    result = payouts.run(SessionLocal, workers=1)
+    assert (result["payouts"], result["carried_over"]) == (0, 0)
+
+
+def test_dry_run_writes_nothing(db, merchant, make_tx):
+    make_tx("captured", 1000)
+    result = payouts.run(SessionLocal, workers=1, dry_run=True)
+    assert result["paid_cents"] == 1000
+    assert _payouts(db) == []
+    assert _items(db) == {}
+
+
+def test_payout_matches_its_items_when_transactions_change_mid_run(db, make_tx):
+    a = models.Merchant(name="A", email="a@example.com")
+    b = models.Merchant(name="B", email="b@example.com")
+    db.add_all([a, b])
+    db.commit()
+    only_a = make_tx("captured", 1000, merchant_id=a.id)
+    make_tx("captured", 1000, merchant_id=b.id)
+    late_b = make_tx("authorised", 1000, merchant_id=b.id)
+
+    # between the totals query and the item insert: a's capture gets a refund
+    # request, b gets another capture
+    refund_a = f"UPDATE transactions SET status = 'refund_requested' WHERE id = {only_a.id}"
+    capture_b = f"UPDATE transactions SET status = 'captured' WHERE id = {late_b.id}"
+    with concurrent_write(refund_a, before="INSERT INTO payout_items"), \
+            concurrent_write(capture_b, before="INSERT INTO payout_items"):
+        payouts.run(SessionLocal, workers=1)
+
+    # a's payout lost its only item and is gone; b's is the sum of what it linked
+    db.expire_all()
+    assert _payouts(db) == [(b.id, "EUR", 2000)]
+    for p in db.scalars(select(models.Payout)):
+        linked = db.scalar(select(func.sum(models.PayoutItem.amount_cents)).where(models.PayoutItem.payout_id == p.id))
+        assert linked == p.amount_cents
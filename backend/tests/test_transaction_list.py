@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_pages_are_plain_lists_with_a_cursor_header(make_tx):
+    ids = [make_tx().id for _ in range(5)]
+    client = TestClient(app)
+
+    first = client.get("/api/v1/transactions/", params={"limit": 3})
+    assert first.status_code == 200
+    assert [t["id"] for t in first.json()] == ids[::-1][:3]
+    cursor = first.headers["X-Next-Cursor"]
+
+    last = client.get("/api/v1/transactions/", params={"limit": 3, "cursor": cursor})
+    assert [t["id"] for t in last.json()] == ids[::-1][3:]
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_bad_cursor(make_tx):
+    assert TestClient(app).get("/api/v1/transactions/", params={"cursor": "nope"}).status_code == 400
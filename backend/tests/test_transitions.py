@@ -0,0 +1,93 @@
+import pytest
+
+from app import models
+from app.services import transitions
+
+from conftest import concurrent_write
+
+PAIRS = [(current, target) for target in transitions.ALLOWED_FROM for current in transitions.STATUSES]
+
+
+def test_table_spot_checks():
+    assert transitions.allowed("created", "authorised")
+    assert transitions.allowed("authorised", "captured")
+    assert transitions.allowed("captured", "refunded")
+    assert transitions.allowed(None, "authorised")  # NULL status counts as created
+    # a refunded payment never goes back, a capture happens once
+    assert not transitions.allowed("refunded", "authorised")
+    assert not transitions.allowed("refunded", "captured")
+    assert not transitions.allowed("captured", "captured")
+    assert not transitions.allowed("created", "captured")
+    assert not transitions.allowed("failed", "authorised")
+
+
+def test_reachable():
+    assert transitions.reachable("created", "captured")      # after an AUTHORISATION
+    assert transitions.reachable("captured", "failed")       # via refund_requested
+    assert not transitions.reachable("refunded", "authorised")
+    assert not transitions.reachable("captured", "captured")
+    assert not transitions.reachable("failed", "refunded")
+
+
+@pytest.mark.parametrize("current,target", PAIRS)
+def test_transition_follows_allowed_from(db, make_tx, current, target):
+    tx = make_tx(current)
+    outcome = transitions.transition(db, tx.id, target)
+    db.commit()
+    db.refresh(tx)
+
+    if current == target:
+        assert outcome.reason == "unchanged"
+    elif current in transitions.ALLOWED_FROM[target]:
+        assert outcome == transitions.Outcome(True, "applied", target, 1)
+        assert (tx.status, tx.version) == (target, 1)
+        return
+    else:
+        assert outcome.reason == "not_allowed"
+    assert not outcome.applied
+    assert (tx.status, tx.version) == (current, 0)
+
+
+def test_transition_not_found(db):
+    assert transitions.transition(db, 12345, "authorised").reason == "not_found"
+
+
+def test_unknown_target_and_columns_rejected(db, make_tx):
+    tx = make_tx()
+    with pytest.raises(ValueError):
+        transitions.transition(db, tx.id, "paid")
+    with pytest.raises(ValueError):
+        transitions.transition(db, tx.id, "authorised", merchant_id=2)
+
+
+def test_expected_version_mismatch_is_a_conflict(db, make_tx):
+    tx = make_tx("authorised")
+    outcome = transitions.transition(db, tx.id, "captured", expected_version=3)
+    assert outcome == transitions.Outcome(False, "conflict", "authorised", 0)
+
+
+def test_lost_race_is_retried_on_the_new_row(db, make_tx):
+    tx = make_tx("authorised")
+    # someone else bumps the row between our read and our UPDATE
+    with concurrent_write(f"UPDATE transactions SET psp_reference = 'OTHER', version = version + 1 WHERE id = {tx.id}"):
+        outcome = transitions.transition(db, tx.id, "captured")
+    db.commit()
+    db.refresh(tx)
+    assert outcome == transitions.Outcome(True, "applied", "captured", 2)
+    assert (tx.status, tx.psp_reference, tx.version) == ("captured", "OTHER", 2)
+
+
+def test_lost_race_to_a_move_that_forbids_ours(db, make_tx):
+    tx = make_tx("authorised")
+    with concurrent_write(f"UPDATE transactions SET status = 'refunded', version = version + 1 WHERE id = {tx.id}"):
+        outcome = transitions.transition(db, tx.id, "captured")
+    assert outcome == transitions.Outcome(False, "not_allowed", "refunded", 1)
+
+
+def test_gives_up_after_retries(db, make_tx):
+    tx = make_tx("authorised")
+    bump = f"UPDATE transactions SET version = version + 1 WHERE id = {tx.id}"
+    with concurrent_write(bump, times=transitions.RETRIES + 1):
+        outcome = transitions.transition(db, tx.id, "captured")
+    assert outcome.reason == "conflict"
+    assert db.get(models.Transaction, tx.id).status == "authorised"
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.services import transitions
+from app.services.webhook_processing import NotYet, apply_notification, fold, parse_items
+
+from conftest import concurrent_write, notification
+
+
+def _status(db, tx):
+    db.expire_all()
+    return db.get(models.Transaction, tx.id).status
+
+
+def test_items_apply_in_order_within_a_notification(db, make_tx):
+    tx = make_tx()
+    handled, skipped = apply_notification(db, notification((tx.id, "AUTHORISATION"), (tx.id, "CAPTURE")))
+    db.commit()
+    assert (handled, skipped) == (2, [])
+    assert _status(db, tx) == "captured"
+
+
+def test_fold_reports_refused_items():
+    states = {
+        1: SimpleNamespace(status="refunded"),
+        2: SimpleNamespace(status="captured"),
+        3: SimpleNamespace(status="created"),
+    }
+    parsed = parse_items(notification((1, "AUTHORISATION"), (2, "CAPTURE"), (3, "CAPTURE")))
+    handled, skipped = fold(states, {}, parsed)
+    assert not handled
+    assert [(s[0][0], s[1], s[2]) for s in skipped] == [
+        (1, "refunded", "not_allowed"),
+        (2, "captured", "unchanged"),
+        (3, "created", "early"),
+    ]
+
+
+def test_not_allowed_items_are_skipped_and_returned(db, make_tx):
+    refunded, other = make_tx("refunded"), make_tx()
+    handled, skipped = apply_notification(db, notification((refunded.id, "AUTHORISATION"), (other.id, "AUTHORISATION")))
+    db.commit()
+    assert handled == 1
+    assert [(s[0][0], s[2]) for s in skipped] == [(refunded.id, "not_allowed")]
+    assert (_status(db, refunded), _status(db, other)) == ("refunded", "authorised")
+
+
+def test_capture_before_authorisation_is_not_yet(db, make_tx):
+    tx, other = make_tx(), make_tx()
+    with pytest.raises(NotYet):
+        apply_notification(db, notification((other.id, "AUTHORISATION"), (tx.id, "CAPTURE")))
+    db.rollback()
+    # nothing written, not even the item that could apply
+    assert (_status(db, tx), _status(db, other)) == ("created", "created")
+
+
+def test_early_item_skipped_on_last_attempt(db, make_tx):
+    tx, other = make_tx(), make_tx()
+    handled, skipped = apply_notification(
+        db, notification((other.id, "AUTHORISATION"), (tx.id, "CAPTURE")), retry_early=False,
+    )
+    db.commit()
+    assert handled == 1
+    assert [(s[0][0], s[2]) for s in skipped] == [(tx.id, "early")]
+    assert (_status(db, tx), _status(db, other)) == ("created", "authorised")
+
+
+def test_lost_race_is_refolded(db, make_tx):
+    tx = make_tx()
+    with concurrent_write(f"UPDATE transactions SET psp_reference = 'OTHER', version = version + 1 WHERE id = {tx.id}"):
+        handled, skipped = apply_notification(db, notification((tx.id, "AUTHORISATION")))
+    db.commit()
+    db.refresh(tx)
+    assert (handled, skipped) == (1, [])
+    assert (tx.status, tx.version) == ("authorised", 2)
+
+
+def test_lost_race_to_a_forbidding_move(db, make_tx):
+    tx = make_tx()
+    with concurrent_write(f"UPDATE transactions SET status = 'failed', version = version + 1 WHERE id = {tx.id}"):
+        handled, skipped = apply_notification(db, notification((tx.id, "AUTHORISATION")))
+    db.commit()
+    assert handled == 0
+    assert [(s[1], s[2]) for s in skipped] == [("failed", "not_allowed")]
+    assert _status(db, tx) == "failed"
+
+
+def test_keeps_losing_raises_conflict(db, make_tx):
+    tx = make_tx()
+    bump = f"UPDATE transactions SET version = version + 1 WHERE id = {tx.id}"
+    with concurrent_write(bump, times=transitions.RETRIES + 1):
+        with pytest.raises(transitions.Conflict):
+            apply_notification(db, notification((tx.id, "AUTHORISATION")))
+    db.rollback()
+    assert _status(db, tx) == "created"
+
+
+def test_refund_marks_newest_refund(db, make_tx):
+    tx = make_tx("captured")
+    db.add_all([
+        models.Refund(tx_id=tx.id, amount_cents=100, currency="EUR", status="failed"),
+        models.Refund(tx_id=tx.id, amount_cents=1000, currency="EUR", status="requested"),
+    ])
+    db.commit()
+    handled, _ = apply_notification(db, notification((tx.id, "REFUND")))
+    db.commit()
+    assert handled == 1
+    assert _status(db, tx) == "refunded"
+    refunds = db.query(models.Refund).filter_by(tx_id=tx.id).order_by(models.Refund.id).all()
+    assert [r.status for r in refunds] == ["failed", "refunded"]
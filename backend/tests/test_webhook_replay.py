@@ -0,0 +1,69 @@
+from app import models
+from app.db import SessionLocal
+from app.services import webhook_replay
+
+
+def _statuses(db, txs):
+    db.expire_all()
+    return [db.get(models.Transaction, t.id).status for t in txs]
+
+
+def _processed(store_event, *items, **kw):
+    evt = store_event(*items, **kw)
+    evt.status = "processed"
+    return evt
+
+
+def test_replays_each_transaction_in_order(db, make_tx, store_event):
+    txs = [make_tx() for _ in range(3)]
+    for tx in txs:
+        _processed(store_event, (tx.id, "AUTHORISATION"))
+        _processed(store_event, (tx.id, "CAPTURE"))
+    db.commit()
+
+    result = webhook_replay.replay(SessionLocal, workers=2, batch_size=1)
+    assert (result["events"], result["applied"]) == (6, 6)
+    assert _statuses(db, txs) == ["captured"] * 3
+
+    # again: the CAPTUREs are already there, the AUTHORISATIONs can't go back
+    result = webhook_replay.replay(SessionLocal, workers=2, batch_size=1)
+    assert (result["applied"], result["skipped"]) == (0, {"not_allowed": 3, "unchanged": 3})
+
+
+def test_dry_run_builds_on_earlier_batches(db, make_tx, store_event):
+    txs = [make_tx() for _ in range(3)]
+    for tx in txs:
+        _processed(store_event, (tx.id, "AUTHORISATION"))
+        _processed(store_event, (tx.id, "CAPTURE"))
+    db.commit()
+
+    # one item per batch: every CAPTURE is folded onto an AUTHORISATION that was never written
+    dry = webhook_replay.replay(SessionLocal, workers=1, batch_size=1, dry_run=True)
+    assert dry["applied"] == 6
+    assert _statuses(db, txs) == ["created"] * 3
+
+    real = webhook_replay.replay(SessionLocal, workers=1, batch_size=1)
+    assert real["applied"] == dry["applied"]
+
+
+def test_rebuild_undoes_a_wrong_status(db, make_tx, store_event):
+    right, wrong = make_tx(), make_tx()
+    for tx in (right, wrong):
+        _processed(store_event, (tx.id, "AUTHORISATION"), key=f"auth-{tx.id}")
+        _processed(store_event, (tx.id, "CAPTURE"), key=f"capture-{tx.id}")
+    db.commit()
+    webhook_replay.replay(SessionLocal, workers=1)
+
+    # a bug marked one of them refunded: a plain replay can't move it back
+    db.get(models.Transaction, wrong.id).status = "refunded"
+    db.commit()
+    assert webhook_replay.replay(SessionLocal, workers=1)["applied"] == 0
+
+    dry = webhook_replay.replay(SessionLocal, workers=1, rebuild=True, key_pattern=f"capture-{wrong.id}", dry_run=True)
+    assert _statuses(db, [right, wrong]) == ["captured", "refunded"]
+
+    # the key picks the transaction; all of its events are replayed from "created"
+    result = webhook_replay.replay(SessionLocal, workers=1, rebuild=True, key_pattern=f"capture-{wrong.id}")
+    assert (result["transactions"], result["applied"]) == (1, 2) == (dry["transactions"], dry["applied"])
+    assert _statuses(db, [right, wrong]) == ["captured", "captured"]
+    assert db.get(models.Transaction, wrong.id).version == 2
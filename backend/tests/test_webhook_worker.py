@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app import metrics, models
+from app.config import settings
+from app.db import SessionLocal
+from app.services import webhook_worker
+from app.services.webhook_worker import WebhookWorkerPool, claim_batch, process_event
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_RETRY_BASE_SECONDS", 0.0)
+
+
+def _drain(max_rounds=10):
+    pool = WebhookWorkerPool(SessionLocal, workers=1, batch_size=10)
+    for _ in range(max_rounds):
+        if not pool.run_once():
+            return
+
+
+def _event(db, evt):
+    db.expire_all()
+    return db.get(models.WebhookEvent, evt.id)
+
+
+def test_claims_one_event_per_transaction_in_arrival_order(db, make_tx, store_event):
+    a, b = make_tx(), make_tx()
+    auth_a = store_event((a.id, "AUTHORISATION"))
+    capture_a = store_event((a.id, "CAPTURE"))
+    auth_b = store_event((b.id, "AUTHORISATION"))
+
+    with SessionLocal() as s1, SessionLocal() as s2:
+        assert [e.id for e in claim_batch(s1, 10)] == [auth_a.id, auth_b.id]
+        # a second worker mustn't take the CAPTURE while its AUTHORISATION is in flight
+        assert claim_batch(s2, 10) == []
+        evt = s1.get(models.WebhookEvent, auth_a.id)
+        assert process_event(s1, evt)
+        assert [e.id for e in claim_batch(s2, 10)] == [capture_a.id]
+
+
+def test_events_naming_several_transactions_keep_each_ones_order(db, make_tx, store_event):
+    a, b = make_tx(), make_tx()
+    auth_b = store_event((b.id, "AUTHORISATION"))
+    both = store_event((a.id, "AUTHORISATION"), (b.id, "CAPTURE"))
+    capture_a = store_event((a.id, "CAPTURE"))
+
+    with SessionLocal() as s1, SessionLocal() as s2:
+        # b's AUTHORISATION holds back the event that also captures b, and that one a's CAPTURE
+        assert [e.id for e in claim_batch(s1, 10)] == [auth_b.id]
+        assert claim_batch(s2, 10) == []
+        assert process_event(s1, s1.get(models.WebhookEvent, auth_b.id))
+        assert [e.id for e in claim_batch(s2, 10)] == [both.id]
+        assert process_event(s2, s2.get(models.WebhookEvent, both.id))
+        assert [e.id for e in claim_batch(s1, 10)] == [capture_a.id]
+
+
+def test_capture_arriving_before_authorisation(db, make_tx, store_event, no_backoff):
+    tx = make_tx()
+    capture = store_event((tx.id, "CAPTURE"))
+    auth = store_event((tx.id, "AUTHORISATION"))
+
+    _drain()
+
+    db.expire_all()
+    assert db.get(models.Transaction, tx.id).status == "captured"
+    capture, auth = _event(db, capture), _event(db, auth)
+    assert (auth.status, auth.attempts) == ("processed", 0)
+    assert capture.status == "processed" and capture.attempts >= 1
+    assert capture.last_error is None
+
+
+def test_early_event_gives_up_waiting_on_last_attempt(db, make_tx, store_event, no_backoff, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_ATTEMPTS", 2)
+    tx = make_tx()
+    capture = store_event((tx.id, "CAPTURE"))
+
+    _drain()
+
+    capture = _event(db, capture)
+    assert (capture.status, capture.attempts) == ("processed", 1)
+    assert capture.last_error == f"CAPTURE tx_{tx.id} (created): early"
+    assert db.get(models.Transaction, tx.id).status == "created"
+
+
+def test_not_allowed_items_are_recorded(db, make_tx, store_event):
+    tx = make_tx("refunded")
+    before = metrics.webhook_items_skipped._values.get(("not_allowed",), 0)
+    evt = store_event((tx.id, "AUTHORISATION"))
+
+    _drain()
+
+    evt = _event(db, evt)
+    assert evt.status == "processed"
+    assert evt.last_error == f"AUTHORISATION tx_{tx.id} (refunded): not_allowed"
+    assert metrics.webhook_items_skipped._values[("not_allowed",)] == before + 1
+
+
+def test_failure_backs_off(db, make_tx, store_event, monkeypatch):
+    def boom(db, payload, retry_early=True):
+        raise RuntimeError("psp down")
+
+    monkeypatch.setattr(webhook_worker, "apply_notification", boom)
+    monkeypatch.setattr(settings, "WEBHOOK_RETRY_BASE_SECONDS", 60.0)
+    tx = make_tx()
+    evt = store_event((tx.id, "AUTHORISATION"))
+
+    with SessionLocal() as s:
+        [claimed] = claim_batch(s, 10)
+        assert not process_event(s, claimed)
+        # not claimable again until next_attempt_at
+        assert claim_batch(s, 10) == []
+
+    evt = _event(db, evt)
+    assert (evt.status, evt.attempts, evt.last_error) == ("pending", 1, "RuntimeError: psp down")
+    wait = evt.next_attempt_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)
+    assert 50 < wait.total_seconds() <= 60
+
+
+def test_failed_after_max_attempts(db, make_tx, store_event, monkeypatch, no_backoff):
+    monkeypatch.setattr(webhook_worker, "apply_notification", lambda *a, **kw: 1 / 0)
+    evt = store_event((make_tx().id, "AUTHORISATION"))
+
+    _drain()
+
+    evt = _event(db, evt)
+    assert (evt.status, evt.attempts, evt.next_attempt_at) == ("failed", settings.WEBHOOK_MAX_ATTEMPTS, None)
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    base, cap = settings.WEBHOOK_RETRY_BASE_SECONDS, settings.WEBHOOK_RETRY_MAX_SECONDS
+    assert [webhook_worker.retry_delay(n) for n in (1, 2, 3)] == [base, base * 2, base * 4]
+    assert webhook_worker.retry_delay(50) == cap
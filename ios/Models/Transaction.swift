@@ -15,3 +15,20 @@ struct NewTransactionRequest: Codable {
     let amount_cents: Int
     let currency: String
 }
+
+struct BatchTransactionRequest: Codable {
+    let items: [NewTransactionRequest]
+}
+
+struct BatchTransactionResult: Codable {
+    let index: Int
+    let ok: Bool
+    let transaction: Transaction?
+    let error: String?
+}
+
+struct BatchTransactionResponse: Codable {
+    let created: Int
+    let failed: Int
+    let results: [BatchTransactionResult]
+}
@@ -21,6 +21,20 @@ final class APIClient {
         return try decoder.decode(Transaction.self, from: data)
     }
 
+    // Upload offline-queued sales in one request; results come back per item, in order
+    func createTransactions(_ items: [NewTransactionRequest]) async throws -> BatchTransactionResponse {
+        let url = baseURL.appendingPathComponent("/api/v1/transactions/batch")
+        var req = URLRequest(url: url)
+        req.httpMethod = "POST"
+        req.addValue("application/json", forHTTPHeaderField: "Content-Type")
+        req.httpBody = try JSONEncoder().encode(BatchTransactionRequest(items: items))
+
+        let (data, _) = try await URLSession.shared.data(for: req)
+        let decoder = JSONDecoder()
+        decoder.dateDecodingStrategy = .iso8601
+        return try decoder.decode(BatchTransactionResponse.self, from: data)
+    }
+
     func confirmTransaction(id: Int, pspReference: String) async throws -> Transaction {
         let url = baseURL.appendingPathComponent("/api/v1/transactions/\(id)/confirm?psp_reference=\(pspReference)&status=authorised")
         var req = URLRequest(url: url)